@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# bench_engines.py - Czas startu zadania i przepustowość: wbudowany klient HTTP vs curl
+#
+# Użycie: python benchmarks/bench_engines.py [--jobs 30] [--size 8M] [--connect-delay 0.05]
+#
+# connect-delay symuluje koszt nawiązania połączenia (TCP + TLS do dostawcy);
+# silnik http płaci go raz na host, curl przy każdym zadaniu.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from download_bandwidth import parse_rate  # noqa: E402
+from download_engines import CurlEngine, HttpEngine, timed_fetch  # noqa: E402
+from standin_server import StandInServer  # noqa: E402
+
+
+def run_engine(engine, url, jobs):
+    startups = []
+    total_bytes = 0
+    total_time = 0.0
+    for _ in range(jobs):
+        stats = timed_fetch(engine, url, lambda chunk: None)
+        startups.append(stats["first_byte"])
+        total_bytes += stats["bytes"]
+        total_time += stats["elapsed"]
+    startups.sort()
+    return {
+        "startup_p50_ms": startups[len(startups) // 2] * 1000,
+        "startup_max_ms": startups[-1] * 1000,
+        "throughput_mb_s": total_bytes / total_time / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark silników pobierania")
+    parser.add_argument("--jobs", type=int, default=30)
+    parser.add_argument("--size", default="8M")
+    parser.add_argument("--connect-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = StandInServer(connect_delay=args.connect_delay).start()
+    url = f"{server.base_url}/file/{parse_rate(args.size)}.mkv"
+    try:
+        for engine in (HttpEngine(), CurlEngine()):
+            before = server.stats["connections"]
+            result = run_engine(engine, url, args.jobs)
+            engine.close()
+            print(f"{engine.name:<5} start p50 {result['startup_p50_ms']:7.1f} ms   "
+                  f"max {result['startup_max_ms']:7.1f} ms   "
+                  f"{result['throughput_mb_s']:8.1f} MB/s   "
+                  f"połączeń: {server.stats['connections'] - before}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
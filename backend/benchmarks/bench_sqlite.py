@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# bench_sqlite.py - Aktualizacje statusu na sekundę: połączenie na zapytanie vs stałe połączenie WAL
+#
+# Użycie: python benchmarks/bench_sqlite.py [--updates 2000] [--rows 20000]
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_sqlite_")
+os.environ.setdefault("DOWNLOAD_DB_PATH", os.path.join(BENCH_DIR, "database.sqlite"))
+os.environ.setdefault("DOWNLOAD_LOG_FILE", os.path.join(BENCH_DIR, "downloads.log"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import download_manager  # noqa: E402
+
+UPDATE_SQL = "UPDATE downloads SET worker_status = ?, progress = ? WHERE id = ?"
+STATUS_SQL = '''
+    SELECT COUNT(*) as total,
+           SUM(CASE WHEN worker_status = 'queued' THEN 1 ELSE 0 END) as queued
+    FROM downloads
+'''
+
+
+def create_database(path, rows):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute('''
+        CREATE TABLE downloads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            worker_status TEXT DEFAULT 'queued',
+            progress INTEGER DEFAULT 0,
+            added_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany("INSERT INTO downloads (filename) VALUES (?)",
+                     ((f"plik_{i}.mkv",) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def status_poller(path, stop, open_conn):
+    """Symulacja odpytywania statusu przez backend Node"""
+    conn = open_conn(path)
+    while not stop.is_set():
+        try:
+            conn.execute(STATUS_SQL).fetchone()
+        except sqlite3.OperationalError:
+            pass
+        time.sleep(0.01)
+    conn.close()
+
+
+def run(label, path, updates, rows, update_once, open_poller_conn):
+    stop = threading.Event()
+    poller = threading.Thread(target=status_poller, args=(path, stop, open_poller_conn))
+    poller.start()
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(updates):
+        t0 = time.perf_counter()
+        update_once(('downloading', i % 100, (i % rows) + 1))
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    poller.join()
+    latencies.sort()
+    print(f"{label:<28} {updates / elapsed:>10.0f} upd/s   "
+          f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms   "
+          f"max {latencies[-1] * 1000:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aktualizacji statusu w SQLite")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    path = download_manager.DATABASE_PATH
+
+    # Przed: nowe połączenie na każdą aktualizację, domyślny dziennik rollback
+    create_database(path, args.rows)
+
+    def update_per_connection(params):
+        conn = sqlite3.connect(path, timeout=30.0)
+        conn.execute(UPDATE_SQL, params)
+        conn.commit()
+        conn.close()
+
+    run("przed (connect/zapytanie)", path, args.updates, args.rows, update_per_connection,
+        lambda p: sqlite3.connect(p, timeout=30.0))
+
+    # Po: jedno połączenie na wątek, WAL, synchronous=NORMAL, cache zapytań
+    create_database(path, args.rows)
+    conn = download_manager.open_db_connection(path)
+
+    def update_persistent(params):
+        conn.execute(UPDATE_SQL, params)
+        conn.commit()
+
+    run("po (stałe połączenie WAL)", path, args.updates, args.rows, update_persistent,
+        download_manager.open_db_connection)
+    conn.close()
+    shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# bench_startup.py - Start daemona przy dużej kolejce (np. po imporcie całych seriali):
+# dawne przywracanie (fetchall + UPDATE na wiersz + słownik zadania w pamięci)
+# vs obecne (jedno UPDATE, zadania czytane z bazy stronami przez claim_jobs)
+#
+# Użycie: python benchmarks/bench_startup.py [--rows 100000] [--downloading 3]
+#                                            [--completed 20000] [--retrying 1000] [--runs 3]
+#
+# Mierzone: czas startu (init_database + przywrócenie kolejki), czas do przekazania
+# pierwszych zadań workerom, czas jednego przejścia claim_jobs w trakcie pracy
+# oraz szczyt pamięci Pythona (tracemalloc) w czasie startu.
+
+import argparse
+import os
+import queue
+import shutil
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_suite import BENCH_DIR, DOWNLOADS_SCHEMA, download_manager  # noqa: E402
+
+
+class StartupProbe(download_manager.DownloadManager):
+    """Manager bez wątków - mierzymy sam start i przyjmowanie zadań"""
+
+    def start_worker(self):
+        pass
+
+    def start_intake(self):
+        pass
+
+    def start_maintenance(self):
+        pass
+
+
+def build_database(path, args):
+    """Baza jak po imporcie: dużo oczekujących zadań, kilka przerwanych, trochę historii"""
+    conn = sqlite3.connect(path)
+    conn.executescript(DOWNLOADS_SCHEMA)
+    statuses = (['downloading'] * args.downloading + ['completed'] * args.completed)
+    rows = (("series", f"ep{index}", f"ep{index}.mkv", f"/downloads/series/ep{index}.mkv",
+             f"http://provider{index % 4}.example/series/{index}.mkv",
+             statuses[index] if index < len(statuses) else 'queued')
+            for index in range(args.rows))
+    conn.executemany('''
+        INSERT INTO downloads (stream_type, episode_id, filename, filepath, download_url, worker_status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+    # Kolumny daemona (retry_at itd.) - jednorazowo, żeby kolejne pomiary ich nie doliczały
+    shutil.copy(path, download_manager.DATABASE_PATH)
+    manager = StartupProbe()
+    manager.log_writer.close()
+    manager.close_db_connections()
+    conn = sqlite3.connect(download_manager.DATABASE_PATH)
+    conn.execute('''
+        UPDATE downloads SET retry_at = datetime('now', '+1 hour')
+        WHERE id IN (SELECT id FROM downloads WHERE worker_status = 'queued' ORDER BY id DESC LIMIT ?)
+    ''', (args.retrying,))
+    conn.commit()
+    conn.close()
+    shutil.copy(download_manager.DATABASE_PATH, path)
+
+
+def legacy_restore(download_queue):
+    """Przywracanie kolejki sprzed zmian: wszystkie wiersze do pamięci, UPDATE na każdy"""
+    conn = sqlite3.connect(download_manager.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM downloads
+        WHERE worker_status IN ('queued', 'downloading')
+        ORDER BY added_at ASC
+    ''')
+    for download in cursor.fetchall():
+        cursor.execute("UPDATE downloads SET worker_status = 'queued' WHERE id = ?", (download['id'],))
+        if download['download_url'] and download['filepath']:
+            download_queue.put({
+                'db_id': download['id'],
+                'item_id': download['episode_id'],
+                'url': download['download_url'],
+                'output_path': download['filepath'],
+                'title': download['filename'] or 'Unknown',
+                'item_type': download['stream_type']
+            })
+    conn.commit()
+    conn.close()
+
+
+def measure_legacy(base_path):
+    shutil.copy(base_path, download_manager.DATABASE_PATH)
+    download_queue = queue.Queue()
+    tracemalloc.start()
+    started = time.perf_counter()
+    legacy_restore(download_queue)
+    startup = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Pierwsze zadanie jest gotowe dopiero po wczytaniu całej kolejki
+    return {"startup": startup, "first_jobs": startup, "claim_pass": None, "peak": peak,
+            "in_memory": download_queue.qsize()}
+
+
+def measure_current(base_path):
+    shutil.copy(base_path, download_manager.DATABASE_PATH)
+    tracemalloc.start()
+    started = time.perf_counter()
+    manager = StartupProbe()
+    startup = time.perf_counter() - started
+    jobs = manager.claim_jobs(manager.worker_count)
+    first_jobs = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Kolejne przejście intake (pierwsze zadania w toku, slot hosta zajęty)
+    for job in jobs:
+        manager.host_slots.acquire_or_defer(download_manager.get_host(job['url']), job)
+    claim_started = time.perf_counter()
+    manager.claim_jobs(manager.worker_count)
+    claim_pass = time.perf_counter() - claim_started
+    manager.log_writer.close()
+    manager.close_db_connections()
+    return {"startup": startup, "first_jobs": first_jobs, "claim_pass": claim_pass, "peak": peak,
+            "in_memory": len(jobs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startu daemona przy dużej kolejce")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--downloading", type=int, default=3, help="zadania przerwane w trakcie pobierania")
+    parser.add_argument("--completed", type=int, default=20000, help="ukończone zadania (historia)")
+    parser.add_argument("--retrying", type=int, default=1000, help="zadania z odłożonym ponowieniem")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    base_path = os.path.join(BENCH_DIR, "base.sqlite")
+    try:
+        build_database(base_path, args)
+        print(f"{args.rows} zadań ({args.rows - args.downloading - args.completed} oczekujących, "
+              f"{args.downloading} przerwanych, {args.completed} ukończonych, {args.retrying} odłożonych)")
+        for name, measure in (("dawny start", measure_legacy), ("obecny start", measure_current)):
+            results = [measure(base_path) for _ in range(args.runs)]
+            best = {key: min(r[key] for r in results) if results[0][key] is not None else None
+                    for key in results[0]}
+            claim = f"{best['claim_pass'] * 1000:7.1f} ms" if best['claim_pass'] is not None else "      -   "
+            print(f"{name:<13} start {best['startup'] * 1000:8.1f} ms   "
+                  f"pierwsze zadania po {best['first_jobs'] * 1000:8.1f} ms   "
+                  f"przejście claim {claim}   "
+                  f"pamięć {best['peak'] / 1024 / 1024:6.1f} MB   "
+                  f"zadań w pamięci: {best['in_memory']}")
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# bench_write.py - Ścieżka zapisu download.py: dawna pętla (iter_content 8 KB + f.write)
+# vs duże porcje do wspólnego bufora (readinto) z prealokacją i opcjonalnym fsync
+#
+# Użycie: python benchmarks/bench_write.py [--size 512M] [--runs 3] [--dir /downloads/movies]
+#                                          [--chunk 1M] [--fsync 0]
+#
+# CPU liczony tylko dla wątku pobierającego (serwer działa w tym samym procesie).
+# Liczba fragmentów pliku z filefrag (jeśli jest w systemie) - ma sens na docelowym dysku.
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests  # noqa: E402
+
+from download import iter_response_chunks  # noqa: E402
+from download_bandwidth import parse_rate  # noqa: E402
+from download_writer import FileWriter  # noqa: E402
+from standin_server import StandInServer, content_sha256  # noqa: E402
+
+
+def legacy_loop(response, path, args):
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+
+
+def tuned_loop(response, path, args):
+    total_size = int(response.headers.get('content-length', 0))
+    with FileWriter(path, expected_size=total_size, fsync_bytes=args.fsync_bytes) as f:
+        for chunk in iter_response_chunks(response, args.chunk_bytes):
+            f.write(chunk)
+
+
+def file_extents(path):
+    if not shutil.which('filefrag'):
+        return None
+    result = subprocess.run(['filefrag', path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    match = re.search(r'(\d+) extents? found', result.stdout)
+    return int(match.group(1)) if match else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run(session, url, path, loop, args):
+    wall_started = time.perf_counter()
+    cpu_started = time.thread_time()
+    with session.get(url, stream=True, timeout=(30, 300)) as r:
+        r.raise_for_status()
+        loop(r, path, args)
+    return time.perf_counter() - wall_started, time.thread_time() - cpu_started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ścieżki zapisu download.py")
+    parser.add_argument("--size", default="512M")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--dir", help="katalog na pliki testowe (domyślnie tymczasowy)")
+    parser.add_argument("--chunk", default="1M", help="rozmiar porcji w nowej ścieżce")
+    parser.add_argument("--fsync", default="0", help="fdatasync co tyle bajtów w nowej ścieżce (0 = wyłączone)")
+    args = parser.parse_args()
+    args.chunk_bytes = parse_rate(args.chunk)
+    args.fsync_bytes = parse_rate(args.fsync)
+    size = parse_rate(args.size)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_write_", dir=args.dir)
+    server = StandInServer().start()
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'identity'
+    url = server.file_url(size)
+    expected = content_sha256(size)
+    try:
+        for name, loop in (("dawna (8 KB)", legacy_loop), (f"nowa ({args.chunk})", tuned_loop)):
+            walls, cpus = [], []
+            path = os.path.join(work_dir, "bench.mkv")
+            for _ in range(args.runs):
+                if os.path.exists(path):
+                    os.remove(path)
+                wall, cpu = run(session, url, path, loop, args)
+                walls.append(wall)
+                cpus.append(cpu)
+            extents = file_extents(path)
+            correct = os.path.getsize(path) == size and file_sha256(path) == expected
+            best = min(walls)
+            print(f"{name:<14} {size / best / 1024 / 1024:8.1f} MB/s   "
+                  f"CPU {min(cpus) / (size / 1024 / 1024 / 1024):5.2f} s/GB   "
+                  f"fragmentów: {extents if extents is not None else '-'}   "
+                  f"{'OK' if correct else 'BŁĘDNA ZAWARTOŚĆ'}")
+    finally:
+        session.close()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
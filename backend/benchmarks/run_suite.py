@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# run_suite.py - Powtarzalny zestaw benchmarków pobierania na lokalnym serwerze testowym
+#
+# Scenariusze (wszystkie na StandInServer, bez dostępu do internetu):
+#   engines     - oba silniki daemona (http, curl): TTFB, przepustowość, poprawność pliku
+#   download_py - download.py jako osobny proces (tak jak z backendu): czas na zadanie,
+#                 stały narzut procesu (plik 1 B)
+#   daemon      - kolejka DownloadManager z bazą SQLite: czas podjęcia zadania,
+#                 przepustowość, liczba zapisów do SQLite na zadanie
+#   resume      - pierwsze żądanie treści każdego pliku zrywane w połowie: czy daemon
+#                 i download.py wznawiają od zapisanego miejsca (bytes=N-) i kończą
+#                 z poprawnym plikiem
+#   circuit     - zadanie próbne hosta po przerwie bezpiecznika anulowane w trakcie:
+#                 czy kolejne zadanie tego hosta zostanie podjęte
+#   complete    - ten sam plik pobrany drugi raz do tej samej ścieżki (bez punktu
+#                 kontrolnego): czy daemon uzna go za kompletny zamiast błędu HTTP 416
+#
+# Wynik w JSON (stdout lub --output) do porównywania między zmianami, np.:
+#   python benchmarks/run_suite.py --size 32M --jobs 4 --bandwidth 40M --output przed.json
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ.setdefault("DOWNLOAD_DB_PATH", os.path.join(BENCH_DIR, "database.sqlite"))
+os.environ.setdefault("DOWNLOAD_LOG_FILE", os.path.join(BENCH_DIR, "downloads.log"))
+os.environ.setdefault("DOWNLOAD_BANDWIDTH_FILE", os.path.join(BENCH_DIR, "bandwidth.json"))
+# Zerwane transfery scenariusza resume otwierają bezpiecznik hosta - bez minuty czekania na serwerze testowym
+os.environ.setdefault("DOWNLOAD_CIRCUIT_COOLDOWN", "2")
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+import download_manager  # noqa: E402
+from download_bandwidth import parse_rate  # noqa: E402
+from download_engines import CurlEngine, HttpEngine, timed_fetch  # noqa: E402
+from download_progress import TransferProgress  # noqa: E402
+from download_retry import CIRCUIT_MIN_FAILURES  # noqa: E402
+from standin_server import StandInServer, content_sha256  # noqa: E402
+
+# Schemat tabeli downloads jak w server.js (daemon dodaje resztę w init_database)
+DOWNLOADS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS downloads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stream_id INTEGER,
+        stream_type TEXT,
+        playlist_id INTEGER,
+        episode_id TEXT,
+        filename TEXT,
+        filepath TEXT,
+        status TEXT DEFAULT 'queued',
+        worker_status TEXT DEFAULT 'queued',
+        download_status TEXT DEFAULT 'pending',
+        progress INTEGER DEFAULT 0,
+        error_message TEXT,
+        download_url TEXT,
+        added_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def percentile(values, fraction):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def mb_s(count, seconds):
+    return round(count / seconds / 1024 / 1024, 2) if seconds else None
+
+
+class SqliteWriteCounter:
+    """Liczy zapisy (INSERT/UPDATE/DELETE) i transakcje na połączeniach daemona"""
+
+    def __init__(self):
+        self.writes = 0
+        self.commits = 0
+        self.original = download_manager.open_db_connection
+
+    def trace(self, sql):
+        statement = sql.lstrip().upper()
+        if statement.startswith(("INSERT", "UPDATE", "DELETE")):
+            self.writes += 1
+        elif statement.startswith("COMMIT"):
+            self.commits += 1
+
+    def install(self):
+        def traced(path=None):
+            conn = self.original(path)
+            conn.set_trace_callback(self.trace)
+            return conn
+        download_manager.open_db_connection = traced
+
+    def reset(self):
+        self.writes = 0
+        self.commits = 0
+
+
+def scenario_engines(server, args, out_dir):
+    results = {}
+    url = server.file_url(args.size_bytes)
+    expected = content_sha256(args.size_bytes)
+    for engine in (HttpEngine(), CurlEngine()):
+        server.reset_stats()
+        ttfbs, elapsed, total, correct = [], 0.0, 0, True
+        for job in range(args.jobs):
+            path = os.path.join(out_dir, f"{engine.name}_{job}.mkv")
+            with open(path, 'wb') as f:
+                stats = timed_fetch(engine, url, f.write)
+            ttfbs.append(stats["first_byte"])
+            elapsed += stats["elapsed"]
+            total += stats["bytes"]
+            correct = correct and file_sha256(path) == expected
+            os.remove(path)
+        engine.close()
+        results[engine.name] = {
+            "ttfb_p50_ms": ms(percentile(ttfbs, 0.5)),
+            "ttfb_max_ms": ms(max(ttfbs)),
+            "per_job_ms": ms(elapsed / args.jobs),
+            "throughput_mb_s": mb_s(total, elapsed),
+            "connections": server.stats["connections"],
+            "correct": correct,
+        }
+    return results
+
+
+def run_download_py(url, path, timeout=600):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "download.py"), url, path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    return time.perf_counter() - started, result.returncode == 0 and b"SUCCESS" in result.stdout
+
+
+def scenario_download_py(server, args, out_dir):
+    server.reset_stats()
+    expected = content_sha256(args.size_bytes)
+    walls, correct = [], True
+    for job in range(args.jobs):
+        path = os.path.join(out_dir, f"download_py_{job}.mkv")
+        wall, ok = run_download_py(server.file_url(args.size_bytes, f"dp{job}"), path)
+        walls.append(wall)
+        correct = correct and ok and file_sha256(path) == expected
+        os.remove(path)
+
+    # Stały narzut jednego uruchomienia: interpreter, importy, DNS, połączenie
+    tiny_path = os.path.join(out_dir, "download_py_tiny.mkv")
+    overhead, _ = run_download_py(server.file_url(1, "tiny"), tiny_path)
+    return {
+        "per_job_ms": ms(sum(walls) / len(walls)),
+        "process_overhead_ms": ms(overhead),
+        "throughput_mb_s": mb_s(args.size_bytes * args.jobs, sum(walls)),
+        "connections": server.stats["connections"],
+        "correct": correct,
+    }
+
+
+def insert_jobs(db_path, urls, out_dir, prefix):
+    conn = sqlite3.connect(db_path)
+    ids = []
+    for index, url in enumerate(urls):
+        cursor = conn.execute(
+            "INSERT INTO downloads (stream_type, episode_id, filename, filepath, download_url) VALUES (?, ?, ?, ?, ?)",
+            ('series', f"{prefix}{index}", f"{prefix}{index}.mkv", os.path.join(out_dir, f"{prefix}{index}.mkv"), url))
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def wait_for_jobs(db_path, ids, timeout):
+    """Czekaj na zakończenie zadań; zwraca czasy podjęcia (insert -> downloading) i statusy"""
+    conn = sqlite3.connect(db_path)
+    placeholders = ','.join('?' * len(ids))
+    started = time.perf_counter()
+    pickups = {}
+    statuses = {}
+    while time.perf_counter() - started < timeout:
+        rows = conn.execute(f"SELECT id, worker_status FROM downloads WHERE id IN ({placeholders})", ids).fetchall()
+        for job_id, status in rows:
+            if status != 'queued' and job_id not in pickups:
+                pickups[job_id] = time.perf_counter() - started
+            statuses[job_id] = status
+        if all(status in ('completed', 'failed') for status in statuses.values()) and len(statuses) == len(ids):
+            break
+        time.sleep(0.01)
+    conn.close()
+    return time.perf_counter() - started, pickups, statuses
+
+
+def scenario_daemon(manager, counter, server, args, out_dir, prefix="daemon", drop=False):
+    db_path = download_manager.DATABASE_PATH
+    server.reset_stats()
+    counter.reset()
+    urls = [server.file_url(args.size_bytes, f"{prefix}{i}") for i in range(args.jobs)]
+    ids = insert_jobs(db_path, urls, out_dir, prefix)
+    wall, pickups, statuses = wait_for_jobs(db_path, ids, args.timeout)
+
+    expected = content_sha256(args.size_bytes)
+    correct = all(
+        statuses.get(job_id) == 'completed' and file_sha256(os.path.join(out_dir, f"{prefix}{i}.mkv")) == expected
+        for i, job_id in enumerate(ids)
+    )
+    result = {
+        "wall_s": round(wall, 3),
+        "per_job_ms": ms(wall / args.jobs),
+        "pickup_p50_ms": ms(percentile(pickups.values(), 0.5)),
+        "throughput_mb_s": mb_s(args.size_bytes * args.jobs, wall),
+        "sqlite_writes": counter.writes,
+        "sqlite_writes_per_job": round(counter.writes / args.jobs, 1),
+        "sqlite_commits": counter.commits,
+        "requests": server.stats["requests"],
+        "connections": server.stats["connections"],
+        "correct": correct,
+    }
+    if drop:
+        result["drops"] = server.stats["drops"]
+        result["resumed"] = server.stats["resumed"]
+        # Każdy zerwany transfer ma się wznowić od zapisanego miejsca, nie od zera
+        result["correct"] = correct and server.stats["drops"] == args.jobs and \
+            server.stats["resumed"] >= server.stats["drops"]
+    return result
+
+
+def scenario_resume(manager, counter, server, args, out_dir):
+    daemon = scenario_daemon(manager, counter, server, args, out_dir, prefix="resume", drop=True)
+    server.reset_stats()
+    path = os.path.join(out_dir, "resume_download_py.mkv")
+    wall, ok = run_download_py(server.file_url(args.size_bytes, "resume_dp"), path)
+    correct = ok and os.path.exists(path) and file_sha256(path) == content_sha256(args.size_bytes) and \
+        server.stats["drops"] == 1 and server.stats["resumed"] >= 1
+    return {
+        "daemon": daemon,
+        "download_py": {"wall_s": round(wall, 3), "requests": server.stats["requests"],
+                        "drops": server.stats["drops"], "resumed": server.stats["resumed"], "correct": correct},
+    }
+
+
+def wait_for_status(db_path, job_id, statuses, timeout):
+    conn = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    status = None
+    while time.perf_counter() - started < timeout:
+        status = conn.execute("SELECT worker_status FROM downloads WHERE id = ?", (job_id,)).fetchone()[0]
+        if status in statuses:
+            break
+        time.sleep(0.01)
+    conn.close()
+    return status
+
+
+def scenario_circuit(manager, args, out_dir):
+    db_path = download_manager.DATABASE_PATH
+    # Wolny serwer - zadanie próbne musi jeszcze trwać, gdy przychodzi anulowanie
+    server = StandInServer(bandwidth=1024 * 1024).start()
+    try:
+        host = download_manager.get_host(server.base_url)
+        for _ in range(CIRCUIT_MIN_FAILURES):
+            manager.circuit.record_failure(host)
+        # Przerwa minęła - następne zadanie hosta staje się próbnym
+        manager.circuit.hosts[host]["open_until"] = 0.0
+
+        [probe_id] = insert_jobs(db_path, [server.file_url(8 * 1024 * 1024, "circuit_probe")], out_dir, "circuit_probe")
+        picked = wait_for_status(db_path, probe_id, ('downloading',), 10)
+        cancelled = picked == 'downloading' and manager.cancel_job(probe_id)
+        probe_status = wait_for_status(db_path, probe_id, ('cancelled', 'completed', 'failed'), 10)
+
+        [next_id] = insert_jobs(db_path, [server.file_url(64 * 1024, "circuit_next")], out_dir, "circuit_next")
+        wall, pickups, statuses = wait_for_jobs(db_path, [next_id], 10)
+        return {
+            "probe_status": probe_status,
+            "next_status": statuses.get(next_id),
+            "next_pickup_ms": ms(pickups.get(next_id)),
+            "correct": bool(cancelled) and probe_status == 'cancelled' and statuses.get(next_id) == 'completed',
+        }
+    finally:
+        server.stop()
+
+
+def scenario_complete(manager, server, args, out_dir):
+    path = os.path.join(out_dir, "complete.mkv")
+    url = server.file_url(args.size_bytes, "complete")
+    server.reset_stats()
+    errors = []
+    for _ in range(2):
+        try:
+            manager.run_transfer(url, path, TransferProgress(), threading.Event())
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+    correct = not errors and file_sha256(path) == content_sha256(args.size_bytes)
+    os.remove(path)
+    return {"requests": server.stats["requests"], "errors": errors, "correct": correct}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ścieżek pobierania na lokalnym serwerze testowym")
+    parser.add_argument("--size", default="16M", help="rozmiar pliku (sufiksy K/M/G)")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=download_manager.DOWNLOAD_WORKERS)
+    parser.add_argument("--per-host", type=int, default=download_manager.MAX_CONNECTIONS_PER_HOST)
+    parser.add_argument("--connect-delay", type=float, default=0.02, help="koszt połączenia TCP+TLS [s]")
+    parser.add_argument("--latency", type=float, default=0.01, help="opóźnienie odpowiedzi [s]")
+    parser.add_argument("--bandwidth", default="0", help="limit na połączenie po stronie serwera")
+    parser.add_argument("--no-ranges", action="store_true")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--scenarios", default="engines,download_py,daemon,resume,circuit,complete")
+    parser.add_argument("--output", help="plik JSON z wynikami (domyślnie stdout)")
+    args = parser.parse_args()
+    args.size_bytes = parse_rate(args.size)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+
+    server_options = dict(connect_delay=args.connect_delay, latency=args.latency,
+                          bandwidth=parse_rate(args.bandwidth), ranges=not args.no_ranges,
+                          fail_rate=args.fail_rate, seed=args.seed)
+    server = StandInServer(**server_options).start()
+    resume_server = StandInServer(drop_first=1, **server_options).start()
+    out_dir = os.path.join(BENCH_DIR, "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "results": {},
+    }
+    manager = None
+    try:
+        if "engines" in scenarios:
+            report["results"]["engines"] = scenario_engines(server, args, out_dir)
+        if "download_py" in scenarios:
+            report["results"]["download_py"] = scenario_download_py(server, args, out_dir)
+        if {"daemon", "resume", "circuit", "complete"} & set(scenarios):
+            conn = sqlite3.connect(download_manager.DATABASE_PATH)
+            conn.execute(DOWNLOADS_SCHEMA)
+            conn.close()
+            counter = SqliteWriteCounter()
+            counter.install()
+            manager = download_manager.DownloadManager(workers=args.workers, max_per_host=args.per_host)
+            if "daemon" in scenarios:
+                report["results"]["daemon"] = scenario_daemon(manager, counter, server, args, out_dir)
+            if "resume" in scenarios:
+                report["results"]["resume"] = scenario_resume(manager, counter, resume_server, args, out_dir)
+            if "circuit" in scenarios:
+                report["results"]["circuit"] = scenario_circuit(manager, args, out_dir)
+            if "complete" in scenarios:
+                report["results"]["complete"] = scenario_complete(manager, server, args, out_dir)
+    finally:
+        if manager is not None:
+            manager.shutdown()
+        server.stop()
+        resume_server.stop()
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
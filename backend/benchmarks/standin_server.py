@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# standin_server.py - Lokalny serwer HTTP udający dostawcę Xtream (do benchmarków)
+#
+# GET /file/<rozmiar>[.mkv] zwraca deterministyczne bajty o podanym rozmiarze
+# (content_slice), z obsługą Range i keep-alive. Parametry serwera pozwalają
+# odtworzyć warunki u dostawcy:
+#   connect_delay - koszt nawiązania połączenia (TCP + TLS), raz na połączenie
+#   latency       - opóźnienie przed nagłówkami odpowiedzi, na każde żądanie
+#   bandwidth     - limit bajtów/s na połączenie (0 = bez limitu)
+#   ranges        - czy serwer obsługuje Range
+#   fail_rate     - odsetek żądań kończonych błędem 500 (losowanie z ziarnem seed)
+#   drop_first    - ile pierwszych żądań każdego pliku zerwać w połowie transmisji
+#                   (bez sprawdzeń rozmiaru bytes=0-0 - zrywany jest transfer treści)
+#
+# stats["resumed"] liczy żądania wznowienia (Range: bytes=N- z N > 0).
+#
+# Uruchomienie samodzielne: python benchmarks/standin_server.py --port 8090 --bandwidth 5M
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from download_bandwidth import parse_rate  # noqa: E402
+
+PATTERN = bytes(range(256)) * 4096  # 1 MiB wzorca, powtarzany
+SEND_CHUNK = 64 * 1024
+
+
+def content_slice(start, end):
+    """Bajty pliku testowego z zakresu [start, end] (end włącznie)"""
+    out = bytearray()
+    pos = start
+    while pos <= end:
+        offset = pos % len(PATTERN)
+        take = min(len(PATTERN) - offset, end - pos + 1)
+        out += PATTERN[offset:offset + take]
+        pos += take
+    return bytes(out)
+
+
+def content_sha256(size):
+    """Oczekiwana suma SHA-256 pliku testowego o danym rozmiarze"""
+    digest = hashlib.sha256()
+    pos = 0
+    while pos < size:
+        end = min(size, pos + len(PATTERN)) - 1
+        digest.update(content_slice(pos, end))
+        pos = end + 1
+    return digest.hexdigest()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count("requests")
+        if self.path.startswith('/error'):
+            # Strona błędu z kodem 200 - tak dostawcy Xtream zgłaszają np. wygasłe konto
+            body = b'<html><body><h1>Account expired</h1></body></html>' * 1000
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        match = re.match(r'^/file/(\d+)', self.path)
+        if not match:
+            self.send_error(404)
+            return
+        size = int(match.group(1))
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.should_fail():
+            self.server.count("failures")
+            self.send_error(500, "Injected failure")
+            return
+
+        start, end = 0, size - 1
+        status = 200
+        etag = f'"standin-{size}"'
+        range_match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        # If-Range z innym ETagiem = plik się zmienił, wysyłamy całość
+        if_range = self.headers.get('If-Range')
+        if range_match and self.server.ranges and (if_range is None or if_range == etag):
+            start = int(range_match.group(1))
+            end = min(int(range_match.group(2)), size - 1) if range_match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+            if start and not range_match.group(2):
+                self.server.count("resumed")
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/x-matroska')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        # Zerwanie połączenia w połowie transmisji (test wznawiania)
+        stop_at = end
+        probe = self.headers.get('Range') == 'bytes=0-0'
+        if not probe and self.server.should_drop(self.path):
+            self.server.count("drops")
+            stop_at = start + (end - start) // 2
+
+        try:
+            pos = start
+            started = time.monotonic()
+            while pos <= stop_at:
+                chunk_end = min(stop_at, pos + SEND_CHUNK - 1)
+                self.wfile.write(content_slice(pos, chunk_end))
+                self.server.count("bytes_sent", chunk_end - pos + 1)
+                pos = chunk_end + 1
+                if self.server.bandwidth:
+                    ahead = (pos - start) / self.server.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+        if stop_at != end:
+            self.close_connection = True
+            self.wfile.flush()
+            self.connection.shutdown(2)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Klient zrywający połączenie (odrzucona strona błędu, przerwane pobieranie) to nie błąd serwera
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def __init__(self, port=0, connect_delay=0.0, latency=0.0, bandwidth=0, ranges=True,
+                 fail_rate=0.0, drop_first=0, seed=1):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.fail_rate = fail_rate
+        self.drop_first = drop_first
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.drops = {}
+        self.stats = {"connections": 0, "requests": 0, "failures": 0, "drops": 0, "resumed": 0, "bytes_sent": 0}
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def file_url(self, size, name="file"):
+        return f"{self.base_url}/file/{size}/{name}.mkv"
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def should_fail(self):
+        with self.lock:
+            return self.fail_rate > 0 and self.random.random() < self.fail_rate
+
+    def should_drop(self, path):
+        with self.lock:
+            done = self.drops.get(path, 0)
+            if done >= self.drop_first:
+                return False
+            self.drops[path] = done + 1
+            return True
+
+    def reset_stats(self):
+        with self.lock:
+            self.drops.clear()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny serwer testowy udający dostawcę Xtream")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--connect-delay", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", default="0")
+    parser.add_argument("--no-ranges", action="store_true")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--drop-first", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.connect_delay, args.latency, parse_rate(args.bandwidth),
+                           not args.no_ranges, args.fail_rate, args.drop_first)
+    print(f"Serwer testowy: {server.base_url}/file/<rozmiar>.mkv")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,144 @@
 import sys
 import requests
 import os
+import urllib3
 import time
 import socket
 from urllib.parse import urlparse
 
-def test_dns_resolution(hostname):
-    """Test if hostname can be resolved"""
+from download_bandwidth import BandwidthLimiter
+from download_dedup import detach_hardlink
+from download_dns import DnsCache
+from download_engines import DownloadError, HttpEngine, cached_dns_adapter
+from download_hls import HlsDownloader, is_hls_url
+from download_progress import TransferProgress, format_progress
+from download_segments import (SEGMENT_CONNECTIONS, SegmentState, parse_content_range,
+                               run_segments, use_segments)
+from download_validation import SNIFF_BYTES, InvalidContentError, PlaylistResponse, StreamValidator, check_head
+from download_writer import DOWNLOAD_CHUNK_SIZE, FileWriter, ResumeCheckpoint, resume_validator
+
+def test_dns_resolution(hostname, dns_cache):
+    """Test if hostname can be resolved - the answer stays in dns_cache for the actual connections"""
     try:
-        socket.gethostbyname(hostname)
+        dns_cache.resolve(hostname)
         return True
     except socket.gaierror:
         return False
 
-def download_file(url, output_path):
+def iter_response_chunks(response, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Read a streamed response into one reusable buffer and yield views of it.
+    Each view is only valid until the next one is yielded - write it out, don't keep it."""
+    raw = response.raw
+    raw.decode_content = True
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        # Same exception mapping as requests' iter_content
+        try:
+            count = raw.readinto(buffer)
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        except urllib3.exceptions.SSLError as e:
+            raise requests.exceptions.SSLError(e)
+        if not count:
+            break
+        yield buffer[:count]
+
+def probe_ranges(session, url):
+    """Check file size, Range support and the ETag/Last-Modified validator with a bytes=0-0 request"""
+    try:
+        with session.get(
+            url,
+            headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'},
+            stream=True,
+            allow_redirects=True,
+            timeout=(30, 60),
+            verify=False
+        ) as r:
+            validator = resume_validator(r.headers)
+            if r.status_code == 206:
+                return parse_content_range(r.headers.get('content-range')), True, validator
+            length = r.headers.get('content-length', '')
+            return (int(length) if length.isdigit() else None), False, validator
+    except requests.exceptions.RequestException:
+        return None, False, None
+
+def download_segmented(session, url, output_path, total_size, max_retries, bandwidth, validator=None):
+    """Download byte ranges in parallel into one preallocated file.
+    Completed segments are tracked in a sidecar file, so retries only fetch what is missing.
+    The validator (ETag/Last-Modified) makes sure old segments belong to the same remote file."""
+    state = SegmentState.load_or_create(output_path, url, total_size, validator=validator)
+
+    def fetch_segment(segment, write):
+        headers = {'Range': f"bytes={segment['pos']}-{segment['end']}", 'Accept-Encoding': 'identity'}
+        if validator:
+            headers['If-Range'] = validator
+        # Only the first segment sees the start of the file - check its format before writing anything
+        sniff = segment['pos'] == 0
+        with session.get(url, headers=headers, stream=True, timeout=(30, 300), verify=False) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise IOError(f"Server ignored Range request (HTTP {r.status_code})")
+            for chunk in iter_response_chunks(r):
+                if sniff:
+                    check_head(bytes(chunk[:SNIFF_BYTES]))
+                    sniff = False
+                bandwidth.consume(len(chunk))
+                write(chunk)
+
+    progress = TransferProgress(total_size)
+
+    def on_tick():
+        progress.update(state.bytes_done())
+        if progress.should_report():
+            print(f"Progress: {format_progress(progress.snapshot())}", file=sys.stderr)
+
+    for attempt in range(max_retries):
+        missing = len(state.missing())
+        print(f"Segmented download: {missing}/{len(state.segments)} segments, "
+              f"{state.bytes_done()}/{total_size} bytes done (attempt {attempt + 1}/{max_retries})", file=sys.stderr)
+        errors = run_segments(state, fetch_segment, SEGMENT_CONNECTIONS, on_tick=on_tick)
+        if not errors:
+            print(f"Download completed: {total_size} bytes", file=sys.stderr)
+            return
+        for error in errors:
+            print(f"Segment error: {error}", file=sys.stderr)
+        if any(isinstance(error, InvalidContentError) for error in errors):
+            raise next(error for error in errors if isinstance(error, InvalidContentError))
+        if attempt < max_retries - 1:
+            time.sleep(5)
+    raise errors[-1]
+
+def download_hls(url, output_path, dns_cache, bandwidth):
+    """Download the segments of an HLS playlist in parallel and write them, in order, into one file"""
+    # Same TLS policy as the other requests in this script - some IPTV providers have broken certificates
+    engine = HttpEngine(dns_cache=dns_cache, verify=False)
+    progress = TransferProgress()
+
+    def on_data(chunk):
+        bandwidth.consume(len(chunk))
+
+    def on_segment(written, done, total):
+        # The total size is unknown up front - estimate it from the segments written so far
+        progress.set_total(written * total // done)
+        progress.update(written)
+        if progress.should_report():
+            print(f"Progress: {format_progress(progress.snapshot())} (segment {done}/{total})", file=sys.stderr)
+
+    downloader = HlsDownloader(engine, url, output_path, on_data=on_data,
+                               log=lambda message, level='INFO': print(message, file=sys.stderr))
+    try:
+        summary = downloader.run(on_segment)
+    finally:
+        engine.close()
+    print(f"Download completed: {summary['size']} bytes in {summary['segments']} HLS segments", file=sys.stderr)
+    print(f"Verified: format {summary['container'] or 'not checked'}, "
+          f"crc32 {summary['crc32'] or 'unavailable (resumed without checksum)'}", file=sys.stderr)
+
+def download_file(url, output_path, hls=False):
     try:
         # Parse URL to get hostname
         parsed_url = urlparse(url)
@@ -21,8 +146,10 @@ def download_file(url, output_path):
         
         print(f"Testing DNS resolution for: {hostname}", file=sys.stderr)
         
-        # Test DNS resolution first
-        if not test_dns_resolution(hostname):
+        # Test DNS resolution first (without the port - Xtream URLs usually carry one).
+        # Connections reuse the resolved addresses and fail over to the next one.
+        dns_cache = DnsCache()
+        if not test_dns_resolution(parsed_url.hostname or hostname, dns_cache):
             print(f"DNS Error: Cannot resolve hostname '{hostname}'", file=sys.stderr)
             print("Possible solutions:", file=sys.stderr)
             print("1. Check your internet connection", file=sys.stderr)
@@ -32,13 +159,16 @@ def download_file(url, output_path):
         
         # Create folder if it doesn't exist
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # A file the daemon hardlinked from another job's copy - don't write through to that copy
+        detach_hardlink(output_path)
         
         # Enhanced headers to mimic real browser
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': '*/*',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate',
+            # Video doesn't compress - and Content-Length must match the bytes on disk
+            'Accept-Encoding': 'identity',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         }
@@ -48,46 +178,103 @@ def download_file(url, output_path):
         # Configure request with retries and timeout
         session = requests.Session()
         session.headers.update(headers)
+        session.mount('http://', cached_dns_adapter(dns_cache))
+        session.mount('https://', cached_dns_adapter(dns_cache))
         
         # Handle redirects properly
         session.max_redirects = 10
         
         # Retry mechanism
         max_retries = 3
+
+        # Bandwidth limit and time-of-day schedule shared with the download daemon config
+        bandwidth = BandwidthLimiter()
+
+        # HLS playlist (catch-up and some series URLs) - segments instead of one file
+        if hls or is_hls_url(url):
+            download_hls(url, output_path, dns_cache, bandwidth)
+            print("SUCCESS")
+            return
+
+        # Segmented mode - several Range connections, falls back to a single stream
+        if SEGMENT_CONNECTIONS > 1:
+            total_size, accepts_ranges, validator = probe_ranges(session, url)
+            if use_segments(total_size, accepts_ranges):
+                download_segmented(session, url, output_path, total_size, max_retries, bandwidth, validator)
+                print("SUCCESS")
+                return
+
+        # Resume point from an earlier attempt or an earlier run of this script
+        checkpoint = ResumeCheckpoint.load(output_path, url)
+
         for attempt in range(max_retries):
             try:
                 with session.get(
                     url, 
+                    headers=checkpoint.request_headers(),
                     stream=True, 
                     allow_redirects=True,
                     timeout=(30, 300),  # (connect timeout, read timeout)
                     verify=False  # Skip SSL verification for some IPTV providers
                 ) as r:
+                    if r.status_code == 416 and checkpoint.position:
+                        # Nothing left to fetch - or the partial file is bigger than the remote one
+                        if parse_content_range(r.headers.get('content-range')) == checkpoint.position:
+                            print(f"Download completed: {checkpoint.position} bytes (already on disk)", file=sys.stderr)
+                            checkpoint.remove()
+                            break
+                        print("Partial file does not match the remote file, starting over", file=sys.stderr)
+                        checkpoint.reset()
+                        continue
                     r.raise_for_status()
                     
-                    # Check if we got actual video content
+                    # The body itself is checked on the first chunk (StreamValidator) - never read it all here
                     content_type = r.headers.get('content-type', '').lower()
                     if 'text/html' in content_type or 'application/json' in content_type:
                         print(f"Warning: Received {content_type} instead of video content", file=sys.stderr)
-                        print(f"Response content preview: {r.text[:200]}...", file=sys.stderr)
                     
+                    # 206 from our offset = resume; 200 = new file or the remote file changed (If-Range)
+                    requested = checkpoint.position
+                    offset = checkpoint.accept(r)
+                    if offset:
+                        print(f"Resuming download at byte {offset}", file=sys.stderr)
+                    elif requested:
+                        print("Server cannot resume this file, starting over", file=sys.stderr)
+
                     # Download with progress
-                    total_size = int(r.headers.get('content-length', 0))
-                    downloaded = 0
+                    total_size = checkpoint.total_size or 0
+                    downloaded = offset
+                    progress = TransferProgress(total_size or None, downloaded)
+                    # Format check, size and CRC32 computed on the fly - no second pass over the file
+                    validation = StreamValidator(total_size, offset, checkpoint.checksum)
                     
-                    with open(output_path, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192): 
-                            if chunk:  # filter out keep-alive chunks
+                    # Large reads into a reusable buffer, space reserved up front when the size is known
+                    with FileWriter(output_path, offset=offset, expected_size=total_size) as f:
+                        try:
+                            for chunk in iter_response_chunks(r):
+                                validation.feed(chunk)
+                                bandwidth.consume(len(chunk))
                                 f.write(chunk)
                                 downloaded += len(chunk)
-                                
-                                # Simple progress indicator
-                                if total_size > 0:
-                                    progress = (downloaded / total_size) * 100
-                                    if downloaded % (1024 * 1024) == 0:  # Print every MB
-                                        print(f"Progress: {progress:.1f}% ({downloaded}/{total_size} bytes)", file=sys.stderr)
-                    
+                                checkpoint.save(downloaded, validation.crc)
+
+                                # Progress with speed and ETA, at most once per second
+                                progress.update(downloaded)
+                                if progress.should_report():
+                                    print(f"Progress: {format_progress(progress.snapshot())}", file=sys.stderr)
+                        finally:
+                            # Bytes on disk are kept for the next attempt or the next run
+                            checkpoint.save(downloaded, validation.crc, force=True)
+
+                    if total_size and downloaded < total_size:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"Connection closed at {downloaded} of {total_size} bytes")
+
+                    summary = validation.finish()
+                    checkpoint.remove()
                     print(f"Download completed: {downloaded} bytes", file=sys.stderr)
+                    print(f"Verified: format {summary['container'] or 'not checked'}, "
+                          f"crc32 {summary['crc32'] or 'unavailable (resumed without checksum)'}", file=sys.stderr)
                     break
                     
             except requests.exceptions.ConnectTimeout:
@@ -106,6 +293,15 @@ def download_file(url, output_path):
                 else:
                     raise
                     
+            except requests.exceptions.ChunkedEncodingError as e:
+                # Connection dropped mid-transfer - the next attempt resumes from the checkpoint
+                print(f"Transfer interrupted (attempt {attempt + 1}/{max_retries}): {e}", file=sys.stderr)
+                if attempt < max_retries - 1:
+                    time.sleep(5)
+                    continue
+                else:
+                    raise
+
             except requests.exceptions.ConnectionError as e:
                 print(f"Connection error (attempt {attempt + 1}/{max_retries}): {e}", file=sys.stderr)
                 if attempt < max_retries - 1:
@@ -113,6 +309,8 @@ def download_file(url, output_path):
                     continue
                 else:
                     raise
+        else:
+            raise IOError(f"Download failed after {max_retries} attempts")
         
         print("SUCCESS")
         
@@ -134,9 +332,24 @@ def download_file(url, output_path):
         print("- Server downtime", file=sys.stderr)
         sys.exit(1)
         
+    except PlaylistResponse:
+        # Catch-up URLs often have no .m3u8 extension but still answer with a playlist
+        print("Server returned an HLS playlist, downloading its segments", file=sys.stderr)
+        ResumeCheckpoint(output_path, url).remove()
+        download_file(url, output_path, hls=True)
+
+    except InvalidContentError as e:
+        print(f"Invalid content: {e}", file=sys.stderr)
+        print("The provider sent something other than a video file - check the stream and your subscription.", file=sys.stderr)
+        sys.exit(1)
+
     except requests.exceptions.Timeout:
         print("Request timed out. The server might be slow or overloaded.", file=sys.stderr)
         sys.exit(1)
+
+    except DownloadError as e:
+        print(f"Download error: {e}", file=sys.stderr)
+        sys.exit(1)
         
     except Exception as e:
         print(f"Unexpected error: {e}", file=sys.stderr)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# download_bandwidth.py - Wspólny limit przepustowości (token bucket) z harmonogramem godzinowym
+
+import os
+import json
+import threading
+import time
+
+# Plik konfiguracyjny czytany w locie - zmiana limitu nie wymaga restartu, np.:
+# {"limit": "0", "schedule": [{"from": "17:00", "to": "23:30", "limit": "4M"}]}
+BANDWIDTH_CONFIG_FILE = os.environ.get("DOWNLOAD_BANDWIDTH_FILE", "/app/config/bandwidth.json")
+# Wartości domyślne, gdy pliku nie ma: limit w bajtach/s (sufiksy K/M/G, 0 = bez limitu)
+# i harmonogram w formacie "17:00-23:30=4M,01:00-06:00=0"
+BANDWIDTH_LIMIT = os.environ.get("DOWNLOAD_BANDWIDTH_LIMIT", "0")
+BANDWIDTH_SCHEDULE = os.environ.get("DOWNLOAD_BANDWIDTH_SCHEDULE", "")
+# Co ile sekund sprawdzać plik konfiguracyjny i okno czasowe
+CONFIG_CHECK_INTERVAL = 5.0
+# Minimalny "zapas" kubełka, żeby pojedyncze porcje danych nie czekały w nieskończoność
+MIN_BURST = 256 * 1024
+
+
+def parse_rate(value):
+    """'4M' -> 4194304 bajtów/s; 0, '' lub None = bez limitu"""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    value = str(value).strip().upper().replace('/S', '').rstrip('B')
+    if not value:
+        return 0
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = multipliers.get(value[-1], 1)
+    number = value[:-1] if value[-1] in multipliers else value
+    return max(0, int(float(number) * multiplier))
+
+
+def parse_clock(value):
+    """'17:30' -> minuty od północy"""
+    hours, minutes = value.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_schedule(spec):
+    """Harmonogram z napisu "HH:MM-HH:MM=LIMIT,..." lub listy słowników {from, to, limit}"""
+    windows = []
+    if not spec:
+        return windows
+    if isinstance(spec, str):
+        entries = []
+        for item in spec.split(','):
+            if '=' not in item:
+                continue
+            span, limit = item.split('=', 1)
+            start, end = span.split('-', 1)
+            entries.append({"from": start, "to": end, "limit": limit})
+    else:
+        entries = spec
+    for entry in entries:
+        windows.append((parse_clock(entry["from"]), parse_clock(entry["to"]), parse_rate(entry["limit"])))
+    return windows
+
+
+def format_schedule(windows):
+    """Odwrotność parse_schedule - lista słowników do JSON"""
+    return [
+        {"from": f"{start // 60:02d}:{start % 60:02d}", "to": f"{end // 60:02d}:{end % 60:02d}", "limit": rate}
+        for start, end, rate in windows
+    ]
+
+
+def rate_for_time(windows, default_rate, now=None):
+    """Limit obowiązujący o danej godzinie (okna mogą przechodzić przez północ)"""
+    now = now or time.localtime()
+    minute = now.tm_hour * 60 + now.tm_min
+    for start, end, rate in windows:
+        if start <= end:
+            if start <= minute < end:
+                return rate
+        elif minute >= start or minute < end:
+            return rate
+    return default_rate
+
+
+class TokenBucket:
+    """Kubełek żetonów z rezerwacją w kolejności zgłoszeń.
+
+    consume() rezerwuje bajty pod blokadą (saldo może zejść poniżej zera),
+    a czeka już poza nią. Zgłoszenia są obsługiwane po kolei, więc równolegle
+    pobierane pliki dzielą limit po równo, a niewykorzystana część przypada
+    pozostałym.
+    """
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = 0
+        self.burst = MIN_BURST
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            if rate == self.rate:
+                return
+            self.rate = rate
+            self.burst = max(rate, MIN_BURST)
+            self.tokens = min(self.tokens, self.burst)
+            self.updated = time.monotonic()
+
+    def consume(self, count):
+        with self.lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class BandwidthLimiter:
+    """Limit przepustowości wspólny dla wszystkich pobierań w procesie.
+
+    Limit wynika z harmonogramu i limitu domyślnego z pliku
+    BANDWIDTH_CONFIG_FILE (lub zmiennych środowiskowych). Plik jest
+    sprawdzany co CONFIG_CHECK_INTERVAL, więc zmiany działają bez restartu.
+    """
+
+    def __init__(self, config_path=BANDWIDTH_CONFIG_FILE):
+        self.config_path = config_path
+        self.lock = threading.Lock()
+        self.bucket = TokenBucket()
+        self.default_rate = parse_rate(BANDWIDTH_LIMIT)
+        self.windows = parse_schedule(BANDWIDTH_SCHEDULE)
+        self.config_mtime = None
+        self.next_check = 0.0
+        self.refresh(force=True)
+
+    def load_config(self):
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return
+        if mtime == self.config_mtime:
+            return
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self.default_rate = parse_rate(config.get("limit", 0))
+            self.windows = parse_schedule(config.get("schedule", []))
+            self.config_mtime = mtime
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Błąd odczytu konfiguracji przepustowości: {e}")
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return
+        with self.lock:
+            if not force and now < self.next_check:
+                return
+            self.next_check = now + CONFIG_CHECK_INTERVAL
+            self.load_config()
+            self.bucket.set_rate(rate_for_time(self.windows, self.default_rate))
+
+    def consume(self, count):
+        """Poczekaj, aż limit pozwoli przesłać count bajtów"""
+        self.refresh()
+        return self.bucket.consume(count)
+
+    def set_limit(self, limit, schedule=None):
+        """Zmień limit w trakcie pracy i zapisz go do pliku (widzą go też inne procesy)"""
+        config = {"limit": limit, "schedule": schedule if schedule is not None else format_schedule(self.windows)}
+        tmp_path = self.config_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, self.config_path)
+        self.refresh(force=True)
+
+    def snapshot(self):
+        return {
+            "current_limit": self.bucket.rate,
+            "default_limit": self.default_rate,
+            "schedule": format_schedule(self.windows)
+        }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# download_dedup.py - Ponowne użycie już pobranych plików (hardlink / reflink / kopia) i zadania w toku
+#
+# Wyszukiwanie kandydatów (zapytania po indeksach download_url i episode_id) jest w
+# download_manager.py; tu są tylko operacje na plikach i klucze zadań w toku.
+
+import errno
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Poza Uniksem zostaje hardlink albo kopia
+    fcntl = None
+
+# Wyłączenie całego mechanizmu (każde zadanie pobiera plik od nowa)
+DEDUP_ENABLED = os.environ.get("DOWNLOAD_DEDUP", "1") == "1"
+# Kolejność prób przy tworzeniu pliku z istniejącej kopii. Hardlink nie zajmuje miejsca,
+# ale oba wpisy wskazują ten sam i-węzeł; reflink (btrfs, XFS) dzieli bloki aż do zmiany;
+# kopia działa zawsze, tylko zajmuje miejsce i czas
+REUSE_METHODS = tuple(method.strip() for method in
+                      os.environ.get("DOWNLOAD_REUSE_METHODS", "hardlink,reflink,copy").split(",")
+                      if method.strip())
+# Ilu ukończonych kandydatów sprawdzić dla jednego zadania
+REUSE_CANDIDATES = 5
+
+# ioctl FICLONE z linux/fs.h - klon całego pliku współdzielący bloki
+FICLONE = 0x40049409
+TEMP_SUFFIX = ".reuse.tmp"
+
+
+def same_file(first, second):
+    """Obie ścieżki wskazują ten sam plik (także przez hardlink)"""
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+
+def reflink(source, target):
+    """Klon pliku przez FICLONE; OSError, gdy system plików go nie obsługuje"""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink niedostępny na tym systemie")
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source, target, methods=REUSE_METHODS):
+    """Utwórz target z zawartości source pierwszą działającą metodą; zwraca jej nazwę.
+
+    Plik powstaje pod nazwą tymczasową i jest podmieniany atomowo - czytelnik
+    nigdy nie zobaczy połowy kopii. Gdy żadna metoda się nie uda, zgłasza
+    ostatni OSError.
+    """
+    temp_path = target + TEMP_SUFFIX
+    error = OSError(f"Brak metod ponownego użycia pliku: {methods}")
+    for method in methods:
+        try:
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            if method == 'hardlink':
+                os.link(source, temp_path)
+            elif method == 'reflink':
+                reflink(source, temp_path)
+            elif method == 'copy':
+                shutil.copyfile(source, temp_path)
+            else:
+                continue
+            os.replace(temp_path, target)
+            return method
+        except OSError as e:
+            error = e
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+    raise error
+
+
+def detach_hardlink(path):
+    """Przed pobieraniem odłącz plik współdzielony hardlinkiem z innym zadaniem.
+
+    Pobieranie obcina i dopisuje plik w miejscu - przy wspólnym i-węźle
+    zmieniłoby też kopię, z której plik powstał. Hardlinki powstają tylko
+    z ukończonych plików, więc częściowego pobrania to nie dotyczy.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class InflightJobs:
+    """Adresy i odcinki pobierane w tej chwili - duplikat czeka w kolejce na ich koniec.
+
+    Po zakończeniu pierwszego pobrania duplikat korzysta z gotowego pliku
+    zamiast pobierać go równolegle drugi raz.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+
+    @staticmethod
+    def keys(url, stream_type=None, episode_id=None):
+        keys = [('url', url)]
+        if episode_id is not None:
+            keys.append(('episode', stream_type, str(episode_id)))
+        return keys
+
+    def busy(self, keys):
+        with self.lock:
+            return any(key in self.active for key in keys)
+
+    def add(self, keys):
+        with self.lock:
+            for key in keys:
+                self.active[key] = self.active.get(key, 0) + 1
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                count = self.active.get(key, 0) - 1
+                if count > 0:
+                    self.active[key] = count
+                else:
+                    self.active.pop(key, None)
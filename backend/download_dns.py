@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# download_dns.py - Pamięć podręczna DNS wspólna dla wszystkich pobierań (TTL, cache błędów, kolejność adresów)
+
+import ipaddress
+import os
+import socket
+import threading
+import time
+
+# Jak długo ufać rozwiązanemu adresowi [s] - getaddrinfo nie zwraca TTL rekordu
+DNS_CACHE_TTL = float(os.environ.get("DOWNLOAD_DNS_TTL", "300"))
+# Jak długo pamiętać nieudane rozwiązanie nazwy (żeby kolejne zadania nie czekały na ten sam timeout)
+DNS_NEGATIVE_TTL = float(os.environ.get("DOWNLOAD_DNS_NEGATIVE_TTL", "30"))
+# Gdy DNS dostawcy nie odpowiada, używaj ostatnich znanych adresów przez tyle sekund od ich pobrania
+DNS_STALE_TTL = float(os.environ.get("DOWNLOAD_DNS_STALE_TTL", "3600"))
+# Adres, z którym nie udało się połączyć, trafia na koniec listy na tyle sekund
+DNS_FAILED_ADDRESS_PENALTY = 60.0
+# Maksymalny czas czekania na równoległe rozwiązywanie tej samej nazwy przez inny wątek
+DNS_LOOKUP_WAIT = 30.0
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+        return True
+    except ValueError:
+        return False
+
+
+def system_lookup(host):
+    """Adresy hosta z resolvera systemowego (kolejność jak z getaddrinfo, bez powtórzeń)"""
+    addresses = []
+    for info in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM):
+        address = info[4][0]
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+class DnsCache:
+    """Rozwiązane nazwy hostów trzymane w pamięci procesu.
+
+    - wpis ważny przez DNS_CACHE_TTL, błąd (NXDOMAIN, timeout) przez DNS_NEGATIVE_TTL,
+    - gdy odświeżenie się nie uda, zwracane są ostatnie znane adresy (do DNS_STALE_TTL),
+    - jednoczesne zapytania o ten sam host czekają na jedno rozwiązanie,
+    - adresy, z którymi nie udało się połączyć (mark_failed), idą na koniec listy.
+    """
+
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL, stale_ttl=DNS_STALE_TTL,
+                 lookup=system_lookup):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.lookup = lookup
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending = {}
+        self.failed = {}
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "stale": 0, "failovers": 0}
+
+    def resolve(self, host):
+        """Lista adresów hosta (najpierw sprawne); socket.gaierror, gdy nazwy nie da się rozwiązać"""
+        host = host.lower().rstrip('.')
+        if is_ip_address(host):
+            return [host.strip('[]')]
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(host)
+                if entry is not None and time.monotonic() < entry["expires"]:
+                    self.stats["negative_hits" if entry["error"] is not None else "hits"] += 1
+                    return self.from_entry(host, entry)
+                event = self.pending.get(host)
+                owner = event is None
+                if owner:
+                    event = self.pending[host] = threading.Event()
+                    self.stats["misses"] += 1
+            if owner:
+                break
+            # Ktoś inny właśnie rozwiązuje tę nazwę - poczekaj na jego wynik
+            event.wait(DNS_LOOKUP_WAIT)
+
+        try:
+            entry = self.refresh(host)
+        finally:
+            with self.lock:
+                self.pending.pop(host).set()
+        with self.lock:
+            return self.from_entry(host, entry)
+
+    def refresh(self, host):
+        resolved_at = time.monotonic()
+        try:
+            entry = {"addresses": self.lookup(host), "error": None,
+                     "resolved_at": resolved_at, "expires": resolved_at + self.ttl}
+        except (socket.gaierror, socket.herror, UnicodeError) as e:
+            error = e if isinstance(e, socket.gaierror) else socket.gaierror(socket.EAI_NONAME, str(e))
+            with self.lock:
+                previous = self.entries.get(host)
+            if previous is not None and previous["error"] is None and \
+                    resolved_at - previous["resolved_at"] < self.stale_ttl:
+                # DNS chwilowo nie działa - stare adresy są lepsze niż zatrzymana kolejka
+                entry = dict(previous, expires=resolved_at + self.negative_ttl)
+                with self.lock:
+                    self.stats["stale"] += 1
+            else:
+                entry = {"addresses": [], "error": error,
+                         "resolved_at": resolved_at, "expires": resolved_at + self.negative_ttl}
+        with self.lock:
+            self.entries[host] = entry
+        return entry
+
+    def from_entry(self, host, entry):
+        # Wołane pod blokadą
+        if entry["error"] is not None:
+            raise entry["error"]
+        now = time.monotonic()
+        # Stabilne sortowanie: sprawne adresy w kolejności z DNS, potem te z nieudanym połączeniem
+        return sorted(entry["addresses"], key=lambda address: self.failed.get((host, address), 0) > now)
+
+    def mark_failed(self, host, address):
+        """Połączenie z adresem się nie udało - kolejne próby zaczną od innego"""
+        now = time.monotonic()
+        with self.lock:
+            if len(self.failed) > 1000:
+                self.failed = {key: until for key, until in self.failed.items() if until > now}
+            self.failed[(host.lower().rstrip('.'), address)] = now + DNS_FAILED_ADDRESS_PENALTY
+            self.stats["failovers"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, hosts=len(self.entries))
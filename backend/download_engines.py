@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# download_engines.py - Silniki pobierania: wbudowany klient HTTP (requests) i curl jako zapas
+
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+from download_dns import is_ip_address
+from download_segments import parse_content_range
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+except ImportError:  # curl działa także bez requests
+    requests = None
+
+# Silnik domyślny: "http" (połączenia keep-alive w procesie) lub "curl"
+DOWNLOAD_ENGINE = os.environ.get("DOWNLOAD_ENGINE", "http")
+# Maksymalna liczba otwartych połączeń w puli jednego hosta
+HTTP_POOL_SIZE = 8
+HTTP_CONNECT_TIMEOUT = 30
+HTTP_READ_TIMEOUT = 300
+# Rozmiar porcji czytanej ze strumienia (HTTP i potok curl)
+STREAM_CHUNK_SIZE = 256 * 1024
+# Największy dokument czytany w całości do pamięci (playlista HLS długiego filmu to kilka MB)
+DOCUMENT_MAX_SIZE = 16 * 1024 * 1024
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class DownloadError(Exception):
+    """Błąd pobierania z rodzajem przyczyny.
+
+    kind: 'http', 'dns', 'connect', 'timeout', 'tls', 'range', 'protocol', 'io';
+    status: kod HTTP (dla kind == 'http'); retryable: czy ponowienie ma sens.
+    """
+
+    def __init__(self, message, kind='protocol', status=None, retryable=True):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retryable = retryable
+
+    @classmethod
+    def http(cls, status, message=None):
+        # 4xx poza 408/429 (np. 404, 403 - złe dane Xtream) nie naprawi się samo
+        retryable = status >= 500 or status in (408, 429)
+        return cls(message or f"HTTP {status}", 'http', status, retryable)
+
+
+class RangeNotSatisfiable(DownloadError):
+    """HTTP 416 przy wznawianiu - total_size z 'Content-Range: bytes */N' (None, gdy serwer go nie podał)"""
+
+    def __init__(self, total_size=None):
+        super().__init__(f"HTTP 416: Requested Range Not Satisfiable (rozmiar zdalny {total_size})",
+                         'range', 416, retryable=False)
+        self.total_size = total_size
+
+
+class DownloadInterrupted(DownloadError):
+    """Transfer przerwany przy zatrzymywaniu daemona - to nie błąd hosta ani pliku"""
+
+    def __init__(self, message="Pobieranie przerwane przy zatrzymywaniu"):
+        super().__init__(message, 'interrupted')
+
+
+class DownloadCancelled(DownloadError):
+    """Zadanie anulowane (RPC cancel albo rozłączony klient) - bez ponawiania"""
+
+    def __init__(self, message="Pobieranie anulowane"):
+        super().__init__(message, 'cancelled', retryable=False)
+
+
+# Kody wyjścia curl -> rodzaj błędu
+CURL_ERROR_KINDS = {
+    6: 'dns',
+    7: 'connect',
+    18: 'protocol',
+    22: 'http',
+    28: 'timeout',
+    33: 'range',
+    35: 'tls',
+    36: 'range',
+    52: 'protocol',
+    56: 'connect',
+    60: 'tls',
+}
+
+
+def curl_error(returncode, stderr):
+    """Zamień kod wyjścia curl na DownloadError"""
+    message = f"curl zakończył się z kodem {returncode}" + (f": {stderr.strip()}" if stderr.strip() else "")
+    kind = CURL_ERROR_KINDS.get(returncode, 'protocol')
+    if kind == 'http':
+        match = re.search(r'error:?\s*(\d{3})', stderr)
+        if match:
+            return DownloadError.http(int(match.group(1)), message)
+    return DownloadError(message, kind, retryable=kind != 'range')
+
+
+def range_header(start, end):
+    if end is not None:
+        return f"bytes={start}-{end}"
+    if start:
+        return f"bytes={start}-"
+    return None
+
+
+def resolve_url_host(dns_cache, url):
+    """(host, port, adresy) dla URL z nazwą hosta albo None (adres IP, brak pamięci DNS)"""
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if dns_cache is None or not host or is_ip_address(host):
+        return None
+    try:
+        addresses = dns_cache.resolve(host)
+    except socket.gaierror as e:
+        raise DownloadError(f"Nie można rozwiązać nazwy {host}: {e}", 'dns') from e
+    return host, parsed.port or (443 if parsed.scheme == 'https' else 80), addresses
+
+
+class CurlEngine:
+    """Silnik zapasowy - osobny proces curl na każde żądanie, dane przez potok"""
+
+    name = 'curl'
+
+    def __init__(self, dns_cache=None):
+        self.dns_cache = dns_cache
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.aborted = False
+
+    def base_command(self, url):
+        cmd = [
+            'curl',
+            '--location',  # Podążaj za przekierowaniami
+            '--silent', '--show-error',  # Na stderr tylko błędy
+            '--connect-timeout', str(HTTP_CONNECT_TIMEOUT),
+            '--max-time', '1800',  # Max czas pobierania (30 min)
+            '--user-agent', USER_AGENT,
+        ]
+        resolved = resolve_url_host(self.dns_cache, url)
+        if resolved:
+            # Adresy z pamięci podręcznej - curl nie pyta DNS (kolejne adresy to zapas)
+            host, port, addresses = resolved
+            cmd += ['--resolve', f"{host}:{port}:" + ','.join(f"[{a}]" if ':' in a else a for a in addresses)]
+        return cmd
+
+    def probe(self, url):
+        """Rozmiar pliku i obsługa Range (żądanie bytes=0-0).
+
+        Nagłówki są czytane na bieżąco, a curl jest zatrzymywany zaraz po
+        nagłówkach ostatniej odpowiedzi - serwer ignorujący Range nie wysyła
+        wtedy całego pliku (wielu GB) tylko po to, by poznać jego rozmiar.
+        """
+        cmd = self.base_command(url) + ['--range', '0-0', '--dump-header', '-', '--output', os.devnull, url]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        timer = threading.Timer(90, process.kill)
+        timer.start()
+        status, headers = None, {}
+        try:
+            for line in process.stdout:
+                line = line.rstrip('\r\n')
+                if status is None:
+                    status_parts = line.split()
+                    status = status_parts[1] if len(status_parts) > 1 else ''
+                    headers = {}
+                elif line:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                elif status.startswith(('1', '3')):
+                    # Przy przekierowaniach liczą się nagłówki ostatniej odpowiedzi
+                    status = None
+                else:
+                    break
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            timer.cancel()
+        if not status:
+            return None, False
+
+        if status == '206':
+            return parse_content_range(headers.get('content-range')), True
+
+        length = headers.get('content-length', '')
+        return (int(length) if length.isdigit() else None), False
+
+    def fetch(self, url, write, start=0, end=None):
+        """Pobierz bajty od start do end (włącznie, None = do końca) i przekaż je do write()"""
+        cmd = self.base_command(url) + ['--fail']  # Zakończ z błędem przy HTTP error
+        if end is not None:
+            cmd += ['--range', f"{start}-{end}"]
+        elif start:
+            cmd += ['--continue-at', str(start)]  # Kontynuuj przerwane pobieranie
+        cmd += ['--output', '-', url]
+
+        with self.lock:
+            if self.aborted:
+                raise DownloadInterrupted()
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.processes.add(process)
+        try:
+            while True:
+                chunk = process.stdout.read1(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                write(chunk)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            stderr = process.stderr.read().decode('utf-8', 'replace')
+            process.wait()
+            with self.lock:
+                self.processes.discard(process)
+
+        if process.returncode != 0:
+            if self.aborted:
+                raise DownloadInterrupted()
+            error = curl_error(process.returncode, stderr)
+            if error.status == 416 and start and end is None:
+                # --fail nie pokazuje nagłówków odpowiedzi - rozmiar zdalny z osobnego żądania
+                raise RangeNotSatisfiable(self.probe(url)[0]) from error
+            raise error
+
+    def fetch_document(self, url, max_size=DOCUMENT_MAX_SIZE):
+        """Mały dokument w całości (np. playlista HLS) i adres po przekierowaniach"""
+        if self.aborted:
+            raise DownloadInterrupted()
+        # Adres końcowy curl dopisuje w ostatniej linii, za treścią
+        cmd = self.base_command(url) + ['--fail', '--max-filesize', str(max_size),
+                                        '--write-out', '\\n%{url_effective}', '--output', '-', url]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=90)
+        if result.returncode != 0:
+            raise curl_error(result.returncode, result.stderr.decode('utf-8', 'replace'))
+        body, _, final_url = result.stdout.rpartition(b'\n')
+        return body, final_url.decode('utf-8', 'replace').strip() or url
+
+    def abort(self):
+        """Przerwij wszystkie trwające transfery (zatrzymanie daemona) - curl dostaje SIGTERM"""
+        with self.lock:
+            self.aborted = True
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def close(self):
+        pass
+
+
+class CachedDnsConnectionMixin:
+    """Połączenie urllib3 pod adres z DnsCache, z przejściem na kolejny adres przy błędzie.
+
+    Zmienia się tylko adres gniazda - nazwa hosta zostaje w nagłówku Host,
+    SNI i weryfikacji certyfikatu.
+    """
+
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.resolve(host)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (ConnectTimeoutError, NewConnectionError) as e:
+                self.dns_cache.mark_failed(host, address)
+                error = e
+            finally:
+                self._dns_host = host
+        raise error or NameResolutionError(self.host, self, socket.gaierror(socket.EAI_NONAME, "brak adresów"))
+
+
+def cached_dns_adapter(dns_cache, **kwargs):
+    """HTTPAdapter, którego nowe połączenia biorą adresy z DnsCache zamiast pytać DNS"""
+    adapter = HTTPAdapter(**kwargs)
+    pool_classes = {}
+    for scheme, pool_class, connection_class in (('http', HTTPConnectionPool, HTTPConnection),
+                                                 ('https', HTTPSConnectionPool, HTTPSConnection)):
+        connection = type(f"CachedDns{connection_class.__name__}", (CachedDnsConnectionMixin, connection_class),
+                          {"dns_cache": dns_cache})
+        pool_classes[scheme] = type(f"CachedDns{pool_class.__name__}", (pool_class,), {"ConnectionCls": connection})
+    adapter.poolmanager.pool_classes_by_scheme = pool_classes
+    return adapter
+
+
+class HttpEngine:
+    """Wbudowany klient HTTP - jedna sesja requests (pula keep-alive) na host.
+
+    Kolejne odcinki z tego samego serwera Xtream używają już otwartych
+    połączeń TCP/TLS zamiast nawiązywać nowe dla każdego pliku, a nowe
+    połączenia biorą adresy ze wspólnej pamięci DNS (jeśli podano dns_cache).
+    verify=False wyłącza sprawdzanie certyfikatu TLS (jak w download.py -
+    część dostawców IPTV ma błędne certyfikaty).
+    """
+
+    name = 'http'
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, dns_cache=None, verify=True):
+        if requests is None:
+            raise RuntimeError("Biblioteka requests nie jest zainstalowana")
+        self.pool_size = pool_size
+        self.dns_cache = dns_cache
+        self.verify = verify
+        self.sessions = {}
+        self.responses = set()
+        self.lock = threading.Lock()
+        self.aborted = False
+
+    def session_for(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # Ponawianie obsługuje wywołujący (wznawia od offsetu), nie urllib3
+                adapter_options = dict(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+                if self.dns_cache is not None:
+                    adapter = cached_dns_adapter(self.dns_cache, **adapter_options)
+                else:
+                    adapter = HTTPAdapter(**adapter_options)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    'User-Agent': USER_AGENT,
+                    'Accept': '*/*',
+                    # Bez kompresji - offsety Range muszą odpowiadać bajtom pliku
+                    'Accept-Encoding': 'identity',
+                    'Connection': 'keep-alive'
+                })
+                session.max_redirects = 10
+                self.sessions[host] = session
+            return session
+
+    def request(self, url, headers=None):
+        if self.aborted:
+            raise DownloadInterrupted()
+        try:
+            response = self.session_for(url).get(
+                url, headers=headers, stream=True, allow_redirects=True,
+                timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), verify=self.verify
+            )
+        except requests.exceptions.RequestException as e:
+            raise translate_requests_error(e) from e
+        if response.status_code == 416:
+            response.close()
+            raise RangeNotSatisfiable(parse_content_range(response.headers.get('content-range')))
+        if response.status_code >= 400:
+            response.close()
+            raise DownloadError.http(response.status_code, f"HTTP {response.status_code}: {response.reason}")
+        with self.lock:
+            self.responses.add(response)
+        return response
+
+    def probe(self, url):
+        """Rozmiar pliku i obsługa Range (żądanie bytes=0-0)"""
+        try:
+            with self.request(url, {'Range': 'bytes=0-0'}) as r:
+                if r.status_code == 206:
+                    return parse_content_range(r.headers.get('content-range')), True
+                length = r.headers.get('content-length', '')
+                return (int(length) if length.isdigit() else None), False
+        except DownloadError:
+            return None, False
+
+    def fetch(self, url, write, start=0, end=None):
+        """Pobierz bajty od start do end (włącznie, None = do końca) i przekaż je do write()"""
+        rng = range_header(start, end)
+        with self.request(url, {'Range': rng} if rng else None) as r:
+            if rng and r.status_code != 206:
+                raise DownloadError(f"Serwer zignorował nagłówek Range (HTTP {r.status_code})",
+                                    'range', r.status_code, retryable=False)
+            try:
+                for chunk in r.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    if chunk:
+                        write(chunk)
+            except requests.exceptions.RequestException as e:
+                if self.aborted:
+                    raise DownloadInterrupted() from e
+                raise translate_requests_error(e) from e
+            finally:
+                with self.lock:
+                    self.responses.discard(r)
+            if self.aborted and r.raw.length_remaining != 0:
+                # Bez Content-Length zamknięte gniazdo wygląda jak zwykły koniec danych
+                raise DownloadInterrupted()
+
+    def fetch_document(self, url, max_size=DOCUMENT_MAX_SIZE):
+        """Mały dokument w całości (np. playlista HLS) i adres po przekierowaniach"""
+        with self.request(url) as r:
+            data = bytearray()
+            try:
+                for chunk in r.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > max_size:
+                        raise DownloadError(f"Dokument większy niż {max_size} B", 'protocol', retryable=False)
+            except requests.exceptions.RequestException as e:
+                if self.aborted:
+                    raise DownloadInterrupted() from e
+                raise translate_requests_error(e) from e
+            finally:
+                with self.lock:
+                    self.responses.discard(r)
+            return bytes(data), r.url
+
+    def abort(self):
+        """Przerwij wszystkie trwające transfery (zatrzymanie daemona).
+
+        Samo zamknięcie odpowiedzi nie budzi wątku czekającego w recv() -
+        shutdown() gniazda tak, więc odczyt kończy się od razu zamiast po
+        HTTP_READ_TIMEOUT.
+        """
+        with self.lock:
+            self.aborted = True
+            responses = list(self.responses)
+        for response in responses:
+            connection = getattr(response.raw, '_connection', None)
+            sock = getattr(connection, 'sock', None)
+            try:
+                if sock is not None:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+
+def translate_requests_error(error):
+    """Zamień wyjątek requests na DownloadError"""
+    if isinstance(error, requests.exceptions.SSLError):
+        return DownloadError(str(error), 'tls')
+    if isinstance(error, (requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout,
+                          requests.exceptions.Timeout)):
+        return DownloadError(str(error), 'timeout')
+    if isinstance(error, requests.exceptions.ConnectionError):
+        text = str(error)
+        if 'Name or service not known' in text or 'NameResolutionError' in text or 'getaddrinfo' in text:
+            return DownloadError(text, 'dns')
+        return DownloadError(text, 'connect')
+    return DownloadError(str(error), 'protocol')
+
+
+def create_engine(name=DOWNLOAD_ENGINE, dns_cache=None):
+    """Silnik o podanej nazwie; bez requests zawsze curl"""
+    if name == 'http' and requests is not None:
+        return HttpEngine(dns_cache=dns_cache)
+    return CurlEngine(dns_cache=dns_cache)
+
+
+def timed_fetch(engine, url, write, start=0, end=None):
+    """fetch() z pomiarem czasu do pierwszego bajtu i przepustowości (do benchmarków i logów)"""
+    stats = {"first_byte": None, "bytes": 0}
+    started = time.perf_counter()
+
+    def timed_write(chunk):
+        if stats["first_byte"] is None:
+            stats["first_byte"] = time.perf_counter() - started
+        stats["bytes"] += len(chunk)
+        write(chunk)
+
+    engine.fetch(url, timed_write, start, end)
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
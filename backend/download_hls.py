@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# download_hls.py - Pobieranie strumieni HLS (m3u8): wybór wariantu, równoległe segmenty, zapis po kolei do jednego pliku
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from urllib.parse import urljoin, urlparse
+
+from download_engines import DownloadError, DownloadInterrupted
+from download_validation import (PREVIEW_LENGTH, SNIFF_BYTES, VALIDATE_CONTENT, InvalidContentError,
+                                 StreamValidator, looks_like_playlist, looks_like_text)
+from download_writer import CHECKPOINT_INTERVAL, FileWriter
+
+# Ile segmentów pobierać naraz. Każdy to osobne połączenie do dostawcy poza limitem DOWNLOAD_MAX_PER_HOST
+# (liczy zadania) - jak SEGMENT_CONNECTIONS domyślnie 1, więcej tylko przy koncie z większym limitem połączeń
+HLS_CONCURRENCY = int(os.environ.get("DOWNLOAD_HLS_CONCURRENCY", "1"))
+# Ile segmentów może czekać w pamięci na zapis (pobrane albo w drodze) na jeden wątek pobierający -
+# pamięć zależy od okna, nie od długości playlisty
+HLS_WINDOW_PER_WORKER = 2
+# Ponowienia pojedynczego segmentu, zanim błąd przerwie całe pobieranie
+HLS_SEGMENT_RETRIES = int(os.environ.get("DOWNLOAD_HLS_SEGMENT_RETRIES", "3"))
+HLS_RETRY_DELAY = 2.0
+# Najwyższa przepływność wariantu w b/s (0 = najlepszy dostępny)
+HLS_MAX_BANDWIDTH = int(os.environ.get("DOWNLOAD_HLS_MAX_BANDWIDTH", "0"))
+# Co ile sekund wątek zapisujący sprawdza anulowanie, czekając na wolny segment
+HLS_WAIT_INTERVAL = 0.5
+# Master -> media; głębsze zagnieżdżenie oznacza pętlę przekierowań dostawcy
+HLS_MAX_NESTING = 3
+# Stan wznawiania (<plik>.hls.json)
+HLS_STATE_SUFFIX = ".hls.json"
+
+PLAYLIST_EXTENSIONS = ('.m3u8', '.m3u')
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def is_hls_url(url):
+    """Adres wskazuje playlistę HLS (po rozszerzeniu ścieżki)"""
+    return urlparse(url).path.lower().endswith(PLAYLIST_EXTENSIONS)
+
+
+def parse_attributes(value):
+    """Lista atrybutów tagu: 'BANDWIDTH=1280000,CODECS="avc1,mp4a"' -> słownik"""
+    return {key: raw[1:-1] if raw.startswith('"') else raw for key, raw in ATTRIBUTE_RE.findall(value)}
+
+
+def make_segment(url, byterange, next_offsets):
+    """Segment {url, start, end}; EXT-X-BYTERANGE bez offsetu zaczyna się za poprzednim zakresem pliku"""
+    if not byterange:
+        return {"url": url, "start": 0, "end": None}
+    length, _, offset = byterange.partition('@')
+    start = int(offset) if offset else next_offsets.get(url, 0)
+    next_offsets[url] = start + int(length)
+    return {"url": url, "start": start, "end": start + int(length) - 1}
+
+
+def parse_playlist(text, base_url):
+    """Playlista master albo media -> {"variants", "segments", "ended"}.
+
+    Względne adresy są rozwiązywane względem base_url (adresu po
+    przekierowaniach). Tagi bez znaczenia dla sklejania strumienia
+    (EXTINF, DISCONTINUITY, PROGRAM-DATE-TIME) są pomijane. Alternatywne
+    ścieżki audio (EXT-X-MEDIA) nie są dołączane - Xtream wysyła TS z
+    dźwiękiem w tym samym strumieniu.
+    """
+    lines = [line.strip() for line in text.lstrip('\ufeff').splitlines()]
+    if not lines or not lines[0].startswith('#EXTM3U'):
+        raise InvalidContentError(f"Zamiast playlisty HLS serwer zwrócił: {text[:PREVIEW_LENGTH].strip()}")
+
+    variants, segments = [], []
+    variant = None
+    byterange = None
+    encryption = None
+    init_segment = None
+    next_offsets = {}
+    ended = False
+    for line in lines[1:]:
+        if not line:
+            continue
+        if line.startswith('#'):
+            tag, _, value = line.partition(':')
+            if tag == '#EXT-X-STREAM-INF':
+                variant = parse_attributes(value)
+            elif tag == '#EXT-X-BYTERANGE':
+                byterange = value
+            elif tag == '#EXT-X-KEY':
+                method = parse_attributes(value).get('METHOD', 'NONE')
+                encryption = None if method == 'NONE' else method
+            elif tag == '#EXT-X-MAP':
+                # Segment inicjujący fMP4 - zapisywany raz, przed segmentami, których dotyczy
+                attributes = parse_attributes(value)
+                segment = make_segment(urljoin(base_url, attributes['URI']), attributes.get('BYTERANGE'), {})
+                if segment != init_segment:
+                    init_segment = segment
+                    segments.append(segment)
+            elif tag == '#EXT-X-ENDLIST':
+                ended = True
+            continue
+
+        url = urljoin(base_url, line)
+        if variant is not None:
+            variants.append(dict(variant, url=url))
+            variant = None
+            continue
+        if encryption:
+            raise DownloadError(f"Szyfrowana playlista HLS ({encryption}) nie jest obsługiwana",
+                                'protocol', retryable=False)
+        segments.append(make_segment(url, byterange, next_offsets))
+        byterange = None
+    return {"variants": variants, "segments": segments, "ended": ended}
+
+
+def variant_bandwidth(variant):
+    try:
+        return int(variant.get('BANDWIDTH', 0))
+    except ValueError:
+        return 0
+
+
+def choose_variant(variants, max_bandwidth=HLS_MAX_BANDWIDTH):
+    """Najlepszy wariant nie przekraczający max_bandwidth (a gdy żaden się nie mieści - najsłabszy)"""
+    allowed = [v for v in variants if not max_bandwidth or variant_bandwidth(v) <= max_bandwidth]
+    if allowed:
+        return max(allowed, key=variant_bandwidth)
+    return min(variants, key=variant_bandwidth)
+
+
+def describe_variant(variant):
+    bandwidth = variant_bandwidth(variant)
+    parts = [variant.get('RESOLUTION'), f"{bandwidth / 1000000:.1f} Mb/s" if bandwidth else None]
+    return ", ".join(part for part in parts if part) or variant["url"]
+
+
+class HlsState:
+    """Postęp pobierania HLS zapisywany obok pliku: ile segmentów jest na dysku, ich rozmiar i CRC32.
+
+    Po przerwaniu (także po restarcie procesu) playlista jest pobierana od
+    nowa - adresy segmentów Xtream zawierają tokeny ważne krótko - a zapis
+    rusza od pierwszego brakującego segmentu, o ile playlista ma tyle samo
+    segmentów co wcześniej.
+    """
+
+    def __init__(self, output_path, url, segment_count):
+        self.output_path = output_path
+        self.path = output_path + HLS_STATE_SUFFIX
+        self.url = url
+        self.segment_count = segment_count
+        self.done = 0
+        self.position = 0
+        self.checksum = None
+        self.saved_at = 0.0
+
+    @classmethod
+    def load(cls, output_path, url, segment_count):
+        state = cls(output_path, url, segment_count)
+        try:
+            file_size = os.path.getsize(output_path)
+            with open(state.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return state
+        if data.get("url") == url and data.get("segments") == segment_count and \
+                int(data.get("position", 0)) <= file_size:
+            state.done = int(data.get("done", 0))
+            state.position = int(data.get("position", 0))
+            state.checksum = data.get("crc32")
+        return state
+
+    def save(self, done=None, position=None, checksum=None, force=False):
+        if done is not None:
+            self.done = done
+            self.position = position
+            self.checksum = checksum
+        now = time.monotonic()
+        if not force and now - self.saved_at < CHECKPOINT_INTERVAL:
+            return
+        self.saved_at = now
+        data = {"url": self.url, "segments": self.segment_count, "done": self.done,
+                "position": self.position, "crc32": self.checksum}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # Bez stanu kolejna próba zacznie od początku
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def check_segment(data):
+    """Segment z treścią tekstową to strona błędu (np. wygasły token) - warto go pobrać ponownie"""
+    if not data:
+        raise InvalidContentError("Pusty segment HLS", retryable=True)
+    head = bytes(data[:SNIFF_BYTES])
+    if VALIDATE_CONTENT and (looks_like_playlist(head) or looks_like_text(head)):
+        preview = head[:PREVIEW_LENGTH].decode('utf-8', 'replace').strip()
+        raise InvalidContentError(f"Segment HLS zawiera tekst zamiast wideo: {preview}", retryable=True)
+
+
+class HlsDownloader:
+    """Pobieranie strumienia HLS do jednego pliku.
+
+    Segmenty pobiera concurrency wątków, a wątek wywołujący zapisuje je
+    ściśle po kolei, strumieniowo (FileWriter, weryfikacja i CRC32 w locie).
+    W pamięci jest najwyżej okno concurrency * HLS_WINDOW_PER_WORKER
+    segmentów - kolejne są zlecane dopiero, gdy pierwszy z okna trafi na
+    dysk. Silnik musi udostępniać fetch() i fetch_document() (HttpEngine,
+    CurlEngine).
+
+    on_data(chunk) jest wołane w wątkach pobierających dla każdej porcji
+    (limit przepustowości), check() przy każdej porcji i co HLS_WAIT_INTERVAL
+    w wątku zapisującym (anulowanie) - wyjątek z nich przerywa pobieranie,
+    także gdy segment utknął na wolnym serwerze. log(message, level).
+    """
+
+    def __init__(self, engine, url, output_path, concurrency=HLS_CONCURRENCY, on_data=None, check=None, log=None):
+        self.engine = engine
+        self.url = url
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.window = self.concurrency * HLS_WINDOW_PER_WORKER
+        self.on_data = on_data
+        self.check = check or (lambda: None)
+        self.log = log or (lambda message, level='INFO': None)
+        self.stopped = threading.Event()
+
+    def load_playlist(self):
+        """Playlista media z segmentami (z master wybierany jest wariant)"""
+        url = self.url
+        for _ in range(HLS_MAX_NESTING):
+            data, final_url = self.engine.fetch_document(url)
+            playlist = parse_playlist(data.decode('utf-8', 'replace'), final_url)
+            if not playlist["variants"]:
+                break
+            variant = choose_variant(playlist["variants"])
+            self.log(f"Wariant HLS: {describe_variant(variant)} (dostępnych: {len(playlist['variants'])})")
+            url = variant["url"]
+        else:
+            raise DownloadError("Zbyt głęboko zagnieżdżone playlisty HLS", 'protocol', retryable=False)
+        if not playlist["ended"]:
+            raise DownloadError("Playlista HLS bez #EXT-X-ENDLIST (transmisja na żywo) - nie da się pobrać w całości",
+                                'protocol', retryable=False)
+        if not playlist["segments"]:
+            raise DownloadError("Playlista HLS nie zawiera segmentów", 'protocol', retryable=False)
+        return playlist
+
+    def fetch_segment(self, index, segment):
+        """Cały segment w pamięci, z ponowieniami (wątek pobierający)"""
+        for attempt in range(HLS_SEGMENT_RETRIES + 1):
+            data = bytearray()
+
+            def write(chunk):
+                if self.stopped.is_set():
+                    raise DownloadInterrupted()
+                self.check()
+                if self.on_data is not None:
+                    self.on_data(chunk)
+                data.extend(chunk)
+
+            try:
+                self.engine.fetch(segment["url"], write, segment["start"], segment["end"])
+                check_segment(data)
+                return data
+            except (DownloadError, InvalidContentError) as e:
+                if self.stopped.is_set() or isinstance(e, DownloadInterrupted) or \
+                        not getattr(e, 'retryable', False) or attempt == HLS_SEGMENT_RETRIES:
+                    raise
+                self.log(f"Segment {index + 1}: {e} - ponawiam ({attempt + 1}/{HLS_SEGMENT_RETRIES})",
+                         'WARNING')
+                self.stopped.wait(HLS_RETRY_DELAY * (attempt + 1))
+
+    def wait_for(self, future):
+        while True:
+            self.check()
+            try:
+                return future.result(timeout=HLS_WAIT_INTERVAL)
+            except FuturesTimeout:
+                pass
+
+    def run(self, on_segment=None):
+        """Pobierz wszystkie segmenty; on_segment(zapisane_bajty, segmenty_gotowe, segmenty_razem)
+        po zapisaniu każdego. Zwraca podsumowanie jak StreamValidator.finish() plus liczbę segmentów."""
+        segments = self.load_playlist()["segments"]
+        state = HlsState.load(self.output_path, self.url, len(segments))
+        validator = StreamValidator(None, state.position, state.checksum)
+        if state.done:
+            self.log(f"Wznawiam HLS od segmentu {state.done + 1}/{len(segments)} ({state.position} B)")
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="hls")
+        pending = {}
+        next_index = state.done
+        try:
+            with FileWriter(self.output_path, offset=state.position) as f:
+                for index in range(state.done, len(segments)):
+                    while next_index < len(segments) and next_index < index + self.window:
+                        pending[next_index] = executor.submit(self.fetch_segment, next_index, segments[next_index])
+                        next_index += 1
+                    data = self.wait_for(pending.pop(index))
+                    validator.feed(data)
+                    f.write(data)
+                    state.save(index + 1, validator.position, validator.crc)
+                    if on_segment is not None:
+                        on_segment(validator.position, index + 1, len(segments))
+        except BaseException:
+            # Wątki pobierające kończą się na najbliższej porcji; stan wskazuje ostatni cały segment
+            self.stopped.set()
+            state.save(force=True)
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        state.remove()
+        summary = validator.finish()
+        summary["segments"] = len(segments)
+        return summary
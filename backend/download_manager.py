@@ -11,29 +11,318 @@ import time
 import json
 from urllib.parse import urlparse
 import signal
+from collections import deque
 from contextlib import contextmanager
 
+from download_bandwidth import BandwidthLimiter, parse_rate, parse_schedule
+from download_dedup import DEDUP_ENABLED, REUSE_CANDIDATES, InflightJobs, detach_hardlink, link_file, same_file
+from download_dns import DnsCache
+from download_engines import (CurlEngine, DownloadCancelled, DownloadError, DownloadInterrupted, RangeNotSatisfiable,
+                              create_engine, timed_fetch)
+from download_hls import HLS_STATE_SUFFIX, HlsDownloader, is_hls_url
+from download_metrics import METRICS, METRICS_ADDRESS, MetricsServer, TimedConnection
+from download_progress import TransferProgress, format_progress
+from download_retry import DOWNLOAD_MAX_ATTEMPTS, CircuitBreaker, is_host_failure, retry_delay
+from download_rpc import RPC_SOCKET_PATH, RpcError, RpcServer, connect as connect_rpc
+from download_segments import STATE_SUFFIX, SegmentState, run_segments, use_segments
+from download_validation import SNIFF_BYTES, PlaylistResponse, StreamValidator, check_head
+from download_volumes import (MAX_JOBS_PER_VOLUME, NO_SPACE_RETRY_DELAY, STATVFS_CACHE_TTL, InsufficientSpace,
+                              VolumeSpace, is_no_space, space_needed)
+from download_writer import CHECKPOINT_INTERVAL, CHECKPOINT_SUFFIX, ResumeCheckpoint
+
 # --- Konfiguracja ---
-DATABASE_PATH = "/app/config/database.sqlite"
-DOWNLOAD_LOG_FILE = "/app/config/downloads.log"
+DATABASE_PATH = os.environ.get("DOWNLOAD_DB_PATH", "/app/config/database.sqlite")
+DOWNLOAD_LOG_FILE = os.environ.get("DOWNLOAD_LOG_FILE", "/app/config/downloads.log")
+
+# SQLite: WAL pozwala czytać status (Node) bez blokowania zapisów workerów
+DB_BUSY_TIMEOUT_MS = 30000
+DB_SYNCHRONOUS = "NORMAL"
+DB_STATEMENT_CACHE = 128
+
+# Pula workerów: globalny limit równoległych pobrań i limit połączeń na host Xtream
+# (dostawcy blokują konta otwierające zbyt wiele połączeń)
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "3"))
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("DOWNLOAD_MAX_PER_HOST", "1"))
+
+# Pobieranie zadań prosto z bazy: jak często sprawdzać PRAGMA data_version
+# (tanie - nie czyta tabel) i ile kandydatów czytać jednym zapytaniem
+INTAKE_POLL_INTERVAL = 0.5
+INTAKE_BATCH_SIZE = 50
+
+# Ile sekund shutdown czeka na workery po przerwaniu transferów. Node po SIGTERM
+# dobija proces po 10 s - stan pobierań musi trafić do bazy i na dysk wcześniej
+SHUTDOWN_TIMEOUT = float(os.environ.get("DOWNLOAD_SHUTDOWN_TIMEOUT", "5"))
+
+# Asynchroniczny zapis logów: bufor w pamięci i zapis paczkami (liczba wpisów lub czas)
+LOG_BUFFER_SIZE = 10000
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 1.0
+
+# Retencja download_logs: usuwane są wpisy starsze niż N dni i ponad N najnowszych
+# na zadanie (0 = bez limitu). Porządki co LOG_COMPACTION_INTERVAL sekund, małymi
+# transakcjami z przerwami - zapisujący (workery, Node) wchodzą między paczki
+LOG_RETENTION_DAYS = int(os.environ.get("DOWNLOAD_LOG_RETENTION_DAYS", "30"))
+LOG_MAX_ROWS_PER_JOB = int(os.environ.get("DOWNLOAD_LOG_MAX_ROWS_PER_JOB", "1000"))
+LOG_COMPACTION_INTERVAL = float(os.environ.get("DOWNLOAD_LOG_COMPACTION_INTERVAL", "3600"))
+LOG_COMPACTION_START_DELAY = 60.0
+LOG_COMPACTION_BATCH = 1000
+LOG_COMPACTION_PAUSE = 0.05
+# Co ile sekund RPC download wysyła klientowi zdarzenie postępu
+RPC_PROGRESS_INTERVAL = 1.0
+# Domyślny i maksymalny rozmiar strony w get_job_log
+LOG_PAGE_SIZE = 100
+LOG_MAX_PAGE_SIZE = 1000
 
 # Upewnij się, że folder config istnieje
 os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
 
+def open_db_connection(path=None):
+    """Nowe połączenie SQLite z trybem WAL, busy_timeout i cache zapytań"""
+    conn = sqlite3.connect(path or DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=DB_STATEMENT_CACHE, check_same_thread=False,
+                           factory=TimedConnection)  # Czas zapisów i COMMIT do metryk
+    conn.row_factory = sqlite3.Row  # Dostęp do kolumn po nazwie
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    return conn
+
+
+def get_host(url):
+    """Klucz hosta dla limitów połączeń (host:port z URL)"""
+    try:
+        return urlparse(url).netloc.lower() or 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+class HostSlots:
+    """Limit równoległych pobrań na host (ta sama klasa liczy też zadania na wolumen docelowy).
+
+    Zadanie, dla którego host nie ma wolnego slotu, jest odkładane i wraca do
+    kolejki dopiero po zwolnieniu slotu - worker nie czeka bezczynnie.
+    Transfery RPC spoza kolejki czekają na slot w swoim wątku (acquire_wait).
+    """
+
+    def __init__(self, per_host):
+        self.per_host = max(1, per_host)
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        self.active = {}
+        self.deferred = {}
+
+    def has_capacity(self, host, pending=0):
+        """Czy host ma wolny slot (pending - zadania już pobrane z bazy, jeszcze nie uruchomione)"""
+        with self.lock:
+            return self.active.get(host, 0) + pending < self.per_host
+
+    def acquire_or_defer(self, host, job):
+        """Zajmij slot dla hosta; jeśli brak wolnych - odłóż zadanie i zwróć False"""
+        with self.lock:
+            if self.active.get(host, 0) < self.per_host:
+                self.active[host] = self.active.get(host, 0) + 1
+                return True
+            self.deferred.setdefault(host, deque()).append(job)
+            return False
+
+    def acquire_wait(self, host, stopped):
+        """Zajmij slot, czekając na jego zwolnienie; False, gdy stopped() przerwie czekanie"""
+        with self.released:
+            while self.active.get(host, 0) >= self.per_host:
+                if stopped():
+                    return False
+                self.released.wait(1.0)
+            self.active[host] = self.active.get(host, 0) + 1
+            return True
+
+    def release(self, host):
+        """Zwolnij slot; zwraca odłożone zadanie dla tego hosta (lub None)"""
+        with self.lock:
+            count = self.active.get(host, 0) - 1
+            if count > 0:
+                self.active[host] = count
+            else:
+                self.active.pop(host, None)
+            self.released.notify_all()
+
+            waiting = self.deferred.get(host)
+            if not waiting:
+                return None
+            job = waiting.popleft()
+            if not waiting:
+                del self.deferred[host]
+            return job
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "active": dict(self.active),
+                "deferred": {host: len(jobs) for host, jobs in self.deferred.items()}
+            }
+
+
+class LogWriter:
+    """Wątek zapisujący logi w tle (plik + tabela download_logs).
+
+    log() tylko wrzuca wpis do ograniczonego bufora i nigdy nie blokuje wątku
+    pobierania - przy przepełnionym buforze wpis jest odrzucany i liczony.
+    Wątek trzyma otwarty plik logu i zapisuje wiersze do bazy jedną
+    transakcją na paczkę.
+    """
+
+    def __init__(self, buffer_size=LOG_BUFFER_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def log(self, message, level='INFO', download_id=None):
+        try:
+            self.buffer.put_nowait((time.time(), level, message, download_id))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        log_file = None
+        conn = None
+        while True:
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    if self.stopping.is_set():
+                        # Przy zamykaniu zabierz bez czekania wszystko co zostało w buforze
+                        batch.append(self.buffer.get_nowait())
+                        continue
+                    timeout = deadline - time.time()
+                    if timeout <= 0:
+                        break
+                    batch.append(self.buffer.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    if log_file is None:
+                        log_file = open(DOWNLOAD_LOG_FILE, 'a', encoding='utf-8')
+                    if conn is None:
+                        conn = open_db_connection()
+                except Exception as e:
+                    print(f"Błąd otwarcia logu: {e}")
+                self.write_batch(batch, log_file, conn)
+
+            if self.stopping.is_set() and self.buffer.empty():
+                break
+
+        if log_file is not None:
+            log_file.close()
+        if conn is not None:
+            conn.close()
+
+    def write_batch(self, batch, log_file, conn):
+        lines = []
+        rows = []
+        for created, level, message, download_id in batch:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+            lines.append(f"[{timestamp}] [{level}] {message}\n")
+            print(f"[{level}] {message}")
+            # Log do bazy (tylko jeśli download_id podane); znacznik czasu w UTC jak CURRENT_TIMESTAMP
+            if download_id:
+                rows.append((download_id, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created)),
+                             level, message))
+
+        if self.dropped:
+            lines.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [WARNING] "
+                         f"Bufor logów pełny - pominięto {self.dropped} wpisów\n")
+            self.dropped = 0
+
+        if log_file is not None:
+            try:
+                log_file.writelines(lines)
+                log_file.flush()
+            except Exception as e:
+                print(f"Błąd zapisu do logu: {e}")
+
+        if rows and conn is not None:
+            try:
+                conn.executemany('''
+                    INSERT INTO download_logs (download_id, timestamp, level, message)
+                    VALUES (?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            except Exception as db_error:
+                print(f"Błąd zapisu logu do bazy: {db_error}")
+
+    def close(self, timeout=10):
+        """Zapisz pozostałe wpisy i zakończ wątek"""
+        self.stopping.set()
+        self.thread.join(timeout=timeout)
+
+
 class DownloadManager:
-    def __init__(self):
+    def __init__(self, workers=DOWNLOAD_WORKERS, max_per_host=MAX_CONNECTIONS_PER_HOST,
+                 max_per_volume=MAX_JOBS_PER_VOLUME):
         self.download_queue = queue.Queue()
-        self.worker_thread = None
+        self.worker_count = max(1, workers)
+        self.worker_threads = []
+        self.worker_states = {}
+        self.worker_states_lock = threading.Lock()
+        self.host_slots = HostSlots(max_per_host)
+        # Limit zadań na dysk docelowy (st_dev) i wolne miejsce z rezerwacjami pobrań w toku
+        self.volume_slots = HostSlots(max_per_volume)
+        self.volume_space = VolumeSpace()
+        # Wolumeny, na których zabrakło miejsca (do logowania zmian) i termin ponownego sprawdzenia
+        self.full_volumes = set()
+        self.space_recheck_due = None
+        # Adresy i odcinki w trakcie pobierania - duplikaty czekają w bazie i biorą gotowy plik
+        self.inflight = InflightJobs()
         self.running = True
+        self.intake_thread = None
+        # Budzi wątek przyjmowania zadań, gdy zwolni się worker lub slot hosta
+        self.intake_wakeup = threading.Event()
+        self.maintenance_thread = None
+        self.maintenance_stop = threading.Event()
+        self.rpc_server = None
+        self.metrics_server = None
+        # Osobne połączenie dla zbierania metryk (scrape przychodzi z różnych wątków HTTP)
+        self.metrics_conn = None
+        # Anulowanie pobieranych zadań (RPC cancel): id zadania -> Event sprawdzany przy każdej porcji
+        self.cancel_events = {}
+        self.cancel_lock = threading.Lock()
+        # Termin najbliższego odłożonego ponowienia (time.monotonic, None = brak)
+        self.retry_due = None
+        # Ostatnio widziana wersja kolejki (download_queue_version) - intake pomija zmiany bazy, które jej nie ruszają
+        self.queue_version_seen = None
+        # Hosty z serią błędów są wstrzymywane, reszta kolejki pracuje dalej
+        self.circuit = CircuitBreaker()
+        self.progress = {}
+        self.progress_lock = threading.Lock()
+        self.bandwidth = BandwidthLimiter()
+        # Wspólna pamięć DNS - kolejne zadania do tego samego dostawcy nie pytają DNS ponownie
+        self.dns_cache = DnsCache()
+        # Silnik pobierania (domyślnie wbudowany HTTP z keep-alive) i curl jako zapas
+        self.engine = create_engine(dns_cache=self.dns_cache)
+        self.fallback_engine = self.engine if self.engine.name == 'curl' else CurlEngine(self.dns_cache)
+        self.db_local = threading.local()
+        self.db_connections = []
+        self.db_connections_lock = threading.Lock()
+        self.log_writer = LogWriter()
         
         # Inicjalizuj bazę danych
         self.init_database()
         
-        # Przywróć zadania z bazy do kolejki
+        # Przywróć zadania przerwane przy poprzednim zatrzymaniu
         self.restore_queue_from_db()
         
-        # Uruchom worker
+        # Uruchom pulę workerów i przyjmowanie nowych zadań z bazy
         self.start_worker()
+        self.start_intake()
+        self.start_maintenance()
+        METRICS.add_collector(self.collect_metrics)
         
         # Obsługa sygnałów dla graceful shutdown
         signal.signal(signal.SIGTERM, self.shutdown)
@@ -41,13 +330,40 @@ class DownloadManager:
 
     @contextmanager
     def get_db_connection(self):
-        """Context manager dla połączeń z bazą danych"""
-        conn = sqlite3.connect(DATABASE_PATH, timeout=30.0)
-        conn.row_factory = sqlite3.Row  # Dostęp do kolumn po nazwie
+        """Połączenie z bazą - jedno długo żyjące połączenie na wątek"""
+        conn = getattr(self.db_local, 'conn', None)
+        if conn is None:
+            conn = open_db_connection()
+            self.db_local.conn = conn
+            with self.db_connections_lock:
+                self.db_connections.append(conn)
         try:
             yield conn
-        finally:
-            conn.close()
+        except Exception:
+            # Połączenie jest współdzielone przez kolejne wywołania - nie zostawiaj otwartej transakcji
+            conn.rollback()
+            raise
+
+    def release_db_connection(self):
+        """Zamknij połączenie bieżącego wątku (wątki krótkotrwałe, np. połączenia RPC)"""
+        conn = getattr(self.db_local, 'conn', None)
+        if conn is None:
+            return
+        self.db_local.conn = None
+        with self.db_connections_lock:
+            if conn in self.db_connections:
+                self.db_connections.remove(conn)
+        conn.close()
+
+    def close_db_connections(self):
+        """Zamknij połączenia wszystkich wątków"""
+        with self.db_connections_lock:
+            connections, self.db_connections = self.db_connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
 
     def init_database(self):
         """Inicjalizacja tabel bazy danych"""
@@ -81,6 +397,30 @@ class DownloadManager:
                     cursor.execute('ALTER TABLE downloads ADD COLUMN worker_status TEXT DEFAULT "queued"')
                     self.log_message("Dodano kolumnę worker_status")
                 
+                if 'priority' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN priority INTEGER DEFAULT 0')
+                    self.log_message("Dodano kolumnę priority")
+                
+                if 'downloaded_bytes' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN downloaded_bytes INTEGER DEFAULT 0')
+                    self.log_message("Dodano kolumnę downloaded_bytes")
+                
+                if 'total_bytes' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN total_bytes INTEGER')
+                    self.log_message("Dodano kolumnę total_bytes")
+                
+                if 'checksum' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN checksum TEXT')
+                    self.log_message("Dodano kolumnę checksum")
+                
+                if 'attempts' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN attempts INTEGER DEFAULT 0')
+                    self.log_message("Dodano kolumnę attempts")
+                
+                if 'retry_at' not in columns:
+                    cursor.execute('ALTER TABLE downloads ADD COLUMN retry_at DATETIME')
+                    self.log_message("Dodano kolumnę retry_at")
+                
                 # Utwórz tabelę logów pobierania jeśli nie istnieje
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS download_logs (
@@ -92,6 +432,11 @@ class DownloadManager:
                         FOREIGN KEY (download_id) REFERENCES downloads(id)
                     )
                 ''')
+                # Log jednego zadania (get_job_log, widok w Node) bez skanowania całej tabeli
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_download_logs_download_id ON download_logs(download_id, id)')
+                
+                self.init_status_counters(cursor)
+                self.init_queue_version(cursor)
                 
                 conn.commit()
                 self.log_message("Baza danych zainicjalizowana")
@@ -99,136 +444,1057 @@ class DownloadManager:
         except Exception as e:
             self.log_message(f"Błąd inicjalizacji bazy: {e}", 'ERROR')
 
+    def init_status_counters(self, cursor):
+        """Indeksy dla zapytań o status i liczniki statusów utrzymywane przez triggery.
+
+        get_status czyta liczniki z download_status_counts zamiast agregować
+        całą historię pobierań przy każdym odpytaniu.
+        """
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_worker_status_added_at ON downloads(worker_status, added_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_added_at ON downloads(added_at)')
+        # Częściowy indeks tylko z oczekujących zadań - kolejność pobierania w claim_jobs
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_downloads_claim ON downloads(priority DESC, added_at, id)
+            WHERE worker_status = 'queued'
+        ''')
+        # Termin najbliższego ponowienia (claim_jobs) i przerwane zadania (start) - bez skanu
+        # wszystkich oczekujących wierszy przy dużej kolejce
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_downloads_retry_at ON downloads(retry_at)
+            WHERE worker_status = 'queued' AND retry_at IS NOT NULL
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_downloads_interrupted ON downloads(worker_status)
+            WHERE download_status = 'interrupted'
+        ''')
+        # Wykrywanie duplikatów (enqueue_jobs, find_reusable_copy) - ten sam adres albo odcinek
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_download_url ON downloads(download_url)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_episode ON downloads(episode_id, stream_type)')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS download_status_counts (
+                worker_status TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Triggery działają też dla zapisów z backendu Node
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_downloads_status_insert AFTER INSERT ON downloads
+            BEGIN
+                INSERT INTO download_status_counts (worker_status, count)
+                VALUES (COALESCE(NEW.worker_status, ''), 1)
+                ON CONFLICT(worker_status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_downloads_status_delete AFTER DELETE ON downloads
+            BEGIN
+                UPDATE download_status_counts SET count = count - 1
+                WHERE worker_status = COALESCE(OLD.worker_status, '');
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_downloads_status_update AFTER UPDATE OF worker_status ON downloads
+            WHEN OLD.worker_status IS NOT NEW.worker_status
+            BEGIN
+                UPDATE download_status_counts SET count = count - 1
+                WHERE worker_status = COALESCE(OLD.worker_status, '');
+                INSERT INTO download_status_counts (worker_status, count)
+                VALUES (COALESCE(NEW.worker_status, ''), 1)
+                ON CONFLICT(worker_status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        
+        # Przelicz liczniki przy starcie (skan indeksu, nie tabeli) - naprawia ewentualny dryf
+        cursor.execute('DELETE FROM download_status_counts')
+        cursor.execute('''
+            INSERT INTO download_status_counts (worker_status, count)
+            SELECT COALESCE(worker_status, ''), COUNT(*) FROM downloads GROUP BY worker_status
+        ''')
+
+    def init_queue_version(self, cursor):
+        """Licznik zmian kolejki utrzymywany przez triggery (także dla zapisów z backendu Node).
+
+        PRAGMA data_version zmienia się po każdym zapisie innego połączenia -
+        również logów i postępu z wątków daemona. Wersja rośnie tylko przy
+        zmianach, po których może się pojawić zadanie do podjęcia: nowe
+        oczekujące zadanie, przejście do / z 'queued', zmiana priorytetu,
+        terminu ponowienia albo adresu / ścieżki oczekującego zadania.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS download_queue_version (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO download_queue_version (id, version) VALUES (0, 0)')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_downloads_queue_insert AFTER INSERT ON downloads
+            WHEN NEW.worker_status = 'queued'
+            BEGIN
+                UPDATE download_queue_version SET version = version + 1 WHERE id = 0;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_downloads_queue_update
+            AFTER UPDATE OF worker_status, priority, retry_at, download_url, filepath ON downloads
+            WHEN NEW.worker_status = 'queued' OR OLD.worker_status = 'queued'
+            BEGIN
+                UPDATE download_queue_version SET version = version + 1 WHERE id = 0;
+            END
+        ''')
+
+    def read_queue_version(self, conn):
+        """Bieżąca wersja kolejki (None - brak tabeli, np. baza bez tabeli downloads)"""
+        try:
+            row = conn.execute('SELECT version FROM download_queue_version WHERE id = 0').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row is not None else None
+
     def restore_queue_from_db(self):
-        """Przywróć zadania z bazy do kolejki w pamięci"""
+        """Przywróć zadania przerwane przy poprzednim zatrzymaniu (downloading -> queued).
+
+        Same zadania nie trafiają tu do pamięci - pobiera je z bazy wątek
+        przyjmowania zadań (claim_jobs). Pobieranie wznawia się od stanu na
+        dysku (punkt kontrolny / stan segmentów), nie od zera; zadania
+        zatrzymane przez shutdown mają już status 'interrupted', a te po
+        twardym zabiciu procesu (wciąż 'downloading') dostają go tutaj.
+        """
         try:
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
-                
                 cursor.execute('''
-                    SELECT * FROM downloads 
-                    WHERE worker_status IN ('queued', 'downloading')
-                    ORDER BY added_at ASC
+                    UPDATE downloads SET worker_status = 'queued', download_status = 'interrupted'
+                    WHERE worker_status = 'downloading'
                 ''')
-                
-                pending_downloads = cursor.fetchall()
-                
-                for download in pending_downloads:
-                    # Resetuj status na queued po restarcie
-                    cursor.execute('UPDATE downloads SET worker_status = "queued" WHERE id = ?', (download['id'],))
-                    
-                    # Sprawdź czy mamy potrzebne dane
-                    if download['download_url'] and download['filepath']:
-                        job = {
-                            'db_id': download['id'],
-                            'item_id': download['episode_id'],
-                            'url': download['download_url'],
-                            'output_path': download['filepath'],
-                            'title': download['filename'] or 'Unknown',
-                            'item_type': download['stream_type']
-                        }
-                        self.download_queue.put(job)
-                    
+                restored = cursor.rowcount
+                cursor.execute('''
+                    SELECT COUNT(*), COALESCE(SUM(downloaded_bytes), 0) FROM downloads
+                    WHERE worker_status = 'queued' AND download_status = 'interrupted'
+                ''')
+                interrupted, bytes_done = cursor.fetchone()
                 conn.commit()
-                self.log_message(f"Przywrócono {len(pending_downloads)} zadań do kolejki")
+                self.log_message(f"Przywrócono {restored} przerwanych zadań do kolejki; "
+                                 f"{interrupted} do wznowienia ({bytes_done / 1024 / 1024:.1f} MB już pobrane)")
                 
         except Exception as e:
             self.log_message(f"Błąd przywracania kolejki: {e}", 'ERROR')
 
-    def log_message(self, message, level='INFO', download_id=None):
-        """Zapisz wiadomość do logu (plik + baza)"""
-        try:
-            # Log do pliku
-            with open(DOWNLOAD_LOG_FILE, 'a', encoding='utf-8') as f:
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                f.write(f"[{timestamp}] [{level}] {message}\n")
-            
-            # Log do bazy (tylko jeśli download_id podane)
-            if download_id:
-                try:
-                    with self.get_db_connection() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            INSERT INTO download_logs (download_id, level, message)
-                            VALUES (?, ?, ?)
-                        ''', (download_id, level, message))
-                        conn.commit()
-                except Exception as db_error:
-                    print(f"Błąd zapisu logu do bazy: {db_error}")
+    def claim_jobs(self, capacity):
+        """Pobierz z bazy do capacity oczekujących zadań i oznacz je atomowo jako pobierane.
+
+        Kandydaci są czytani w kolejności priorytetu z częściowego indeksu
+        (INDEXED BY - bez statystyk ANALYZE planer wybiera indeks worker_status
+        i sortuje całą kolejkę, co przy dziesiątkach tysięcy zadań trwa);
+        zadania hostów bez wolnego slotu lub z otwartym bezpiecznikiem oraz
+        ponowienia przed terminem (retry_at) zostają w bazie na później.
+        Tak samo duplikaty (ten sam adres albo odcinek) zadań właśnie
+        pobieranych - po ich zakończeniu wezmą gotowy plik zamiast transferu -
+        oraz zadania dysków bez wolnego slotu albo bez miejsca na brakującą
+        część pliku.
+        """
+        claimed = []
+        pending_hosts = {}
+        pending_volumes = {}
+        self.space_recheck_due = None
+        with self.get_db_connection() as conn:
+            # Wersja sprzed odczytu kandydatów; każde przejęte zadanie podbija ją o jeden (trigger),
+            # więc własne zmiany nie wywołają kolejnego przebiegu, a cudze tak
+            queue_version = self.read_queue_version(conn)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, episode_id, download_url, filepath, filename, stream_type, attempts,
+                    total_bytes, downloaded_bytes,
+                    (julianday('now') - julianday(COALESCE(retry_at, added_at))) * 86400 AS waited
+                FROM downloads INDEXED BY idx_downloads_claim
+                WHERE worker_status = 'queued'
+                AND download_url IS NOT NULL AND filepath IS NOT NULL
+                AND (retry_at IS NULL OR retry_at <= datetime('now'))
+                ORDER BY priority DESC, added_at ASC, id ASC
+                LIMIT ?
+            ''', (INTAKE_BATCH_SIZE,))
+            candidates = cursor.fetchall()
             
-            print(f"[{level}] {message}")
+            for download in candidates:
+                if len(claimed) >= capacity:
+                    break
+                host = get_host(download['download_url'])
+                if not self.host_slots.has_capacity(host, pending_hosts.get(host, 0)) or \
+                        not self.circuit.available(host):
+                    continue
+                keys = self.inflight.keys(download['download_url'], download['stream_type'], download['episode_id'])
+                if DEDUP_ENABLED and self.inflight.busy(keys):
+                    continue
+                volume = self.volume_space.volume(download['filepath'])
+                if not self.volume_slots.has_capacity(volume, pending_volumes.get(volume, 0)):
+                    continue
+                needed = max(0, (download['total_bytes'] or 0) - (download['downloaded_bytes'] or 0))
+                if not self.volume_has_space(download['filepath'], volume, needed):
+                    continue
+                
+                # Warunek na worker_status sprawia, że zadanie przejmie tylko jeden proces
+                cursor.execute('''
+                    UPDATE downloads SET worker_status = 'downloading', download_status = 'downloading'
+                    WHERE id = ? AND worker_status = 'queued'
+                ''', (download['id'],))
+                if cursor.rowcount != 1:
+                    continue
+                if queue_version is not None:
+                    queue_version += 1
+                
+                pending_hosts[host] = pending_hosts.get(host, 0) + 1
+                pending_volumes[volume] = pending_volumes.get(volume, 0) + 1
+                self.inflight.add(keys)
+                probe = self.circuit.on_claim(host)
+                if download['waited'] is not None:
+                    METRICS.queue_wait.observe(max(0.0, download['waited']))
+                claimed.append({
+                    'db_id': download['id'],
+                    'item_id': download['episode_id'],
+                    'url': download['download_url'],
+                    'output_path': download['filepath'],
+                    'title': download['filename'] or 'Unknown',
+                    'item_type': download['stream_type'],
+                    'attempts': download['attempts'] or 0,
+                    'volume': volume,
+                    'probe': probe
+                })
+            conn.commit()
+            self.queue_version_seen = queue_version
             
-        except Exception as e:
-            print(f"Błąd zapisu do logu: {e}")
-            print(f"[{level}] {message}")  # Przynajmniej wyświetl w konsoli
+            # Kiedy wypada najbliższe odłożone ponowienie - wtedy intake sprawdzi bazę sam z siebie
+            cursor.execute('''
+                SELECT (julianday(MIN(retry_at)) - julianday('now')) * 86400
+                FROM downloads INDEXED BY idx_downloads_retry_at
+                WHERE worker_status = 'queued' AND retry_at > datetime('now')
+            ''')
+            seconds = cursor.fetchone()[0]
+            self.retry_due = time.monotonic() + max(0.0, seconds) if seconds is not None else None
+        return claimed
 
-    def download_with_curl(self, url, output_path, download_id, retries=3):
-        """Pobierz plik używając curl"""
-        for attempt in range(retries):
+    def volume_has_space(self, path, volume, needed=0):
+        """Sprawdzenie miejsca przy przyjmowaniu zadania; pełny wolumen jest logowany raz i sprawdzany ponownie"""
+        if self.volume_space.has_space(path, needed):
+            if volume in self.full_volumes:
+                self.full_volumes.discard(volume)
+                self.log_message(f"💾 Na {self.volume_space.mount(volume)} znów jest miejsce - wznawiam zadania",
+                                 'SUCCESS')
+            return True
+        # Zwolnienie miejsca nie zmienia bazy - intake sprawdzi wolumen sam po czasie ważności statvfs
+        self.space_recheck_due = time.monotonic() + STATVFS_CACHE_TTL
+        if volume not in self.full_volumes:
+            self.full_volumes.add(volume)
+            self.log_message(f"💾 Za mało miejsca na {self.volume_space.mount(volume)} - "
+                             f"zadania tego dysku czekają w kolejce", 'WARNING')
+        return False
+
+    def intake_worker(self):
+        """Przyjmowanie zadań z bazy bez restartu daemona.
+
+        Zamiast odpytywać tabelę w pętli wątek sprawdza PRAGMA data_version
+        (zmienia się po zapisie innego połączenia, np. backendu Node), a po
+        jej zmianie wersję kolejki z download_queue_version - zapisy logów
+        i postępu z wątków daemona nie zmieniają tej drugiej. Kandydaci są
+        czytani tylko po zmianie kolejki, zwolnieniu workera, w terminie
+        odłożonego ponowienia, gdy wstrzymany host może przyjąć zadanie próbne
+        albo gdy trzeba ponownie sprawdzić miejsce na pełnym dysku.
+        """
+        last_version = None
+        last_pass = 0.0
+        while self.running:
             try:
-                self.log_message(f"Próba {attempt + 1}/{retries}: {os.path.basename(output_path)}", 
-                               download_id=download_id)
+                queue_changed = False
+                with self.get_db_connection() as conn:
+                    version = conn.execute('PRAGMA data_version').fetchone()[0]
+                    if version != last_version:
+                        last_version = version
+                        queue_version = self.read_queue_version(conn)
+                        queue_changed = queue_version is None or queue_version != self.queue_version_seen
+                        self.queue_version_seen = queue_version
                 
-                # Utwórz folder jeśli nie istnieje
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                
-                # Komenda curl
-                cmd = [
-                    'curl',
-                    '--location',  # Podążaj za przekierowaniami
-                    '--fail',  # Zakończ z błędem przy HTTP error
-                    '--retry', '3',  # Retry 3 razy
-                    '--retry-delay', '5',  # Opóźnienie między retry
-                    '--connect-timeout', '30',  # Timeout połączenia
-                    '--max-time', '1800',  # Max czas pobierania (30 min)
-                    '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    '--continue-at', '-',  # Kontynuuj przerwane pobieranie
-                    '--output', output_path,  # Plik wyjściowy
-                    '--progress-bar',  # Pokazuj pasek postępu
-                    url
-                ]
-                
-                # Uruchom curl
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.STDOUT, 
-                    universal_newlines=True
+                woken = self.intake_wakeup.is_set()
+                self.intake_wakeup.clear()
+                now = time.monotonic()
+                retry_due = self.retry_due is not None and now >= self.retry_due
+                space_due = self.space_recheck_due is not None and now >= self.space_recheck_due
+                if queue_changed or woken or retry_due or space_due or \
+                        self.circuit.reopened_since(last_pass):
+                    last_pass = now
+                    with self.worker_states_lock:
+                        busy = sum(1 for state in self.worker_states.values() if state["state"] == 'downloading')
+                    capacity = self.worker_count - busy - self.download_queue.qsize()
+                    if capacity > 0:
+                        for job in self.claim_jobs(capacity):
+                            self.download_queue.put(job)
+            except Exception as e:
+                self.log_message(f"❌ Błąd przyjmowania zadań: {e}", 'ERROR')
+            
+            self.intake_wakeup.wait(INTAKE_POLL_INTERVAL)
+
+    def start_intake(self):
+        """Uruchom wątek przyjmowania zadań z bazy"""
+        if self.intake_thread is None or not self.intake_thread.is_alive():
+            self.intake_thread = threading.Thread(target=self.intake_worker, name="intake", daemon=True)
+            self.intake_thread.start()
+
+    def delete_log_batches(self, sql, params, limit=None):
+        """Wykonuj DELETE paczkami po LOG_COMPACTION_BATCH - każda paczka to osobna, krótka transakcja.
+
+        sql musi przyjmować rozmiar paczki jako ostatni parametr; koniec, gdy
+        paczka nie jest pełna albo usunięto już limit wierszy.
+        """
+        total = 0
+        while self.running and (limit is None or total < limit):
+            batch = LOG_COMPACTION_BATCH if limit is None else min(LOG_COMPACTION_BATCH, limit - total)
+            with self.get_db_connection() as conn:
+                deleted = conn.execute(sql, (*params, batch)).rowcount
+                conn.commit()
+            total += deleted
+            if deleted < batch:
+                break
+            time.sleep(LOG_COMPACTION_PAUSE)
+        return total
+
+    def compact_logs(self):
+        """Usuń z download_logs wpisy starsze niż LOG_RETENTION_DAYS i nadmiarowe wpisy zadań"""
+        removed_by_age = removed_per_job = 0
+        if LOG_RETENTION_DAYS > 0:
+            # Identyfikatory rosną z czasem: paczka to zawsze najstarsze wiersze, więc
+            # zapytanie czyta najwyżej LOG_COMPACTION_BATCH wierszy, a nie całą tabelę
+            removed_by_age = self.delete_log_batches('''
+                DELETE FROM download_logs WHERE id IN (
+                    SELECT id FROM (SELECT id, timestamp FROM download_logs ORDER BY id LIMIT ?2)
+                    WHERE timestamp < datetime('now', ?1)
                 )
-                
-                # Loguj output w czasie rzeczywistym
-                for line in process.stdout:
-                    if line.strip():
-                        # Filtruj progress bar (zbyt verbose)
-                        if not line.startswith('#') and not line.startswith('%'):
-                            self.log_message(f"curl: {line.strip()}", download_id=download_id)
-                
-                process.wait()
-                
-                if process.returncode == 0:
-                    # Sprawdź czy plik faktycznie został pobrany
-                    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                        self.log_message(f"✅ Pobieranie ukończone: {os.path.basename(output_path)}", 
-                                       'SUCCESS', download_id)
-                        return True
-                    else:
-                        self.log_message(f"❌ Plik nie został pobrany lub jest pusty", 
-                                       'ERROR', download_id)
-                else:
-                    self.log_message(f"❌ curl zakończył się z kodem {process.returncode}", 
-                                   'ERROR', download_id)
-                    
+            ''', (f"-{LOG_RETENTION_DAYS} days",))
+        if LOG_MAX_ROWS_PER_JOB > 0:
+            with self.get_db_connection() as conn:
+                # Skan samego indeksu (download_id, id), bez czytania treści logów
+                oversized = conn.execute('''
+                    SELECT download_id, COUNT(*) AS entries FROM download_logs
+                    WHERE download_id IS NOT NULL
+                    GROUP BY download_id HAVING COUNT(*) > ?
+                ''', (LOG_MAX_ROWS_PER_JOB,)).fetchall()
+            for row in oversized:
+                removed_per_job += self.delete_log_batches('''
+                    DELETE FROM download_logs WHERE id IN (
+                        SELECT id FROM download_logs WHERE download_id = ? ORDER BY id LIMIT ?
+                    )
+                ''', (row['download_id'],), limit=row['entries'] - LOG_MAX_ROWS_PER_JOB)
+        if removed_by_age or removed_per_job:
+            self.log_message(f"🧹 Porządki w logach: usunięto {removed_by_age + removed_per_job} wpisów "
+                             f"(starsze niż {LOG_RETENTION_DAYS} dni: {removed_by_age}, "
+                             f"ponad limit na zadanie: {removed_per_job})")
+        return removed_by_age + removed_per_job
+
+    def maintenance_worker(self):
+        """Okresowe porządki w bazie (retencja download_logs) w osobnym wątku"""
+        delay = LOG_COMPACTION_START_DELAY
+        while not self.maintenance_stop.wait(delay):
+            try:
+                self.compact_logs()
             except Exception as e:
-                self.log_message(f"❌ Błąd podczas pobierania (próba {attempt + 1}): {e}", 
-                               'ERROR', download_id)
-                
-            if attempt < retries - 1:
-                wait_time = (attempt + 1) * 5
-                self.log_message(f"Czekam {wait_time}s przed kolejną próbą...", 
-                               'WARNING', download_id)
-                time.sleep(wait_time)
+                self.log_message(f"❌ Błąd porządkowania logów: {e}", 'ERROR')
+            delay = LOG_COMPACTION_INTERVAL
+
+    def start_maintenance(self):
+        """Uruchom wątek porządków w bazie"""
+        if self.maintenance_thread is None or not self.maintenance_thread.is_alive():
+            self.maintenance_thread = threading.Thread(target=self.maintenance_worker, name="maintenance", daemon=True)
+            self.maintenance_thread.start()
+
+    def get_job_log(self, download_id, limit=LOG_PAGE_SIZE, before_id=None, after_id=None):
+        """Strona logu jednego zadania, czytana z indeksu (download_id, id).
+
+        Bez kursora - najnowsze wpisy; before_id - wcześniejsze strony (przewijanie
+        w górę); after_id - wpisy nowsze od ostatnio widzianego (śledzenie jak tail -f).
+        Wpisy są w kolejności chronologicznej; before_id/after_id w wyniku to kursory
+        do kolejnych wywołań (before_id = None, gdy starszych wpisów już nie ma).
+        """
+        limit = max(1, min(int(limit), LOG_MAX_PAGE_SIZE))
+        with self.get_db_connection() as conn:
+            if after_id is not None:
+                rows = conn.execute('''
+                    SELECT id, timestamp, level, message FROM download_logs
+                    WHERE download_id = ? AND id > ? ORDER BY id ASC LIMIT ?
+                ''', (download_id, after_id, limit)).fetchall()
+            else:
+                rows = conn.execute(f'''
+                    SELECT id, timestamp, level, message FROM download_logs
+                    WHERE download_id = ? {'AND id < ?' if before_id is not None else ''}
+                    ORDER BY id DESC LIMIT ?
+                ''', (download_id, before_id, limit) if before_id is not None else (download_id, limit)).fetchall()
+                rows.reverse()
+        entries = [dict(row) for row in rows]
+        return {
+            "download_id": download_id,
+            "entries": entries,
+            "before_id": entries[0]["id"] if entries and (after_id is not None or len(entries) == limit) else None,
+            "after_id": entries[-1]["id"] if entries else after_id,
+            "has_more": after_id is not None and len(entries) == limit,
+        }
+
+    def log_message(self, message, level='INFO', download_id=None):
+        """Zapisz wiadomość do logu (plik + baza) - zapis odbywa się w tle"""
+        self.log_writer.log(message, level, download_id)
+
+    def check_transfer(self, cancel):
+        """Przerwij transfer przy zatrzymaniu daemona albo anulowaniu zadania (wołane przy każdej porcji)"""
+        if not self.running:
+            raise DownloadInterrupted()
+        if cancel is not None and cancel.is_set():
+            raise DownloadCancelled()
+
+    def download_segmented(self, engine, url, state, download_id, progress=None, cancel=None):
+        """Pobierz brakujące segmenty - osobne żądanie Range na każdy zakres bajtów"""
+        def fetch_segment(segment, write):
+            # Początek pliku widzi tylko pierwszy segment - sprawdź format przed zapisem
+            sniff = segment['pos'] == 0
+
+            def limited_write(chunk):
+                nonlocal sniff
+                self.check_transfer(cancel)
+                if sniff:
+                    check_head(bytes(chunk[:SNIFF_BYTES]))
+                    sniff = False
+                self.bandwidth.consume(len(chunk))
+                write(chunk)
+            engine.fetch(url, limited_write, segment['pos'], segment['end'])
+
+        missing = state.missing()
+        self.log_message(f"Pobieranie segmentowe: {len(missing)}/{len(state.segments)} segmentów do pobrania "
+                         f"({state.bytes_done()}/{state.total_size} B gotowe)", download_id=download_id)
+
+        on_data = None
+        saved_at = time.monotonic()
+        if progress is not None:
+            progress.update(state.bytes_done())
+            on_data = progress.add
+
+        def on_tick():
+            nonlocal saved_at
+            if progress is not None:
+                self.report_progress(download_id, progress)
+            # Stan segmentów co kilka sekund - po zabiciu procesu przepada najwyżej ta końcówka
+            if time.monotonic() - saved_at >= CHECKPOINT_INTERVAL:
+                state.save()
+                saved_at = time.monotonic()
+
+        errors = run_segments(state, fetch_segment, on_data=on_data, on_tick=on_tick)
+        stopped = [e for e in errors if isinstance(e, (DownloadCancelled, DownloadInterrupted))]
+        if stopped:
+            # Anulowanie / zatrzymanie daemona - pozostałe błędy segmentów są jego skutkiem
+            raise stopped[0]
+        for error in errors:
+            self.log_message(f"❌ Błąd segmentu: {error}", 'ERROR', download_id)
+        if errors:
+            # Ponowienie ma sens, jeśli choć jeden segment padł z przyczyny przejściowej
+            raise next((e for e in errors if getattr(e, 'retryable', True)), errors[0])
+        return True
+
+    def download_single(self, engine, url, output_path, download_id, progress=None, cancel=None):
+        """Pobierz plik jednym strumieniem, kontynuując od rozmiaru istniejącego pliku.
+
+        Dane są weryfikowane w locie (format, rozmiar, CRC32) - bez ponownego
+        czytania pliku z dysku po zakończeniu. Co CHECKPOINT_INTERVAL sekund
+        liczba zapisanych bajtów i CRC32 trafiają do punktu kontrolnego
+        (<plik>.resume.json), więc po przerwaniu - także po zabiciu procesu -
+        wznowienie zaczyna od nich, z ciągłą sumą kontrolną.
+        """
+        checkpoint = ResumeCheckpoint.load(output_path, url)
+        if os.path.exists(output_path):
+            # Plik bywa prealokowany (download.py) albo ma ogon zapisany po punkcie kontrolnym
+            with open(output_path, 'ab') as f:
+                f.truncate(checkpoint.position)
+        offset = checkpoint.position
+        expected_size = progress.total if progress is not None else None
+        validation = StreamValidator(expected_size, offset, checkpoint.checksum)
+        if progress is not None:
+            progress.update(offset)
+        if offset:
+            self.log_message(f"Wznawiam od {offset} B" + ("" if validation.crc is not None else " (bez sumy kontrolnej)"),
+                             download_id=download_id)
+
+        with open(output_path, 'ab') as f:
+            def write(chunk):
+                self.check_transfer(cancel)
+                validation.feed(chunk)
+                self.bandwidth.consume(len(chunk))
+                f.write(chunk)
+                if progress is not None:
+                    progress.add(len(chunk))
+                    self.report_progress(download_id, progress)
+                if time.monotonic() - checkpoint.saved_at >= CHECKPOINT_INTERVAL:
+                    f.flush()
+                    checkpoint.save(validation.position, validation.crc)
+
+            try:
+                try:
+                    stats = timed_fetch(engine, url, write, offset)
+                except DownloadError as e:
+                    if e.kind != 'range' or not offset:
+                        raise
+                    if isinstance(e, RangeNotSatisfiable) and e.total_size == offset:
+                        # Cały plik jest już na dysku (np. ukończony bez punktu kontrolnego) - jak curl -C -
+                        self.log_message(f"Plik jest już kompletny ({offset} B), nie ma czego pobierać",
+                                         download_id=download_id)
+                        stats = None
+                    else:
+                        # Serwer nie wznawia albo plik na dysku nie pasuje do zdalnego - zacznij od początku
+                        self.log_message(f"Serwer nie wznawia pobierania ({e}), pobieram od zera",
+                                       'WARNING', download_id)
+                        f.truncate(0)
+                        offset = 0
+                        checkpoint.reset()
+                        validation = StreamValidator(expected_size)
+                        if progress is not None:
+                            progress.update(0)
+                        stats = timed_fetch(engine, url, write, 0)
+                # Odrzucony plik (za krótki, zły format) zachowuje punkt kontrolny z sumą do wznowienia
+                summary = validation.finish()
+            except BaseException:
+                # Zapamiętaj, ile bajtów jest na dysku - kolejna próba (albo restart) wznowi od tego miejsca
+                f.flush()
+                position = f.tell()
+                checkpoint.save(position, validation.crc if position == validation.position else None,
+                                force=True)
+                raise
+
+        checkpoint.remove()
+        self.log_message(f"Zweryfikowano: format {summary['container'] or 'niesprawdzony'}, {summary['size']} B, "
+                         f"crc32 {summary['crc32'] or 'nieznane (wznowione bez sumy)'}", download_id=download_id)
+        self.save_checksum(download_id, summary['crc32'])
+
+        if stats is not None and stats["first_byte"] is not None:
+            METRICS.first_byte.observe(stats["first_byte"], engine=engine.name)
+            self.log_message(f"Silnik {engine.name}: pierwszy bajt po {stats['first_byte'] * 1000:.0f} ms, "
+                             f"{stats['bytes'] / max(stats['elapsed'], 0.001) / 1024 / 1024:.1f} MB/s",
+                             download_id=download_id)
+        return True
+
+    def download_hls(self, engine, url, output_path, download_id, progress=None, cancel=None):
+        """Pobierz strumień HLS: segmenty równolegle (HLS_CONCURRENCY), zapis po kolei do jednego pliku.
+
+        Limit przepustowości i anulowanie działają na każdej porcji segmentu,
+        postęp jest szacowany z udziału zapisanych segmentów (rozmiar całości
+        nie jest znany z góry).
+        """
+        def on_data(chunk):
+            self.bandwidth.consume(len(chunk))
+            if progress is not None:
+                progress.add_received(len(chunk))
+
+        def on_segment(written, done, total):
+            if progress is not None:
+                progress.set_total(written * total // done)
+                progress.update(written)
+                self.report_progress(download_id, progress)
+
+        downloader = HlsDownloader(engine, url, output_path, on_data=on_data,
+                                   check=lambda: self.check_transfer(cancel),
+                                   log=lambda message, level='INFO': self.log_message(message, level, download_id))
+        started = time.perf_counter()
+        summary = downloader.run(on_segment)
+        self.log_message(f"Zweryfikowano: format {summary['container'] or 'niesprawdzony'}, {summary['size']} B "
+                         f"w {summary['segments']} segmentach, crc32 {summary['crc32'] or 'nieznane (wznowione bez sumy)'}",
+                         download_id=download_id)
+        self.save_checksum(download_id, summary['crc32'])
+        self.log_message(f"Silnik {engine.name} (HLS): "
+                         f"{summary['size'] / max(time.perf_counter() - started, 0.001) / 1024 / 1024:.1f} MB/s",
+                         download_id=download_id)
+        return True
+
+    def download_with_engine(self, url, output_path, download_id, attempt=0, progress=None, cancel=None):
+        """Jedna próba pobrania pliku (segmentowo, jeśli serwer obsługuje Range; HLS przez download_hls).
+
+        Próby idą przez skonfigurowany silnik, ostatnia przez curl jako zapas.
+        Błąd jest zgłaszany wyjątkiem - o ponowieniu decyduje process_job,
+        który odkłada zadanie do bazy zamiast czekać w wątku workera.
+        Przed zapisem czegokolwiek brakująca część pliku jest rezerwowana na
+        dysku docelowym (InsufficientSpace, gdy się nie mieści).
+        """
+        segment_state = None
+        reservation = None
+        hls = is_hls_url(url)
+        # Plik podpięty z kopii innego zadania - nie nadpisuj jej zawartości
+        detach_hardlink(output_path)
+        try:
+            if hls:
+                # Playlista - rozmiar i Range dotyczą segmentów, nie jej samej
+                total_size, accepts_ranges = None, False
+            else:
+                total_size, accepts_ranges = self.engine.probe(url)
+            if progress is not None and total_size:
+                progress.set_total(total_size)
+            # Także przed prealokacją pliku segmentów
+            reservation = self.volume_space.reserve(output_path, space_needed(output_path, total_size), progress)
+            if use_segments(total_size, accepts_ranges):
+                segment_state = SegmentState.load_or_create(output_path, url, total_size)
+            elif os.path.exists(output_path + STATE_SUFFIX):
+                # Serwer przestał obsługiwać Range - plik z dziurami nie nadaje się do wznowienia
+                os.remove(output_path + STATE_SUFFIX)
+                os.remove(output_path)
+        except InsufficientSpace:
+            raise
+        except Exception as e:
+            self.log_message(f"Sprawdzenie Range nieudane, pobieram jednym strumieniem: {e}",
+                           'WARNING', download_id)
+        if reservation is None:
+            # Rozmiar nieznany - sprawdź przynajmniej zapas wolnego miejsca
+            reservation = self.volume_space.reserve(output_path, 0, progress)
+        try:
+            return self.transfer_file(url, output_path, download_id, attempt, progress, cancel, hls, segment_state)
+        finally:
+            self.volume_space.release(reservation)
+
+    def transfer_file(self, url, output_path, download_id, attempt, progress, cancel, hls, segment_state):
+        """Transfer po sprawdzeniu rozmiaru i rezerwacji miejsca: silnik tej próby, pobranie, kontrola pliku"""
+        engine = self.engine if attempt < DOWNLOAD_MAX_ATTEMPTS - 1 else self.fallback_engine
+        self.log_message(f"Próba {attempt + 1}/{DOWNLOAD_MAX_ATTEMPTS} ({engine.name}): {os.path.basename(output_path)}", 
+                       download_id=download_id)
         
-        return False
+        # Utwórz folder jeśli nie istnieje
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        expected_size = None
+        if hls:
+            self.download_hls(engine, url, output_path, download_id, progress, cancel)
+        elif segment_state is not None:
+            self.download_segmented(engine, url, segment_state, download_id, progress, cancel)
+            expected_size = segment_state.total_size
+        else:
+            try:
+                self.download_single(engine, url, output_path, download_id, progress, cancel)
+            except PlaylistResponse:
+                # Adresy catch-up Xtream często nie kończą się na .m3u8, a zwracają playlistę
+                ResumeCheckpoint(output_path, url).remove()
+                self.log_message("Serwer zwrócił playlistę HLS - pobieram segmenty", download_id=download_id)
+                self.download_hls(engine, url, output_path, download_id, progress, cancel)
+
+        # Sprawdź czy plik faktycznie został pobrany
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0 or \
+                (expected_size is not None and os.path.getsize(output_path) != expected_size):
+            raise DownloadError("Plik nie został pobrany lub jest pusty", 'io')
+        self.log_message(f"✅ Pobieranie ukończone: {os.path.basename(output_path)}", 
+                       'SUCCESS', download_id)
+        return True
+
+    def schedule_retry(self, download_id, attempts, delay, error_message, total_bytes=None):
+        """Odłóż zadanie do bazy z terminem kolejnej próby - worker od razu bierze następne"""
+        try:
+            with self.get_db_connection() as conn:
+                conn.execute('''
+                    UPDATE downloads SET worker_status = 'queued', download_status = 'retrying',
+                        attempts = ?, retry_at = datetime('now', ?), error_message = ?,
+                        total_bytes = COALESCE(?, total_bytes)
+                    WHERE id = ?
+                ''', (attempts, f"+{delay:.1f} seconds", error_message, total_bytes, download_id))
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd odkładania ponowienia: {e}", 'ERROR', download_id)
+            return
+        self.log_message(f"⏳ Kolejna próba ({attempts + 1}/{DOWNLOAD_MAX_ATTEMPTS}) za {delay:.0f}s", 
+                       'WARNING', download_id)
+        # Intake przeliczy termin najbliższego ponowienia
+        self.intake_wakeup.set()
+
+    def release_cancel_event(self, download_id, cancel):
+        with self.cancel_lock:
+            # Zadanie mogło zostać w międzyczasie ponownie zakolejkowane z nowym Event
+            if self.cancel_events.get(download_id) is cancel:
+                del self.cancel_events[download_id]
+
+    def enqueue_jobs(self, items):
+        """Dodaj zadania do kolejki w bazie jedną transakcją; zwraca listę ich id.
+
+        Pozycja: url, path oraz opcjonalnie title, priority, stream_type,
+        episode_id. Pozycja z 'id' kolejkuje ponownie istniejący wiersz (np. po
+        błędzie albo anulowaniu) - url, path i priority zmienia tylko, gdy podane.
+        Nowa pozycja z tą samą ścieżką i adresem (albo odcinkiem) co zadanie
+        oczekujące lub pobierane nie tworzy wiersza - zwracane jest id istniejącego.
+        """
+        ids = []
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for item in items:
+                if item.get('id') is not None:
+                    cursor.execute('''
+                        UPDATE downloads SET worker_status = 'queued', download_status = 'pending',
+                            attempts = 0, retry_at = NULL, error_message = NULL,
+                            download_url = COALESCE(?, download_url), filepath = COALESCE(?, filepath),
+                            priority = COALESCE(?, priority)
+                        WHERE id = ? AND worker_status != 'downloading'
+                    ''', (item.get('url'), item.get('path'), item.get('priority'), item['id']))
+                    if cursor.rowcount != 1:
+                        raise ValueError(f"Zadanie {item['id']} nie istnieje albo jest właśnie pobierane")
+                    with self.cancel_lock:
+                        self.cancel_events.pop(item['id'], None)
+                    ids.append(item['id'])
+                    continue
+                if not item.get('url') or not item.get('path'):
+                    raise ValueError("Zadanie wymaga pól url i path")
+                existing = self.find_active_duplicate(cursor, item)
+                if existing is not None:
+                    ids.append(existing)
+                    continue
+                cursor.execute('''
+                    INSERT INTO downloads (stream_type, episode_id, filename, filepath, download_url,
+                                           priority, status, worker_status, download_status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', 'pending')
+                ''', (item.get('stream_type'), item.get('episode_id'),
+                      item.get('title') or os.path.basename(item['path']), item['path'], item['url'],
+                      item.get('priority') or 0))
+                ids.append(cursor.lastrowid)
+            conn.commit()
+        self.intake_wakeup.set()
+        return ids
+
+    def find_active_duplicate(self, cursor, item):
+        """Id zadania oczekującego lub pobieranego do tej samej ścieżki z tego samego źródła (albo None)"""
+        if not DEDUP_ENABLED:
+            return None
+        # Osobno po każdym indeksie - bez statystyk ANALYZE planer przy OR skanuje całą tabelę
+        row = cursor.execute('''
+            SELECT id FROM downloads INDEXED BY idx_downloads_download_url
+            WHERE download_url = ? AND filepath = ? AND worker_status IN ('queued', 'downloading')
+            UNION ALL
+            SELECT id FROM downloads INDEXED BY idx_downloads_episode
+            WHERE episode_id = ? AND stream_type IS ? AND filepath = ? AND worker_status IN ('queued', 'downloading')
+            LIMIT 1
+        ''', (item['url'], item['path'], item.get('episode_id'), item.get('stream_type'), item['path'])).fetchone()
+        return row[0] if row is not None else None
+
+    def find_reusable_copy(self, url, download_id=None, stream_type=None, episode_id=None):
+        """Ukończony plik z tą samą zawartością (ten sam adres albo odcinek) - słownik z filepath i size albo None.
+
+        Kopia musi istnieć bez stanu częściowego pobrania i mieć rozmiar zapisany
+        w bazie. Gdy adres jest inny (ten sam odcinek z innej playlisty) albo
+        rozmiar nieznany (wiersze z backendu Node), rozmiar porównywany jest
+        jeszcze z rozmiarem zdalnym (probe) - ETagu nie zapisujemy w bazie.
+        """
+        if not DEDUP_ENABLED:
+            return None
+        with self.get_db_connection() as conn:
+            rows = conn.execute('''
+                SELECT id, filepath, download_url, downloaded_bytes, total_bytes, checksum
+                FROM downloads INDEXED BY idx_downloads_download_url
+                WHERE download_url = ? AND worker_status = 'completed' AND filepath IS NOT NULL AND id IS NOT ?
+                UNION
+                SELECT id, filepath, download_url, downloaded_bytes, total_bytes, checksum
+                FROM downloads INDEXED BY idx_downloads_episode
+                WHERE episode_id = ? AND stream_type IS ? AND worker_status = 'completed'
+                AND filepath IS NOT NULL AND id IS NOT ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (url, download_id, episode_id, stream_type, download_id, REUSE_CANDIDATES)).fetchall()
+        remote_size = None
+        for row in rows:
+            path = row['filepath']
+            if any(os.path.exists(path + suffix) for suffix in (CHECKPOINT_SUFFIX, STATE_SUFFIX, HLS_STATE_SUFFIX)):
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            known_size = row['downloaded_bytes'] or row['total_bytes']
+            if not size or (known_size and known_size != size):
+                continue
+            if row['download_url'] != url or not known_size:
+                # Rozmiar playlisty HLS nic nie mówi o pliku wynikowym
+                if is_hls_url(url):
+                    continue
+                if remote_size is None:
+                    try:
+                        remote_size = self.engine.probe(url)[0] or 0
+                    except Exception:
+                        remote_size = 0
+                if remote_size != size:
+                    continue
+            return dict(row, size=size)
+        return None
+
+    def reuse_existing(self, url, output_path, download_id=None, stream_type=None, episode_id=None):
+        """Utwórz output_path z już pobranej kopii (hardlink / reflink / kopia) zamiast transferu.
+
+        Zwraca opis kopii (id, size, checksum, method) albo None, gdy nie ma
+        kopii do użycia lub nie da się jej podpiąć - wtedy plik jest pobierany.
+        """
+        copy = self.find_reusable_copy(url, download_id, stream_type, episode_id)
+        if copy is None:
+            return None
+        if same_file(copy['filepath'], output_path):
+            copy['method'] = 'existing'
+        else:
+            try:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                copy['method'] = link_file(copy['filepath'], output_path)
+            except OSError as e:
+                self.log_message(f"Nie udało się użyć pobranej kopii {copy['filepath']}: {e}", 'WARNING', download_id)
+                return None
+        # Stan przerwanego wcześniej pobierania tego pliku jest już nieaktualny
+        ResumeCheckpoint(output_path, url).remove()
+        for suffix in (STATE_SUFFIX, HLS_STATE_SUFFIX):
+            if os.path.exists(output_path + suffix):
+                os.remove(output_path + suffix)
+        METRICS.reused_bytes.inc(copy['size'], method=copy['method'])
+        self.log_message(f"♻️ Plik już pobrany (zadanie {copy['id']}, {copy['method']}): "
+                         f"{os.path.basename(output_path)}", 'SUCCESS', download_id)
+        return copy
+
+    def complete_reused_job(self, download_id, copy):
+        """Oznacz zadanie jako ukończone plikiem z istniejącej kopii (z jej sumą kontrolną)"""
+        try:
+            with self.get_db_connection() as conn:
+                conn.execute('''
+                    UPDATE downloads SET worker_status = 'completed', download_status = 'completed',
+                        progress = 100, downloaded_bytes = ?, total_bytes = ?, checksum = COALESCE(?, checksum),
+                        error_message = NULL
+                    WHERE id = ?
+                ''', (copy['size'], copy['size'], copy['checksum'], download_id))
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd aktualizacji statusu: {e}", 'ERROR', download_id)
+
+    def cancel_job(self, download_id):
+        """Anuluj zadanie oczekujące albo pobierane; False, gdy nie istnieje lub już się zakończyło"""
+        with self.get_db_connection() as conn:
+            row = conn.execute('SELECT worker_status FROM downloads WHERE id = ?', (download_id,)).fetchone()
+            if row is None or row['worker_status'] not in ('queued', 'downloading'):
+                return False
+            cursor = conn.execute('''
+                UPDATE downloads SET worker_status = 'cancelled', download_status = 'cancelled'
+                WHERE id = ? AND worker_status = ?
+            ''', (download_id, row['worker_status']))
+            conn.commit()
+            if cursor.rowcount != 1:
+                return False
+        if row['worker_status'] == 'downloading':
+            # Worker przerwie transfer przy następnej porcji danych
+            with self.cancel_lock:
+                self.cancel_events.setdefault(download_id, threading.Event()).set()
+        self.log_message("🚫 Zadanie anulowane", 'WARNING', download_id)
+        return True
+
+    def reprioritize_jobs(self, download_ids, priority):
+        """Zmień priorytet zadań (wyższy = wcześniej); zwraca liczbę zmienionych wierszy"""
+        with self.get_db_connection() as conn:
+            cursor = conn.executemany('UPDATE downloads SET priority = ? WHERE id = ?',
+                                      [(priority, download_id) for download_id in download_ids])
+            conn.commit()
+        self.intake_wakeup.set()
+        return cursor.rowcount
+
+    def get_job_status(self, download_id):
+        """Stan jednego zadania z bazy oraz bieżący transfer (prędkość, ETA), jeśli trwa"""
+        with self.get_db_connection() as conn:
+            row = conn.execute('''
+                SELECT id, filename, filepath, download_url, priority, worker_status, download_status,
+                       progress, downloaded_bytes, total_bytes, attempts, retry_at, error_message, checksum
+                FROM downloads WHERE id = ?
+            ''', (download_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Zadanie {download_id} nie istnieje")
+        status = dict(row)
+        with self.progress_lock:
+            progress = self.progress.get(download_id)
+        status["transfer"] = progress.snapshot() if progress is not None else None
+        return status
+
+    def run_transfer(self, url, output_path, progress, cancel):
+        """Pobierz plik poza kolejką w bazie (tryb URL ŚCIEŻKA przez RPC), z ponowieniami w tym wątku.
+
+        Korzysta z silnika, pamięci DNS i limitu przepustowości daemona, ale nie
+        z puli workerów - tak jak dawniej osobny proces curl. Sloty hosta
+        i wolumenu docelowego są te same co dla zadań z kolejki (transfer czeka
+        na wolny), a miejsce na dysku rezerwuje download_with_engine. Plik
+        pobrany już wcześniej z tego adresu jest podpinany zamiast pobierania.
+        """
+        copy = self.reuse_existing(url, output_path)
+        if copy is not None:
+            progress.set_total(copy['size'])
+            progress.update(copy['size'])
+            return progress.snapshot()
+        keys = self.inflight.keys(url)
+        acquired = []
+        try:
+            for slots, key in ((self.host_slots, get_host(url)),
+                               (self.volume_slots, self.volume_space.volume(output_path))):
+                if not slots.acquire_wait(key, lambda: cancel.is_set() or not self.running):
+                    self.check_transfer(cancel)
+                acquired.append((slots, key))
+            self.inflight.add(keys)
+            try:
+                return self.transfer_with_retries(url, output_path, progress, cancel)
+            finally:
+                self.inflight.discard(keys)
+        finally:
+            for slots, key in acquired:
+                self.release_slot(slots, key)
+            self.intake_wakeup.set()
+
+    def release_slot(self, slots, key):
+        """Zwolnij slot hosta albo wolumenu; zadanie odłożone na ten slot wraca do kolejki workerów"""
+        deferred_job = slots.release(key)
+        if deferred_job is not None:
+            self.download_queue.put(deferred_job)
+
+    def transfer_with_retries(self, url, output_path, progress, cancel):
+        for attempt in range(DOWNLOAD_MAX_ATTEMPTS):
+            try:
+                self.download_with_engine(url, output_path, None, attempt, progress, cancel)
+                return progress.snapshot()
+            except Exception as e:
+                if not getattr(e, 'retryable', True) or not self.running or is_no_space(e) or \
+                        attempt + 1 >= DOWNLOAD_MAX_ATTEMPTS:
+                    raise
+                self.log_message(f"❌ Błąd pobierania {os.path.basename(output_path)} "
+                                 f"(próba {attempt + 1}/{DOWNLOAD_MAX_ATTEMPTS}): {e}", 'ERROR')
+                if cancel.wait(retry_delay(attempt + 1)):
+                    raise DownloadCancelled() from e
+
+    def rpc_download(self, params, emit):
+        """RPC download: pobranie pliku ze zdarzeniem postępu co sekundę; rozłączenie klienta anuluje transfer"""
+        url, output_path = params["url"], params["path"]
+        progress = TransferProgress()
+        cancel = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = self.run_transfer(url, output_path, progress, cancel)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                # Wątek transferu żyje tylko na czas pobrania - połączenie z bazy (szukanie kopii) nie może zostać
+                self.release_db_connection()
+
+        thread = threading.Thread(target=run, name="rpc-download", daemon=True)
+        thread.start()
+        try:
+            while True:
+                thread.join(RPC_PROGRESS_INTERVAL)
+                if not thread.is_alive():
+                    break
+                try:
+                    emit("progress", progress=progress.snapshot())
+                except OSError:
+                    # Klient się rozłączył (np. Node zabił proces przy usuwaniu zadania) - nie pobieraj dalej
+                    cancel.set()
+                    raise
+        finally:
+            METRICS.bytes_downloaded.inc(progress.received, host=get_host(url))
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def start_rpc(self, path=RPC_SOCKET_PATH):
+        """Uruchom lokalne RPC (gniazdo Unix) - backend Node zleca pobrania bez uruchamiania Pythona"""
+        methods = {
+            "ping": lambda params, emit: {"pid": os.getpid()},
+            "enqueue": lambda params, emit: {"id": self.enqueue_jobs([params])[0]},
+            "enqueue_batch": lambda params, emit: {"ids": self.enqueue_jobs(params["items"])},
+            "cancel": lambda params, emit: {"cancelled": self.cancel_job(params["id"])},
+            "reprioritize": lambda params, emit: {"updated": self.reprioritize_jobs(
+                params["ids"] if "ids" in params else [params["id"]], params["priority"])},
+            "status": lambda params, emit: (self.get_job_status(params["id"]) if params.get("id") is not None
+                                            else self.get_status()),
+            "log": lambda params, emit: self.get_job_log(params["id"], params.get("limit", LOG_PAGE_SIZE),
+                                                         params.get("before_id"), params.get("after_id")),
+            "download": self.rpc_download,
+            "metrics": lambda params, emit: {"text": METRICS.render()},
+            "set_bandwidth": lambda params, emit: self.set_bandwidth_limit(params["limit"], params.get("schedule")),
+        }
+        self.rpc_server = RpcServer(methods, path, on_close=self.release_db_connection).start()
+        self.log_message(f"🔌 RPC nasłuchuje na {path}")
+
+    def start_metrics(self, address=METRICS_ADDRESS):
+        """Uruchom endpoint /metrics (format tekstowy Prometheusa); pusty adres = wyłączony"""
+        if not address:
+            return
+        self.metrics_server = MetricsServer(address).start()
+        self.log_message(f"📊 Metryki na http://{address}/metrics")
+
+    def collect_metrics(self):
+        """Wartości metryk liczone przy scrape: kolejka z liczników w bazie, workery, bajty na dysku.
+
+        Suma rozmiarów ukończonych plików to jedno zapytanie po indeksie
+        worker_status - przy dziesiątkach tysięcy zadań kilkanaście ms na scrape.
+        """
+        if self.metrics_conn is None:
+            self.metrics_conn = open_db_connection()
+        try:
+            counts = self.metrics_conn.execute('SELECT worker_status, count FROM download_status_counts').fetchall()
+            completed_bytes = self.metrics_conn.execute('''
+                SELECT COALESCE(SUM(downloaded_bytes), 0) FROM downloads WHERE worker_status = 'completed'
+            ''').fetchone()[0]
+        except sqlite3.Error as e:
+            self.log_message(f"Błąd odczytu metryk z bazy: {e}", 'WARNING')
+            counts, completed_bytes = [], None
+        METRICS.queue_jobs.set_all({(row['worker_status'],): row['count'] for row in counts})
+        METRICS.queue_in_memory.set(self.download_queue.qsize())
+        METRICS.deferred_jobs.set_all({(host,): count
+                                       for host, count in self.host_slots.snapshot()["deferred"].items()})
+        with self.worker_states_lock:
+            METRICS.workers_busy.set(sum(1 for state in self.worker_states.values()
+                                         if state["state"] == 'downloading'))
+        with self.progress_lock:
+            in_progress = sum(progress.done for progress in self.progress.values())
+        disk = {('downloading',): in_progress}
+        if completed_bytes is not None:
+            disk[('completed',)] = completed_bytes
+        METRICS.disk_bytes.set_all(disk)
+        volumes = self.volume_space.snapshot()
+        METRICS.volume_free.set_all({(mount,): state["free_bytes"] for mount, state in volumes.items()})
+        METRICS.volume_reserved.set_all({(mount,): state["reserved_bytes"] for mount, state in volumes.items()})
+
+    def interrupt_job(self, download_id, progress, title):
+        """Zadanie przerwane przez shutdown: wraca do kolejki z liczbą pobranych bajtów.
+
+        Nie liczy się jako próba ani błąd hosta - po restarcie wznowi się od
+        zapisanego stanu na dysku.
+        """
+        snapshot = progress.snapshot()
+        try:
+            with self.get_db_connection() as conn:
+                conn.execute('''
+                    UPDATE downloads SET worker_status = 'queued', download_status = 'interrupted',
+                        progress = ?, downloaded_bytes = ?, total_bytes = ?
+                    WHERE id = ?
+                ''', (snapshot["percent"] or 0, snapshot["bytes_done"], snapshot["total_bytes"], download_id))
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd zapisu przerwanego zadania: {e}", 'ERROR', download_id)
+            return
+        self.log_message(f"⏸️ Przerwano przy zatrzymaniu: {title} ({snapshot['bytes_done']} B zapisane, "
+                         f"wznowienie po restarcie)", 'WARNING', download_id)
+
+    def save_checksum(self, download_id, checksum):
+        """Zapisz CRC32 ukończonego pliku (do późniejszej kontroli bez czytania pliku od nowa)"""
+        if checksum is None or download_id is None:
+            return
+        try:
+            with self.get_db_connection() as conn:
+                conn.execute('UPDATE downloads SET checksum = ? WHERE id = ?', (checksum, download_id))
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd zapisu sumy kontrolnej: {e}", 'WARNING', download_id)
+
+    def report_progress(self, download_id, progress, force=False):
+        """Zapisz postęp do bazy - najwyżej raz na sekundę i tylko przy zmianie procentu"""
+        if download_id is None or not progress.should_report(force):
+            return
+        snapshot = progress.snapshot()
+        try:
+            with self.get_db_connection() as conn:
+                conn.execute('''
+                    UPDATE downloads SET progress = ?, downloaded_bytes = ?, total_bytes = ?
+                    WHERE id = ?
+                ''', (snapshot["percent"] or 0, snapshot["bytes_done"], snapshot["total_bytes"], download_id))
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd zapisu postępu: {e}", 'ERROR')
 
     def update_download_status(self, download_id, worker_status, download_status=None, progress=None, error_message=None):
         """Aktualizuj status pobierania w bazie"""
@@ -260,61 +1526,211 @@ class DownloadManager:
         except Exception as e:
             self.log_message(f"Błąd aktualizacji statusu: {e}", 'ERROR')
 
-    def download_worker(self):
-        """Worker pobierania - działa w osobnym wątku"""
-        self.log_message("🚀 Worker pobierania uruchomiony")
+    def set_worker_state(self, worker_name, state, job=None):
+        """Zapisz stan workera (dla get_status)"""
+        with self.worker_states_lock:
+            self.worker_states[worker_name] = {
+                "state": state,
+                "job_id": job.get("db_id") if job else None,
+                "title": job.get("title") if job else None,
+                "host": get_host(job.get("url", "")) if job else None,
+                "since": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+
+    def process_job(self, job):
+        """Pobierz pojedyncze zadanie i zapisz wynik w bazie"""
+        db_id = job.get("db_id")
+        item_id = job.get("item_id")
+        url = job.get("url")
+        output_path = job.get("output_path")
+        title = job.get("title", "Nieznany tytuł")
+
+        with self.cancel_lock:
+            cancel = self.cancel_events.setdefault(db_id, threading.Event())
+        if cancel.is_set():
+            self.release_cancel_event(db_id, cancel)
+            self.log_message(f"🚫 Anulowano przed rozpoczęciem: {title}", 'WARNING', db_id)
+            return
+
+        # Ten sam plik pobrany już wcześniej (albo przez zadanie-duplikat) - bez transferu
+        copy = self.reuse_existing(url, output_path, db_id, job.get("item_type"), item_id)
+        if copy is not None:
+            self.release_cancel_event(db_id, cancel)
+            self.complete_reused_job(db_id, copy)
+            METRICS.jobs.inc(result='reused')
+            self.log_message(f"✅ Ukończono: {title}", 'SUCCESS', db_id)
+            return
+
+        # Aktualizuj status na "downloading"
+        self.update_download_status(db_id, 'downloading', 'downloading')
+        self.log_message(f"🔄 Rozpoczynam pobieranie: {title} (ID: {item_id})", 
+                       download_id=db_id)
+        
+        # Pobierz plik (postęp trzymany w pamięci, do bazy trafia co najwyżej raz na sekundę)
+        progress = TransferProgress()
+        with self.progress_lock:
+            self.progress[db_id] = progress
+        attempt = job.get("attempts", 0)
+        error = None
+        started = time.monotonic()
+        try:
+            self.download_with_engine(url, output_path, db_id, attempt, progress, cancel)
+        except Exception as e:
+            error = e
+        finally:
+            with self.progress_lock:
+                self.progress.pop(db_id, None)
+            self.release_cancel_event(db_id, cancel)
+        
+        host = get_host(url)
+        result = self.job_result(error, attempt)
+        self.record_job_metrics(host, result, time.monotonic() - started, progress, error)
+        if result == 'cancelled':
+            # Status mógł zostać nadpisany przez start zadania tuż po anulowaniu
+            self.update_download_status(db_id, 'cancelled', 'cancelled')
+            self.log_message(f"🚫 Anulowano: {title}", 'WARNING', db_id)
+            return
+        if result == 'interrupted':
+            self.interrupt_job(db_id, progress, title)
+            return
+        if result == 'no_space':
+            # Dysk, nie host ani plik - zadanie czeka na miejsce bez zużywania prób
+            if self.circuit.record_success(host):
+                self.log_message(f"▶️ Host {host} znów odpowiada - wznawiam jego zadania", 'SUCCESS')
+            self.log_message(f"💾 {error} - {title} wraca do kolejki", 'WARNING', db_id)
+            # Znany rozmiar pozwala pominąć zadanie już przy przyjmowaniu, dopóki miejsce się nie zwolni
+            self.schedule_retry(db_id, attempt, NO_SPACE_RETRY_DELAY, str(error), progress.total)
+            return
+
+        if result == 'completed':
+            if self.circuit.record_success(host):
+                self.log_message(f"▶️ Host {host} znów odpowiada - wznawiam jego zadania", 'SUCCESS')
+            # Oznacz jako ukończone
+            if os.path.exists(output_path):
+                progress.update(os.path.getsize(output_path))
+            self.report_progress(db_id, progress, force=True)
+            self.update_download_status(db_id, 'completed', 'completed', 100)
+            self.log_message(f"✅ Ukończono: {title}", 'SUCCESS', db_id)
+            return
+
+        kind = getattr(error, 'kind', None)
+        self.log_message(f"❌ Błąd podczas pobierania (próba {attempt + 1}/{DOWNLOAD_MAX_ATTEMPTS}"
+                         f"{', ' + kind if kind else ''}): {error}", 'ERROR', db_id)
+        if is_host_failure(error):
+            cooldown = self.circuit.record_failure(host)
+            if cooldown:
+                METRICS.circuit_opened.inc(host=host)
+                self.log_message(f"⏸️ Host {host} wstrzymany na {cooldown:.0f}s po serii błędów - "
+                                 f"jego zadania czekają w kolejce", 'WARNING')
+        elif self.circuit.record_success(host):
+            # Host odpowiedział (np. 404 albo strona błędu) - problem dotyczy pliku, nie hosta
+            self.log_message(f"▶️ Host {host} znów odpowiada - wznawiam jego zadania", 'SUCCESS')
+
+        retryable = getattr(error, 'retryable', True)
+        if result == 'retried':
+            self.schedule_retry(db_id, attempt + 1, retry_delay(attempt + 1), str(error))
+            return
+
+        # Oznacz jako nieudane (np. 404/403 albo strona błędu od razu, inne po wszystkich próbach)
+        self.update_download_status(db_id, 'failed', 'failed', 0, 
+                                  'Pobieranie nieudane po wszystkich próbach' if retryable else str(error))
+        self.log_message(f"❌ Nieudane pobieranie: {title}", 'ERROR', db_id)
+
+    def job_result(self, error, attempt):
+        """Wynik próby zadania dla metryk: completed, cancelled, interrupted, no_space, retried albo failed"""
+        if error is None:
+            return 'completed'
+        if isinstance(error, DownloadCancelled):
+            return 'cancelled'
+        if isinstance(error, DownloadInterrupted) or not self.running:
+            return 'interrupted'
+        if is_no_space(error):
+            return 'no_space'
+        if getattr(error, 'retryable', True) and attempt + 1 < DOWNLOAD_MAX_ATTEMPTS:
+            return 'retried'
+        return 'failed'
+
+    def record_job_metrics(self, host, result, elapsed, progress, error=None):
+        """Metryki zakończonej próby - raz na zadanie, nie na porcję danych"""
+        METRICS.jobs.inc(result=result)
+        METRICS.job_duration.observe(elapsed, result=result)
+        if progress.received:
+            METRICS.bytes_downloaded.inc(progress.received, host=host)
+            if result == 'completed' and elapsed > 0:
+                METRICS.job_throughput.observe(progress.received / elapsed)
+        if result == 'retried':
+            METRICS.retries.inc(kind=getattr(error, 'kind', None) or 'other')
+
+    def download_worker(self, worker_name="worker-1"):
+        """Worker pobierania - działa w osobnym wątku, kilka workerów dzieli jedną kolejkę"""
+        self.log_message(f"🚀 Worker pobierania uruchomiony ({worker_name})")
+        self.set_worker_state(worker_name, 'idle')
         
         while self.running:
             try:
                 # Pobierz zadanie z kolejki (timeout 1s aby móc sprawdzać self.running)
                 job = self.download_queue.get(timeout=1.0)
-                
-                db_id = job.get("db_id")
-                item_id = job.get("item_id")
-                url = job.get("url")
-                output_path = job.get("output_path")
-                title = job.get("title", "Nieznany tytuł")
-                item_type = job.get("item_type", "unknown")
-                
-                if not all([db_id, url, output_path]):
-                    self.log_message(f"❌ Niekompletne zadanie: {job}", 'ERROR')
-                    self.download_queue.task_done()
-                    continue
-                
-                # Aktualizuj status na "downloading"
-                self.update_download_status(db_id, 'downloading', 'downloading')
-                self.log_message(f"🔄 Rozpoczynam pobieranie: {title} (ID: {item_id})", 
-                               download_id=db_id)
-                
-                # Pobierz plik
-                success = self.download_with_curl(url, output_path, db_id)
-                
-                if success:
-                    # Oznacz jako ukończone
-                    self.update_download_status(db_id, 'completed', 'completed', 100)
-                    self.log_message(f"✅ Ukończono: {title}", 'SUCCESS', db_id)
-                else:
-                    # Oznacz jako nieudane
-                    self.update_download_status(db_id, 'failed', 'failed', 0, 
-                                              'Pobieranie nieudane po wszystkich próbach')
-                    self.log_message(f"❌ Nieudane pobieranie: {title}", 'ERROR', db_id)
-                
-                self.download_queue.task_done()
-                
             except queue.Empty:
                 # Timeout - kontynuuj pętlę
                 continue
+
+            db_id = job.get("db_id")
+            url = job.get("url")
+            host = None
+            volume = None
+            deferred = False
+            try:
+                if not all([db_id, url, job.get("output_path")]):
+                    self.log_message(f"❌ Niekompletne zadanie: {job}", 'ERROR')
+                    continue
+
+                # Limit połączeń na host - zadanie wróci do kolejki po zwolnieniu slotu
+                if not self.host_slots.acquire_or_defer(get_host(url), job):
+                    deferred = True
+                    continue
+                host = get_host(url)
+                # Limit zadań na dysk docelowy - zadanie wróci do kolejki po zwolnieniu slotu wolumenu
+                if "volume" not in job:
+                    job["volume"] = self.volume_space.volume(job["output_path"])
+                if not self.volume_slots.acquire_or_defer(job["volume"], job):
+                    deferred = True
+                    continue
+                volume = job["volume"]
+
+                self.set_worker_state(worker_name, 'downloading', job)
+                self.process_job(job)
+                
             except Exception as e:
-                self.log_message(f"❌ Błąd w workerze: {e}", 'ERROR')
-                if 'db_id' in locals():
+                self.log_message(f"❌ Błąd w workerze {worker_name}: {e}", 'ERROR')
+                if db_id:
                     self.update_download_status(db_id, 'failed', 'failed', 0, str(e))
-                    self.download_queue.task_done()
+            finally:
+                if not deferred:
+                    self.inflight.discard(self.inflight.keys(url, job.get("item_type"), job.get("item_id")))
+                    if job.get("probe"):
+                        # Bez wyniku (anulowanie, zatrzymanie, gotowy plik, błąd workera) zadanie próbne
+                        # blokowałoby host do restartu - sukces i błąd zwalniają je już same
+                        self.circuit.release_probe(get_host(url))
+                if volume is not None:
+                    self.release_slot(self.volume_slots, volume)
+                if host is not None:
+                    self.release_slot(self.host_slots, host)
+                    self.set_worker_state(worker_name, 'idle')
+                    # Zwolnił się worker i slot hosta - można przyjąć kolejne zadanie
+                    self.intake_wakeup.set()
+                self.download_queue.task_done()
+
+        self.set_worker_state(worker_name, 'stopped')
 
     def start_worker(self):
-        """Uruchom worker pobierania"""
-        if self.worker_thread is None or not self.worker_thread.is_alive():
-            self.worker_thread = threading.Thread(target=self.download_worker, daemon=True)
-            self.worker_thread.start()
+        """Uruchom pulę workerów pobierania"""
+        self.worker_threads = [t for t in self.worker_threads if t.is_alive()]
+        for index in range(len(self.worker_threads), self.worker_count):
+            worker_name = f"worker-{index + 1}"
+            thread = threading.Thread(target=self.download_worker, args=(worker_name,),
+                                      name=worker_name, daemon=True)
+            self.worker_threads.append(thread)
+            thread.start()
 
     def get_status(self):
         """Pobierz status wszystkich zadań z bazy"""
@@ -322,53 +1738,209 @@ class DownloadManager:
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Statystyki ogólne
-                cursor.execute('''
-                    SELECT 
-                        COUNT(*) as total,
-                        SUM(CASE WHEN worker_status = 'queued' THEN 1 ELSE 0 END) as queued,
-                        SUM(CASE WHEN worker_status = 'downloading' THEN 1 ELSE 0 END) as downloading,
-                        SUM(CASE WHEN worker_status = 'completed' THEN 1 ELSE 0 END) as completed,
-                        SUM(CASE WHEN worker_status = 'failed' THEN 1 ELSE 0 END) as failed
-                    FROM downloads
-                ''')
-                
-                stats = cursor.fetchone()
+                # Statystyki ogólne - liczniki utrzymywane przez triggery
+                cursor.execute('SELECT worker_status, count FROM download_status_counts')
+                counts = {row['worker_status']: row['count'] for row in cursor.fetchall()}
+                stats = {
+                    "total": sum(counts.values()),
+                    "queued": counts.get('queued', 0),
+                    "downloading": counts.get('downloading', 0),
+                    "completed": counts.get('completed', 0),
+                    "failed": counts.get('failed', 0)
+                }
                 
-                # Aktywne zadania
+                # Aktywne zadania - osobno dla każdego statusu, aby każda część czytała
+                # tylko 20 wierszy z indeksu (worker_status, added_at)
                 cursor.execute('''
-                    SELECT id, filename, worker_status, progress, error_message, added_at
-                    FROM downloads 
-                    WHERE worker_status IN ('queued', 'downloading', 'failed')
+                    SELECT * FROM (
+                        SELECT id, filename, worker_status, progress, error_message, added_at
+                        FROM downloads WHERE worker_status = 'queued'
+                        ORDER BY added_at ASC LIMIT 20
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT id, filename, worker_status, progress, error_message, added_at
+                        FROM downloads WHERE worker_status = 'downloading'
+                        ORDER BY added_at ASC LIMIT 20
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT id, filename, worker_status, progress, error_message, added_at
+                        FROM downloads WHERE worker_status = 'failed'
+                        ORDER BY added_at ASC LIMIT 20
+                    )
                     ORDER BY added_at ASC
                     LIMIT 20
                 ''')
                 
                 active_jobs = [dict(row) for row in cursor.fetchall()]
                 
+                # Postęp na żywo (bajty, prędkość, ETA) z pamięci
+                with self.progress_lock:
+                    live_progress = {db_id: p.snapshot() for db_id, p in self.progress.items()}
+                for job in active_jobs:
+                    if job["id"] in live_progress:
+                        job.update(live_progress[job["id"]])
+                        if job["percent"] is not None:
+                            job["progress"] = job["percent"]
+                
+                with self.worker_states_lock:
+                    workers = [dict(state, name=name) for name, state in self.worker_states.items()]
+                
                 return {
                     "queue_size": self.download_queue.qsize(),
-                    "stats": dict(stats) if stats else {},
-                    "active_jobs": active_jobs
+                    "stats": stats,
+                    "active_jobs": active_jobs,
+                    "transfers": live_progress,
+                    "bandwidth": self.bandwidth.snapshot(),
+                    "dns": self.dns_cache.snapshot(),
+                    "hosts": self.circuit.snapshot(),
+                    "volumes": self.volume_space.snapshot(self.volume_slots.snapshot()),
+                    "workers": workers,
+                    "pool": {
+                        "size": self.worker_count,
+                        "busy": sum(1 for w in workers if w["state"] == 'downloading'),
+                        "max_per_host": self.host_slots.per_host,
+                        "max_per_volume": self.volume_slots.per_host,
+                        "hosts": self.host_slots.snapshot()
+                    }
                 }
         except Exception as e:
             self.log_message(f"Błąd pobierania statusu: {e}", 'ERROR')
-            return {"queue_size": 0, "stats": {}, "active_jobs": []}
+            return {"queue_size": 0, "stats": {}, "active_jobs": [], "transfers": {}, "workers": [], "pool": {}}
+
+    def release_unstarted_jobs(self):
+        """Oddaj do bazy (jako queued) zadania czekające w pamięci"""
+        job_ids = []
+        while True:
+            try:
+                job_ids.append(self.download_queue.get_nowait()["db_id"])
+            except queue.Empty:
+                break
+        for slots in (self.host_slots, self.volume_slots):
+            with slots.lock:
+                for jobs in slots.deferred.values():
+                    job_ids.extend(job["db_id"] for job in jobs)
+                slots.deferred.clear()
+        if not job_ids:
+            return
+        try:
+            with self.get_db_connection() as conn:
+                conn.executemany("UPDATE downloads SET worker_status = 'queued' WHERE id = ? AND worker_status = 'downloading'",
+                                 [(job_id,) for job_id in job_ids])
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd zwalniania zadań: {e}", 'ERROR')
+
+    def release_stuck_jobs(self):
+        """Zadania workerów, które nie skończyły w czasie shutdown, oznacz jako przerwane.
+
+        Stan na dysku zapisał ostatni punkt kontrolny; bez tego wiersze
+        zostałyby w 'downloading' do następnego startu.
+        """
+        stuck = [thread.name for thread in self.worker_threads if thread.is_alive()]
+        with self.worker_states_lock:
+            job_ids = [self.worker_states[name]["job_id"] for name in stuck
+                       if name in self.worker_states and self.worker_states[name]["job_id"]]
+        if not job_ids:
+            return
+        try:
+            with self.get_db_connection() as conn:
+                conn.executemany('''
+                    UPDATE downloads SET worker_status = 'queued', download_status = 'interrupted'
+                    WHERE id = ? AND worker_status = 'downloading'
+                ''', [(job_id,) for job_id in job_ids])
+                conn.commit()
+        except Exception as e:
+            self.log_message(f"Błąd zwalniania zadań: {e}", 'ERROR')
+            return
+        self.log_message(f"⚠️ {len(job_ids)} transferów nie zakończyło się w {SHUTDOWN_TIMEOUT:.0f}s - "
+                         f"wznowią się od ostatniego punktu kontrolnego", 'WARNING')
+
+    def set_bandwidth_limit(self, limit, schedule=None):
+        """Zmień limit przepustowości w trakcie pracy (np. "4M", 0 = bez limitu) - RPC set_bandwidth.
+
+        Błędny limit albo harmonogram to ValueError przed zapisem pliku
+        konfiguracji (sam plik z błędem byłby po cichu pomijany).
+        """
+        parse_rate(limit)
+        if schedule is not None:
+            parse_schedule(schedule)
+        self.bandwidth.set_limit(limit, schedule)
+        snapshot = self.bandwidth.snapshot()
+        self.log_message(f"Limit przepustowości: {snapshot}")
+        return snapshot
 
     def shutdown(self, signum=None, frame=None):
-        """Graceful shutdown"""
+        """Graceful shutdown w ograniczonym czasie (SHUTDOWN_TIMEOUT).
+
+        Trwające transfery są przerywane od razu (curl dostaje SIGTERM, gniazda
+        HTTP są zamykane), a workery zapisują liczbę pobranych bajtów do bazy
+        i punkt kontrolny obok pliku - po restarcie pobieranie wznawia się od
+        tego miejsca zamiast od zera.
+        """
         self.log_message("🛑 Zatrzymywanie download managera...")
         self.running = False
+        if self.rpc_server is not None:
+            self.rpc_server.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        METRICS.remove_collector(self.collect_metrics)
+        
+        self.intake_wakeup.set()
+        self.maintenance_stop.set()
+        self.engine.abort()
+        if self.fallback_engine is not self.engine:
+            self.fallback_engine.abort()
+        
+        # Poczekaj na zakończenie workerów (wspólny limit czasu dla całej puli)
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        for thread in self.worker_threads + [self.intake_thread, self.maintenance_thread]:
+            if thread and thread.is_alive():
+                thread.join(timeout=max(0, deadline - time.time()))
         
-        # Poczekaj na zakończenie workera
-        if self.worker_thread and self.worker_thread.is_alive():
-            self.worker_thread.join(timeout=30)
+        # Zadania pobrane z bazy, ale jeszcze nie rozpoczęte, wracają do kolejki w bazie
+        self.release_unstarted_jobs()
+        self.release_stuck_jobs()
         
+        self.engine.close()
         self.log_message("✅ Download manager zatrzymany")
+        self.log_writer.close()
+        self.close_db_connections()
+        if self.metrics_conn is not None:
+            self.metrics_conn.close()
 
 # --- API dla pojedynczych pobierań (kompatybilność z istniejącym kodem) ---
 def single_download(url, output_path):
-    """Funkcja dla pojedynczego pobierania - kompatybilność wsteczna"""
+    """Pojedyncze pobieranie (tryb URL ŚCIEŻKA) - kompatybilność wsteczna.
+
+    Gdy daemon działa, to tylko cienki klient RPC: plik pobiera daemon (ciepłe
+    połączenia, pamięć DNS, wspólny limit przepustowości), a ten proces
+    przekazuje postęp i wynik. Bez daemona - jak dawniej, curl w tym procesie.
+    """
+    client = connect_rpc()
+    if client is not None:
+        return rpc_single_download(client, url, output_path)
+    return curl_single_download(url, output_path)
+
+
+def rpc_single_download(client, url, output_path):
+    """Zleć pobranie daemonowi i czekaj na wynik (wyjście jak w trybie curl: SUCCESS albo kod 1)"""
+    print(f"Rozpoczynam pobieranie przez daemon: {os.path.basename(output_path)}", file=sys.stderr)
+    try:
+        with client:
+            client.call("download", on_event=lambda event: print(f"Postęp: {format_progress(event['progress'])}",
+                                                                 file=sys.stderr),
+                        url=url, path=output_path)
+    except RpcError as e:
+        print(f"FAILED: {e}", file=sys.stderr)
+        return 1
+    print("SUCCESS")
+    return 0
+
+
+def curl_single_download(url, output_path):
+    """Pobieranie curl w tym procesie (gdy daemon nie działa)"""
     try:
         # Utwórz folder jeśli nie istnieje
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -423,6 +1995,14 @@ def main():
         # Tryb daemon - uruchom tylko manager
         try:
             manager = DownloadManager()
+            try:
+                manager.start_rpc()
+            except (OSError, RuntimeError) as e:
+                manager.log_message(f"⚠️ RPC niedostępne, tylko kolejka w bazie: {e}", 'WARNING')
+            try:
+                manager.start_metrics()
+            except (OSError, ValueError) as e:
+                manager.log_message(f"⚠️ Endpoint metryk niedostępny ({METRICS_ADDRESS}): {e}", 'WARNING')
             print("Download Manager uruchomiony w trybie daemon")
             print("Naciśnij Ctrl+C aby zatrzymać...")
             
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# download_metrics.py - Metryki daemona pobierania w pamięci procesu, eksport w formacie tekstowym Prometheusa
+#
+# Pomiary są zbierane na granicach zadań, zapytań i transferów (nie na każdej porcji danych),
+# więc koszt w wątkach pobierania to kilka operacji na zadanie. Wartości liczone z bazy
+# (głębokość kolejki, bajty na dysku) są odczytywane dopiero przy scrape.
+
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Adres endpointu /metrics ("host:port"; pusty = wyłączony). Domyślnie tylko lokalnie -
+# "0.0.0.0:9464", żeby Prometheus z innego kontenera mógł go odpytywać
+METRICS_ADDRESS = os.environ.get("DOWNLOAD_METRICS_ADDRESS", "127.0.0.1:9464")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Przedziały histogramów [s]
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5, 30)
+WAIT_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+# Przepustowość zadania [B/s]: od 100 kB/s do 100 MB/s
+THROUGHPUT_BUCKETS = tuple(value * 1024 * 1024 for value in (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100))
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Metryka z etykietami; wartości w słowniku krotka_etykiet -> wartość, pod jedną blokadą"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Wartość chwilowa; set_all() podmienia cały zestaw (gauge liczone przy scrape)"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def set_all(self, values):
+        """values: słownik krotka_etykiet -> wartość (etykiety znikające z danych znikają z metryki)"""
+        with self.lock:
+            self.values = dict(values)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self.values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', format_value(float(bound)))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Zbiór metryk procesu; collectors są wołane przed każdym render() (wartości liczone przy scrape)"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.collect_lock = threading.Lock()
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self.add(Histogram(name, help_text, buckets, labels))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def render(self):
+        # Jeden scrape naraz - collectors czytają bazę
+        with self.collect_lock:
+            for collector in list(self.collectors):
+                collector()
+            lines = []
+            for metric in self.metrics:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class DownloadMetrics(MetricsRegistry):
+    """Metryki daemona pobierania (jeden zestaw na proces - METRICS)"""
+
+    def __init__(self):
+        super().__init__()
+        self.queue_jobs = self.gauge(
+            "download_queue_jobs", "Zadania w bazie według worker_status", ("status",))
+        self.queue_in_memory = self.gauge(
+            "download_queue_claimed_jobs", "Zadania pobrane z bazy, czekające na wolnego workera")
+        self.deferred_jobs = self.gauge(
+            "download_host_deferred_jobs", "Zadania czekające na slot hosta", ("host",))
+        self.workers_busy = self.gauge(
+            "download_workers_busy", "Workery w trakcie pobierania")
+        self.queue_wait = self.histogram(
+            "download_queue_wait_seconds",
+            "Czas od dodania zadania (albo terminu ponowienia) do przyjęcia przez workera", WAIT_BUCKETS)
+        self.first_byte = self.histogram(
+            "download_first_byte_seconds",
+            "Czas od startu żądania (dla curl: uruchomienia procesu) do pierwszego bajtu", LATENCY_BUCKETS,
+            ("engine",))
+        self.job_throughput = self.histogram(
+            "download_job_throughput_bytes_per_second", "Średnia przepustowość ukończonej próby zadania",
+            THROUGHPUT_BUCKETS)
+        self.job_duration = self.histogram(
+            "download_job_duration_seconds", "Czas jednej próby zadania", WAIT_BUCKETS, ("result",))
+        self.bytes_downloaded = self.counter(
+            "download_bytes_total", "Bajty odebrane z sieci (bez części wznowionej z dysku)", ("host",))
+        self.jobs = self.counter(
+            "download_jobs_total", "Zakończone próby zadań według wyniku", ("result",))
+        self.reused_bytes = self.counter(
+            "download_reused_bytes_total", "Bajty plików wziętych z już pobranej kopii zamiast z sieci",
+            ("method",))
+        self.retries = self.counter(
+            "download_retries_total", "Odłożone ponowienia według rodzaju błędu", ("kind",))
+        self.circuit_opened = self.counter(
+            "download_circuit_opened_total", "Otwarcia bezpiecznika hosta", ("host",))
+        self.db_write = self.histogram(
+            "download_db_write_seconds",
+            "Czas zapytania zapisującego (z czekaniem na blokadę zapisu w busy_timeout)", DB_BUCKETS,
+            ("statement",))
+        self.db_commit = self.histogram(
+            "download_db_commit_seconds", "Czas COMMIT", DB_BUCKETS)
+        self.db_busy = self.counter(
+            "download_db_busy_errors_total", "Zapytania przerwane po busy_timeout (database is locked/busy)")
+        self.disk_bytes = self.gauge(
+            "download_disk_bytes", "Bajty pobranych plików na dysku", ("state",))
+        self.volume_free = self.gauge(
+            "download_volume_free_bytes", "Wolne miejsce wolumenu docelowego (statvfs, ostatni odczyt)", ("volume",))
+        self.volume_reserved = self.gauge(
+            "download_volume_reserved_bytes", "Miejsce zarezerwowane przez pobrania w toku", ("volume",))
+
+
+METRICS = DownloadMetrics()
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+
+
+def statement_kind(sql):
+    """'insert', 'update', 'delete' albo None (odczyt, PRAGMA, DDL)"""
+    head = sql.lstrip()[:6].upper()
+    if head.startswith(WRITE_STATEMENTS):
+        return 'insert' if head == 'REPLAC' else head.lower()
+    return None
+
+
+def record_db_error(error):
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        METRICS.db_busy.inc()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Kursor mierzący czas zapytań zapisujących - przy WAL czekanie na blokadę zapisu mieści się w nim"""
+
+    def execute(self, sql, parameters=()):
+        kind = statement_kind(sql)
+        if kind is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            record_db_error(e)
+            raise
+        finally:
+            METRICS.db_write.observe(time.perf_counter() - started, statement=kind)
+
+    def executemany(self, sql, seq_of_parameters):
+        kind = statement_kind(sql)
+        if kind is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as e:
+            record_db_error(e)
+            raise
+        finally:
+            METRICS.db_write.observe(time.perf_counter() - started, statement=kind)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Połączenie z TimedCursor jako domyślnym kursorem i pomiarem COMMIT"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Wersje C wołają execute kursora z pominięciem metod Pythona
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        except sqlite3.OperationalError as e:
+            record_db_error(e)
+            raise
+        finally:
+            METRICS.db_commit.observe(time.perf_counter() - started)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrape co kilkanaście sekund nie powinien zaśmiecać logu
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Endpoint HTTP /metrics dla Prometheusa"""
+
+    daemon_threads = True
+
+    def __init__(self, address=METRICS_ADDRESS, registry=METRICS):
+        host, _, port = address.rpartition(':')
+        self.registry = registry
+        super().__init__((host or '127.0.0.1', int(port)), MetricsHandler)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# download_progress.py - Śledzenie postępu pobierania (bajty, prędkość, ETA)
+
+import threading
+import time
+
+# Jak często raportować postęp (zapis do bazy / wypisanie na stderr)
+PROGRESS_REPORT_INTERVAL = 1.0
+# Wygładzanie prędkości (średnia wykładnicza, 0..1 - im więcej, tym szybciej reaguje)
+SPEED_SMOOTHING = 0.3
+
+
+class TransferProgress:
+    """Postęp jednego pobierania trzymany w pamięci.
+
+    update()/add() są tanie i mogą być wołane dla każdej porcji danych
+    (także z kilku wątków przy pobieraniu segmentowym); should_report()
+    mówi, kiedy warto zapisać postęp - najwyżej raz na interwał i tylko
+    gdy zmienił się procent.
+    """
+
+    def __init__(self, total=None, done=0, report_interval=PROGRESS_REPORT_INTERVAL):
+        self.lock = threading.Lock()
+        self.total = total
+        self.done = done
+        # Bajty odebrane z sieci (add/add_received) - bez części wznowionej z dysku
+        self.received = 0
+        self.speed = 0.0
+        self.started_at = time.time()
+        self.report_interval = report_interval
+        self.last_sample = (self.started_at, done)
+        self.last_report_at = 0.0
+        self.last_report_percent = None
+
+    def set_total(self, total):
+        with self.lock:
+            self.total = total
+
+    def add(self, count):
+        with self.lock:
+            self.received += count
+            self._set_done(self.done + count)
+
+    def add_received(self, count):
+        """Policz odebrane bajty, gdy postęp jest ustawiany przez update() (np. HLS po każdym segmencie)"""
+        with self.lock:
+            self.received += count
+
+    def update(self, done):
+        with self.lock:
+            self._set_done(done)
+
+    def _set_done(self, done):
+        self.done = done
+        now = time.time()
+        sample_time, sample_bytes = self.last_sample
+        elapsed = now - sample_time
+        if elapsed >= 0.5:
+            current = max(0, done - sample_bytes) / elapsed
+            self.speed = current if not self.speed else \
+                SPEED_SMOOTHING * current + (1 - SPEED_SMOOTHING) * self.speed
+            self.last_sample = (now, done)
+
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100, int(self.done * 100 / self.total))
+
+    def eta(self):
+        if not self.total or self.speed <= 0:
+            return None
+        return max(0, int((self.total - self.done) / self.speed))
+
+    def should_report(self, force=False):
+        """True najwyżej raz na interwał i tylko gdy procent się zmienił"""
+        with self.lock:
+            now = time.time()
+            percent = self.percent()
+            if not force:
+                if now - self.last_report_at < self.report_interval:
+                    return False
+                if percent is not None and percent == self.last_report_percent:
+                    return False
+            self.last_report_at = now
+            self.last_report_percent = percent
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "bytes_done": self.done,
+                "total_bytes": self.total,
+                "percent": self.percent(),
+                "speed_bps": int(self.speed),
+                "eta_seconds": self.eta(),
+                "elapsed_seconds": int(time.time() - self.started_at)
+            }
+
+
+def format_progress(snapshot):
+    """Czytelna linia postępu, np. '45.0% (450/1000 MB) 12.3 MB/s ETA 0:00:44'"""
+    mb = 1024 * 1024
+    parts = []
+    if snapshot["percent"] is not None:
+        parts.append(f"{snapshot['bytes_done'] * 100 / snapshot['total_bytes']:.1f}%")
+        parts.append(f"({snapshot['bytes_done'] // mb}/{snapshot['total_bytes'] // mb} MB)")
+    else:
+        parts.append(f"{snapshot['bytes_done'] // mb} MB")
+    parts.append(f"{snapshot['speed_bps'] / mb:.1f} MB/s")
+    if snapshot["eta_seconds"] is not None:
+        eta = snapshot["eta_seconds"]
+        parts.append(f"ETA {eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}")
+    return " ".join(parts)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# download_retry.py - Ponawianie z wykładniczym odstępem i bezpiecznik (circuit breaker) per host
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Łączna liczba prób jednego zadania
+DOWNLOAD_MAX_ATTEMPTS = int(os.environ.get("DOWNLOAD_MAX_ATTEMPTS", "3"))
+# Odstęp przed ponowieniem: RETRY_BASE_DELAY * 2^(próba-1), najwyżej RETRY_MAX_DELAY [s]
+RETRY_BASE_DELAY = float(os.environ.get("DOWNLOAD_RETRY_BASE_DELAY", "5"))
+RETRY_MAX_DELAY = float(os.environ.get("DOWNLOAD_RETRY_MAX_DELAY", "600"))
+# Bezpiecznik: ile ostatnich wyników hosta brać pod uwagę i przy jakim udziale błędów go otworzyć
+CIRCUIT_WINDOW = 10
+CIRCUIT_MIN_FAILURES = int(os.environ.get("DOWNLOAD_CIRCUIT_FAILURES", "3"))
+CIRCUIT_FAILURE_RATE = 0.5
+# Jak długo host jest wstrzymany po otwarciu bezpiecznika (rośnie x2 przy kolejnych otwarciach)
+CIRCUIT_COOLDOWN = float(os.environ.get("DOWNLOAD_CIRCUIT_COOLDOWN", "60"))
+CIRCUIT_MAX_COOLDOWN = 900.0
+
+# Błędy świadczące o problemie z hostem (a nie z konkretnym plikiem)
+HOST_ERROR_KINDS = ('dns', 'connect', 'timeout', 'tls', 'protocol')
+
+
+def retry_delay(attempt):
+    """Odstęp przed próbą nr attempt + 1 (attempt = liczba dotychczasowych prób), z losowym rozrzutem.
+
+    Połowa odstępu jest stała, połowa losowa - zadania, które padły razem,
+    nie wracają do dostawcy w tej samej sekundzie.
+    """
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** max(0, attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_host_failure(error):
+    """Czy błąd obciąża hosta: brak połączenia, timeout, 5xx, 429 (404 czy zły plik - nie)"""
+    kind = getattr(error, 'kind', None)
+    if kind in HOST_ERROR_KINDS:
+        return True
+    status = getattr(error, 'status', None)
+    return kind == 'http' and status is not None and (status >= 500 or status == 429)
+
+
+class CircuitBreaker:
+    """Bezpiecznik per host liczony z ostatnich CIRCUIT_WINDOW wyników.
+
+    closed - zadania hosta są przyjmowane normalnie,
+    open - host wstrzymany do open_until (jego zadania czekają w bazie, inne hosty pracują),
+    half_open - po przerwie przepuszczane jest jedno zadanie próbne; sukces zamyka
+    bezpiecznik, błąd otwiera go ponownie na dwa razy dłużej.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def host_state(self, host):
+        # Wołane pod blokadą
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {"state": 'closed', "outcomes": deque(maxlen=CIRCUIT_WINDOW),
+                                        "open_until": 0.0, "openings": 0, "probe": False}
+        return state
+
+    def available(self, host):
+        """Czy można teraz przyjąć zadanie tego hosta"""
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None or state["state"] == 'closed':
+                return True
+            if state["state"] == 'open':
+                return time.monotonic() >= state["open_until"]
+            return not state["probe"]
+
+    def on_claim(self, host):
+        """Zadanie hosta zostało przyjęte - po przerwie staje się zadaniem próbnym (zwraca True)"""
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is not None and state["state"] != 'closed':
+                state["state"] = 'half_open'
+                state["probe"] = True
+                return True
+        return False
+
+    def release_probe(self, host):
+        """Zadanie próbne skończyło się bez wyniku (anulowane, przerwane, gotowy plik) - następne może je zastąpić"""
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is not None and state["state"] == 'half_open':
+                state["probe"] = False
+
+    def record_success(self, host):
+        with self.lock:
+            state = self.host_state(host)
+            state["outcomes"].append(True)
+            if state["state"] != 'closed':
+                state.update(state='closed', openings=0, probe=False)
+                state["outcomes"].clear()
+                return True
+        return False
+
+    def record_failure(self, host):
+        """Zapisz błąd hosta; zwraca czas wstrzymania [s], jeśli bezpiecznik właśnie się otworzył"""
+        with self.lock:
+            state = self.host_state(host)
+            state["outcomes"].append(False)
+            failures = state["outcomes"].count(False)
+            if state["state"] == 'half_open' or (
+                    state["state"] == 'closed' and failures >= CIRCUIT_MIN_FAILURES
+                    and failures >= len(state["outcomes"]) * CIRCUIT_FAILURE_RATE):
+                cooldown = min(CIRCUIT_MAX_COOLDOWN, CIRCUIT_COOLDOWN * 2 ** state["openings"])
+                state.update(state='open', open_until=time.monotonic() + cooldown,
+                             openings=state["openings"] + 1, probe=False)
+                return cooldown
+        return None
+
+    def reopened_since(self, since):
+        """Czy od chwili since (time.monotonic) minęła przerwa któregoś wstrzymanego hosta"""
+        now = time.monotonic()
+        with self.lock:
+            return any(state["state"] == 'open' and since < state["open_until"] <= now
+                       for state in self.hosts.values())
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                host: {
+                    "state": state["state"],
+                    "failures": state["outcomes"].count(False),
+                    "samples": len(state["outcomes"]),
+                    "reopens_in": round(max(0.0, state["open_until"] - now), 1) if state["state"] == 'open' else None,
+                }
+                for host, state in self.hosts.items() if state["state"] != 'closed' or state["outcomes"]
+            }
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# download_rpc.py - Lokalne RPC daemona pobierania: gniazdo Unix, jedno żądanie JSON na linię
+#
+# Żądanie:   {"id": 1, "method": "enqueue", "params": {"url": "...", "path": "..."}}
+# Odpowiedź: {"id": 1, "result": {...}}  albo  {"id": 1, "error": {"message": "...", "type": "..."}}
+# Długie wywołania (download) wysyłają po drodze zdarzenia {"id": 1, "event": "progress", ...}.
+# Jedno połączenie obsługuje kolejne żądania po kolei.
+
+import json
+import os
+import socket
+import socketserver
+import threading
+
+# Gniazdo obok bazy (katalog config widzą i daemon, i backend Node)
+RPC_SOCKET_PATH = os.environ.get(
+    "DOWNLOAD_RPC_SOCKET",
+    os.path.join(os.path.dirname(os.environ.get("DOWNLOAD_DB_PATH", "/app/config/database.sqlite")),
+                 "download_manager.sock"))
+# Ile czekać na połączenie z daemonem, zanim klient uzna, że go nie ma
+RPC_CONNECT_TIMEOUT = 2.0
+# Maksymalna długość jednej linii żądania (enqueue_batch z tysiącami odcinków mieści się z zapasem)
+RPC_MAX_LINE = 16 * 1024 * 1024
+
+
+class RpcError(Exception):
+    """Błąd zgłoszony przez daemon albo zerwane połączenie"""
+
+    def __init__(self, message, error_type=None, kind=None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.kind = kind
+
+
+class RpcHandler(socketserver.StreamRequestHandler):
+    """Jedno połączenie klienta - żądania obsługiwane po kolei"""
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+        with self.send_lock:
+            self.wfile.write(data)
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(RPC_MAX_LINE)
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                method = request["method"]
+            except (ValueError, KeyError, AttributeError):
+                self.send({"id": None, "error": {"message": "Niepoprawne żądanie JSON", "type": "ValueError"}})
+                continue
+            try:
+                self.send({"id": request_id, "result": self.server.dispatch(request, self.emitter(request_id))})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                message = f"Brak parametru {e}" if isinstance(e, KeyError) else str(e)
+                try:
+                    self.send({"id": request_id, "error": {"message": message, "type": e.__class__.__name__,
+                                                           "kind": getattr(e, 'kind', None)}})
+                except OSError:
+                    return
+
+    def finish(self):
+        super().finish()
+        if self.server.on_close is not None:
+            self.server.on_close()
+
+    def emitter(self, request_id):
+        # Zdarzenia w trakcie wywołania; OSError = klient się rozłączył
+        def emit(event, **data):
+            self.send(dict(data, id=request_id, event=event))
+        return emit
+
+
+class RpcServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serwer RPC - wątek na połączenie, metody podane jako słownik nazwa -> funkcja(params, emit).
+
+    on_close() jest wołane w wątku połączenia po jego zamknięciu (np. zwolnienie połączenia z bazą).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, methods, path=RPC_SOCKET_PATH, on_close=None):
+        self.methods = methods
+        self.on_close = on_close
+        self.path = path
+        remove_stale_socket(path)
+        super().__init__(path, RpcHandler)
+        # Dostęp tylko dla właściciela i grupy (backend Node działa jako ten sam użytkownik)
+        os.chmod(path, 0o660)
+        self.thread = None
+
+    def dispatch(self, request, emit):
+        method = self.methods.get(request["method"])
+        if method is None:
+            raise ValueError(f"Nieznana metoda: {request['method']}")
+        return method(request.get("params") or {}, emit)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="rpc", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale_socket(path):
+    """Usuń gniazdo po poprzednim procesie; błąd, jeśli inny daemon wciąż na nim nasłuchuje"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(RPC_CONNECT_TIMEOUT)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Inny download manager nasłuchuje już na {path}")
+
+
+class RpcClient:
+    """Klient RPC: call(method, **params) czeka na wynik, zdarzenia przekazuje do on_event"""
+
+    def __init__(self, path=RPC_SOCKET_PATH, timeout=RPC_CONNECT_TIMEOUT):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.sock.settimeout(None)
+        self.reader = self.sock.makefile('rb')
+        self.next_id = 0
+
+    def call(self, method, on_event=None, **params):
+        self.next_id += 1
+        request = {"id": self.next_id, "method": method, "params": params}
+        try:
+            self.sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+            while True:
+                line = self.reader.readline(RPC_MAX_LINE)
+                if not line:
+                    raise RpcError("Daemon zamknął połączenie")
+                message = json.loads(line)
+                if message.get("event") is not None:
+                    if on_event is not None:
+                        on_event(message)
+                    continue
+                if message.get("error"):
+                    error = message["error"]
+                    raise RpcError(error.get("message"), error.get("type"), error.get("kind"))
+                return message.get("result")
+        except OSError as e:
+            raise RpcError(f"Połączenie z daemonem zerwane: {e}") from e
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def connect(path=RPC_SOCKET_PATH):
+    """Klient połączony z działającym daemonem albo None (daemon nie nasłuchuje)"""
+    try:
+        return RpcClient(path)
+    except OSError:
+        return None
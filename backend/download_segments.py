@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# download_segments.py - Pobieranie segmentowe (HTTP Range) wspólne dla download.py i download_manager.py
+
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Liczba równoległych połączeń na plik (1 = zwykłe pobieranie jednym strumieniem).
+# Każdy segment to osobne połączenie do dostawcy, a limit DOWNLOAD_MAX_PER_HOST liczy
+# zadania, nie połączenia - dostawcy Xtream blokują konta za zbyt wiele połączeń naraz,
+# więc domyślnie wyłączone; włączenie (np. 4) tylko przy koncie z większym limitem.
+SEGMENT_CONNECTIONS = int(os.environ.get("DOWNLOAD_SEGMENTS", "1"))
+# Mniejsze pliki nie opłaca się dzielić
+SEGMENT_MIN_FILE_SIZE = int(os.environ.get("DOWNLOAD_SEGMENT_MIN_SIZE", str(32 * 1024 * 1024)))
+
+STATE_SUFFIX = ".segments.json"
+
+
+def parse_content_range(value):
+    """Zwróć całkowity rozmiar z nagłówka 'Content-Range: bytes 0-0/12345' (lub None)"""
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def plan_segments(total_size, connections):
+    """Podziel plik na ciągłe zakresy bajtów [start, end] (end włącznie)"""
+    connections = max(1, min(connections, total_size))
+    base = total_size // connections
+    segments = []
+    start = 0
+    for index in range(connections):
+        end = total_size - 1 if index == connections - 1 else start + base - 1
+        segments.append({"start": start, "end": end, "pos": start, "done": False})
+        start = end + 1
+    return segments
+
+
+def use_segments(total_size, accepts_ranges, connections=SEGMENT_CONNECTIONS):
+    """Czy plik warto pobierać segmentowo"""
+    return bool(accepts_ranges and total_size and connections > 1
+                and total_size >= SEGMENT_MIN_FILE_SIZE)
+
+
+class SegmentState:
+    """Stan pobierania segmentowego zapisywany obok pliku (<plik>.segments.json).
+
+    Ponowna próba (także po restarcie procesu) pobiera tylko brakujące
+    segmenty, a każdy segment kontynuuje od ostatnio zapisanej pozycji.
+    """
+
+    def __init__(self, output_path, url, total_size, segments, validator=None):
+        self.output_path = output_path
+        self.state_path = output_path + STATE_SUFFIX
+        self.url = url
+        self.total_size = total_size
+        self.segments = segments
+        self.validator = validator
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load_or_create(cls, output_path, url, total_size, connections=SEGMENT_CONNECTIONS, validator=None):
+        state_path = output_path + STATE_SUFFIX
+        if os.path.exists(state_path) and os.path.exists(output_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Stan jest ważny tylko dla tego samego pliku zdalnego (rozmiar i ETag/Last-Modified)
+                if data.get("total_size") == total_size and data.get("segments") \
+                        and data.get("validator") == validator:
+                    return cls(output_path, url, total_size, data["segments"], validator)
+            except (OSError, ValueError):
+                pass
+
+        state = cls(output_path, url, total_size, plan_segments(total_size, connections), validator)
+        preallocate(output_path, total_size)
+        state.save()
+        return state
+
+    def missing(self):
+        with self.lock:
+            return [segment for segment in self.segments if not segment["done"]]
+
+    def bytes_done(self):
+        with self.lock:
+            return sum(segment["pos"] - segment["start"] for segment in self.segments)
+
+    def save(self):
+        with self.lock:
+            data = {"url": self.url, "total_size": self.total_size, "validator": self.validator,
+                    "segments": self.segments}
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+
+    def remove(self):
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+
+def preallocate(path, size):
+    """Utwórz plik docelowy o pełnym rozmiarze, aby segmenty mogły pisać pod swoje offsety"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'ab') as f:
+        f.truncate(size)
+
+
+def run_segments(state, fetch_segment, connections=SEGMENT_CONNECTIONS, on_data=None, on_tick=None):
+    """Pobierz brakujące segmenty równolegle.
+
+    fetch_segment(segment, write) pobiera zakres od segment["pos"] do
+    segment["end"] i przekazuje kolejne porcje danych do write(data).
+    on_data(count) jest wołane po każdym zapisie (z wątków segmentów),
+    a on_tick() mniej więcej co sekundę w wątku wywołującym - tam można
+    bezpiecznie zapisywać postęp do bazy.
+    Zwraca listę wyjątków z nieudanych segmentów (pusta = sukces).
+    """
+    fd = os.open(state.output_path, os.O_WRONLY)
+
+    def worker(segment):
+        def write(data):
+            with state.lock:
+                remaining = segment["end"] + 1 - segment["pos"]
+                if len(data) > remaining:
+                    raise IOError("Serwer zwrócił więcej danych niż zakres segmentu")
+                offset = segment["pos"]
+            os.pwrite(fd, data, offset)
+            with state.lock:
+                segment["pos"] += len(data)
+            if on_data is not None:
+                on_data(len(data))
+
+        try:
+            fetch_segment(segment, write)
+            with state.lock:
+                if segment["pos"] != segment["end"] + 1:
+                    raise IOError(f"Niekompletny segment {segment['start']}-{segment['end']}")
+                segment["done"] = True
+            return None
+        except Exception as e:
+            return e
+        finally:
+            state.save()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+            futures = [executor.submit(worker, segment) for segment in state.missing()]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=1.0)
+                if on_tick is not None:
+                    on_tick()
+            errors = [f.result() for f in futures if f.result() is not None]
+    finally:
+        os.close(fd)
+
+    if not errors:
+        state.remove()
+    return errors
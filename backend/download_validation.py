@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# download_validation.py - Weryfikacja pobieranego strumienia w locie: sygnatura formatu, suma kontrolna, rozmiar
+
+import os
+import zlib
+
+# Odrzucaj odpowiedzi, które zamiast wideo są tekstem (strona błędu, JSON z API)
+VALIDATE_CONTENT = os.environ.get("DOWNLOAD_VALIDATE_CONTENT", "1") == "1"
+# Ile początkowych bajtów potrzeba do rozpoznania formatu (MPEG-TS: 3 pakiety po 188 B)
+SNIFF_BYTES = 564
+# Ile znaków odpowiedzi tekstowej pokazać w komunikacie błędu
+PREVIEW_LENGTH = 200
+
+TS_PACKET_SIZE = 188
+MP4_BOX_TYPES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'styp')
+TEXT_PREFIXES = (b'<', b'{', b'[', b'#EXTM3U')
+
+
+class InvalidContentError(Exception):
+    """Pobierane dane nie są plikiem wideo albo nie zgadza się ich rozmiar"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        # Strona błędu zwykle wróci przy ponowieniu, urwany plik można dokończyć
+        self.retryable = retryable
+
+
+class PlaylistResponse(InvalidContentError):
+    """Serwer zwrócił playlistę HLS (#EXTM3U) - plik trzeba pobrać segmentami (download_hls)"""
+
+
+def sniff_container(head):
+    """Rozpoznaj format po pierwszych bajtach: 'mkv', 'mp4', 'ts', 'avi' albo None"""
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'mkv'  # EBML (Matroska/WebM)
+    if len(head) >= 8 and head[4:8] in MP4_BOX_TYPES:
+        return 'mp4'
+    if head[:1] == b'\x47' and all(head[i:i + 1] == b'\x47'
+                                   for i in range(TS_PACKET_SIZE, min(len(head), SNIFF_BYTES), TS_PACKET_SIZE)):
+        return 'ts'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'avi'
+    return None
+
+
+def looks_like_playlist(head):
+    return head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U')
+
+
+def looks_like_text(head):
+    """Odpowiedź wygląda na HTML/JSON/playlistę zamiast danych binarnych"""
+    stripped = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if stripped.startswith(TEXT_PREFIXES):
+        return True
+    return bool(stripped) and b'\x00' not in stripped and \
+        sum(32 <= byte < 127 or byte in (9, 10, 13) for byte in stripped) >= len(stripped) * 0.95
+
+
+def check_head(head):
+    """Sprawdź początek pliku; zwraca nazwę formatu ('unknown' dla nierozpoznanych danych binarnych)"""
+    container = sniff_container(head)
+    if container:
+        return container
+    if VALIDATE_CONTENT and looks_like_playlist(head):
+        raise PlaylistResponse("Serwer zwrócił playlistę HLS zamiast pliku")
+    if VALIDATE_CONTENT and looks_like_text(head):
+        preview = head[:PREVIEW_LENGTH].decode('utf-8', 'replace').strip()
+        raise InvalidContentError(f"Serwer zwrócił tekst zamiast wideo: {preview}")
+    return 'unknown'
+
+
+class StreamValidator:
+    """Weryfikacja danych w trakcie pobierania jednym strumieniem.
+
+    feed() dostaje każdą porcję przed zapisem na dysk: początek pliku jest
+    sprawdzany po pierwszych SNIFF_BYTES bajtach (strona błędu nie trafia
+    na dysk), a CRC32 i licznik bajtów liczone są na bieżąco, więc
+    ukończony plik nie musi być czytany ponownie. CRC32 da się kontynuować
+    po wznowieniu - wystarczy zapisać wartość razem z punktem kontrolnym.
+    """
+
+    def __init__(self, expected_size=None, offset=0, checksum=None, enabled=VALIDATE_CONTENT):
+        self.expected_size = expected_size or None
+        self.position = offset
+        # Wznowienie bez zapisanej sumy - CRC całego pliku jest nieznane
+        self.crc = 0 if offset == 0 else checksum
+        self.container = None
+        self.head = bytearray() if enabled and offset == 0 else None
+
+    def feed(self, data):
+        if self.head is not None:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.check_head()
+        self.position += len(data)
+        if self.expected_size and self.position > self.expected_size:
+            raise InvalidContentError(f"Serwer wysłał więcej danych niż zapowiedział ({self.expected_size} B)")
+        if self.crc is not None:
+            self.crc = zlib.crc32(data, self.crc)
+
+    def check_head(self):
+        self.container = check_head(bytes(self.head))
+        self.head = None
+
+    @property
+    def checksum(self):
+        return None if self.crc is None else f"{self.crc:08x}"
+
+    def finish(self):
+        """Końcowa kontrola rozmiaru; zwraca podsumowanie (format, rozmiar, crc32)"""
+        if self.head is not None:
+            self.check_head()
+        if self.expected_size and self.position != self.expected_size:
+            raise InvalidContentError(f"Niepełny plik: {self.position} z {self.expected_size} B", retryable=True)
+        return {"container": self.container, "size": self.position, "crc32": self.checksum}
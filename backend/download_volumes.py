@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# download_volumes.py - Wolumeny docelowe: wolne miejsce (statvfs z pamięcią podręczną) i rezerwacje zadań w toku
+#
+# Filmy i seriale trafiają zwykle na osobne dyski macierzy (/downloads/movies, /downloads/series).
+# Wolumen to urządzenie (st_dev) najbliższego istniejącego katalogu ścieżki docelowej - limit
+# równoległych zadań na wolumen liczy download_manager (HostSlots), tu jest kontrola miejsca.
+
+import errno
+import os
+import threading
+import time
+
+from download_engines import DownloadError
+
+# Ile zadań naraz może pisać na jeden wolumen (zadania na różnych dyskach idą równolegle)
+MAX_JOBS_PER_VOLUME = int(os.environ.get("DOWNLOAD_MAX_PER_VOLUME", "2"))
+# Zapas wolnego miejsca, którego pobieranie nie zajmie [B]
+MIN_FREE_SPACE = int(os.environ.get("DOWNLOAD_MIN_FREE_SPACE", str(1024 * 1024 * 1024)))
+# Jak długo wynik statvfs jest aktualny [s] - przy intake co pół sekundy nie pytamy dysku za każdym razem
+STATVFS_CACHE_TTL = 5.0
+# Po jakim czasie zadanie odłożone z braku miejsca wraca do kolejki [s]
+NO_SPACE_RETRY_DELAY = float(os.environ.get("DOWNLOAD_NO_SPACE_RETRY_DELAY", "300"))
+
+
+class InsufficientSpace(DownloadError):
+    """Za mało miejsca na wolumenie docelowym - zadanie czeka, nie zużywa prób"""
+
+    def __init__(self, message):
+        super().__init__(message, 'disk')
+
+
+def is_no_space(error):
+    """Brak miejsca wykryty przed startem albo ENOSPC w trakcie zapisu"""
+    return isinstance(error, InsufficientSpace) or (isinstance(error, OSError) and error.errno == errno.ENOSPC)
+
+
+def existing_parent(path):
+    """Najbliższy istniejący katalog ścieżki (plik i jego katalogi mogą jeszcze nie istnieć)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory
+
+
+def mount_point(directory):
+    """Punkt montowania katalogu - do czytelnych nazw wolumenów w statusie i metrykach"""
+    device = os.stat(directory).st_dev
+    while True:
+        parent = os.path.dirname(directory)
+        if parent == directory or os.stat(parent).st_dev != device:
+            return directory
+        directory = parent
+
+
+def space_needed(path, total_size):
+    """Ile bajtów pliku brakuje na dysku (0 przy nieznanym rozmiarze; prealokowany plik już je zajmuje)"""
+    if not total_size:
+        return 0
+    try:
+        return max(0, total_size - os.path.getsize(path))
+    except OSError:
+        return total_size
+
+
+def format_size(size):
+    if size >= 1024 * 1024 * 1024:
+        return f"{size / 1024 / 1024 / 1024:.1f} GB"
+    return f"{size / 1024 / 1024:.0f} MB"
+
+
+class VolumeSpace:
+    """Wolne miejsce wolumenów pomniejszone o rezerwacje pobrań w toku.
+
+    Rezerwacja to brakująca część pliku (rozmiar zdalny minus to, co już
+    jest na dysku) i maleje o bajty odebrane od startu, bo te są już
+    widoczne w statvfs. Wynik statvfs jest trzymany STATVFS_CACHE_TTL
+    sekund - rozjazd w tym czasie pokrywa zapas MIN_FREE_SPACE.
+    """
+
+    def __init__(self, min_free=MIN_FREE_SPACE, cache_ttl=STATVFS_CACHE_TTL):
+        self.min_free = min_free
+        self.cache_ttl = cache_ttl
+        self.lock = threading.Lock()
+        # urządzenie -> {"mount", "free", "checked_at"}
+        self.volumes = {}
+        # id rezerwacji -> (urządzenie, bajty, postęp transferu)
+        self.reservations = {}
+        self.next_reservation = 0
+
+    def volume(self, path):
+        """Identyfikator wolumenu ścieżki docelowej (st_dev)"""
+        return os.stat(existing_parent(path)).st_dev
+
+    def free_bytes(self, device, directory):
+        # Wołane pod blokadą
+        state = self.volumes.get(device)
+        now = time.monotonic()
+        if state is None or now - state["checked_at"] >= self.cache_ttl:
+            stats = os.statvfs(directory)
+            if state is None:
+                state = self.volumes[device] = {"mount": mount_point(directory)}
+            state.update(free=stats.f_bavail * stats.f_frsize, checked_at=now)
+        return state["free"]
+
+    def reserved_bytes(self, device):
+        # Wołane pod blokadą
+        return sum(max(0, size - (progress.received if progress is not None else 0))
+                   for volume, size, progress in self.reservations.values() if volume == device)
+
+    def available_bytes(self, device, directory):
+        # Wołane pod blokadą; None - brak statvfs (np. niektóre sieciowe systemy plików), nie blokuj pobierania
+        try:
+            free = self.free_bytes(device, directory)
+        except OSError:
+            return None
+        return free - self.reserved_bytes(device) - self.min_free
+
+    def has_space(self, path, needed=0):
+        """Czy na wolumenie ścieżki zmieści się needed bajtów (poza rezerwacjami i zapasem)"""
+        directory = existing_parent(path)
+        device = os.stat(directory).st_dev
+        with self.lock:
+            available = self.available_bytes(device, directory)
+        return available is None or available >= needed
+
+    def reserve(self, path, needed, progress=None):
+        """Zarezerwuj needed bajtów przed startem transferu; InsufficientSpace, gdy się nie mieszczą.
+
+        Zwraca id rezerwacji dla release(). Przy nieznanym rozmiarze (needed = 0)
+        sprawdzany jest tylko zapas MIN_FREE_SPACE.
+        """
+        directory = existing_parent(path)
+        device = os.stat(directory).st_dev
+        with self.lock:
+            available = self.available_bytes(device, directory)
+            if available is not None and available < needed:
+                raise InsufficientSpace(f"Za mało miejsca na {self.volumes[device]['mount']}: "
+                                        f"potrzeba {format_size(needed)}, dostępne {format_size(max(0, available))} "
+                                        f"(zapas {format_size(self.min_free)})")
+            self.next_reservation += 1
+            self.reservations[self.next_reservation] = (device, needed, progress)
+            return self.next_reservation
+
+    def release(self, reservation):
+        if reservation is None:
+            return
+        with self.lock:
+            reservation = self.reservations.pop(reservation, None)
+            if reservation is not None:
+                # Zapisane bajty są już w statvfs dopiero po odświeżeniu - odśwież przy następnym pytaniu
+                state = self.volumes.get(reservation[0])
+                if state is not None:
+                    state["checked_at"] = 0.0
+
+    def mount(self, device):
+        with self.lock:
+            state = self.volumes.get(device)
+            return state["mount"] if state is not None else str(device)
+
+    def snapshot(self, slots=None):
+        """Stan wolumenów według punktu montowania; slots - snapshot limitu zadań na wolumen (HostSlots)"""
+        slots = slots or {"active": {}, "deferred": {}}
+        with self.lock:
+            return {
+                state["mount"]: {
+                    "free_bytes": state["free"],
+                    "reserved_bytes": self.reserved_bytes(device),
+                    "active": slots["active"].get(device, 0),
+                    "deferred": slots["deferred"].get(device, 0),
+                }
+                for device, state in self.volumes.items()
+            }
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# download_writer.py - Zapis pobieranego strumienia na dysk: duże porcje, prealokacja, fsync co N bajtów
+
+import errno
+import json
+import os
+import time
+
+from download_segments import parse_content_range
+
+# Rozmiar porcji czytanej z sieci i zapisywanej jednym wywołaniem write()
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Rezerwuj miejsce na cały plik z góry (mniejsza fragmentacja na dyskach macierzy)
+DOWNLOAD_PREALLOCATE = os.environ.get("DOWNLOAD_PREALLOCATE", "1") == "1"
+# fdatasync co tyle bajtów (0 = zostaw zapis systemowi); ogranicza ilość brudnych
+# stron w pamięci przy wielu GB i wygładza zapis na wolnych dyskach
+DOWNLOAD_FSYNC_BYTES = int(os.environ.get("DOWNLOAD_FSYNC_BYTES", "0"))
+# Plik kontrolny wznawiania (<plik>.resume.json) i jak często go zapisywać
+CHECKPOINT_SUFFIX = ".resume.json"
+CHECKPOINT_INTERVAL = 2.0
+
+# Systemy plików bez fallocate (np. niektóre sieciowe) - prealokacja jest tylko optymalizacją
+FALLOCATE_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+
+
+def preallocate_space(fd, offset, length):
+    """Zarezerwuj bloki dla zakresu pliku; False, gdy system plików tego nie obsługuje.
+
+    Brak miejsca (ENOSPC) jest zgłaszany od razu - lepiej przed pobraniem
+    wielu GB niż w połowie.
+    """
+    if length <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, offset, length)
+        return True
+    except OSError as e:
+        if e.errno in FALLOCATE_UNSUPPORTED:
+            return False
+        raise
+
+
+def sync_file(fd):
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+class FileWriter:
+    """Sekwencyjny zapis strumienia od podanego offsetu.
+
+    Pisze bezpośrednio przez deskryptor (bez bufora Pythona), więc porcje
+    z bufora wielokrotnego użytku (memoryview) nie są kopiowane. Przy znanym
+    rozmiarze rezerwuje miejsce przez posix_fallocate, a przy zamknięciu
+    obcina plik do faktycznie zapisanych bajtów - rozmiar pliku nadal
+    odpowiada pobranym danym.
+    """
+
+    def __init__(self, path, offset=0, expected_size=None, preallocate=DOWNLOAD_PREALLOCATE,
+                 fsync_bytes=DOWNLOAD_FSYNC_BYTES):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o666)
+        self.position = offset
+        self.fsync_bytes = fsync_bytes
+        self.unsynced = 0
+        try:
+            # Jak open(..., 'wb') przy starcie od zera; przy wznawianiu odetnij niepewny ogon
+            os.ftruncate(self.fd, offset)
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            self.preallocated = bool(preallocate and expected_size and
+                                     preallocate_space(self.fd, offset, expected_size - offset))
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        self.position += len(data)
+        if self.fsync_bytes:
+            self.unsynced += len(data)
+            if self.unsynced >= self.fsync_bytes:
+                sync_file(self.fd)
+                self.unsynced = 0
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self.preallocated:
+                os.ftruncate(self.fd, self.position)
+            if self.fsync_bytes and self.unsynced:
+                sync_file(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def resume_validator(headers):
+    """Wartość dla If-Range: silny ETag, a bez niego Last-Modified (słabe ETagi są niedozwolone)"""
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def parse_range_start(value):
+    """Początek zakresu z nagłówka 'Content-Range: bytes 100-199/200' (lub None)"""
+    if not value or not value.startswith('bytes ') or '-' not in value:
+        return None
+    start = value[len('bytes '):].split('-', 1)[0].strip()
+    return int(start) if start.isdigit() else None
+
+
+class ResumeCheckpoint:
+    """Punkt wznowienia pobierania jednym strumieniem zapisywany obok pliku.
+
+    Trzyma liczbę bajtów na pewno zapisanych (przy prealokacji rozmiar
+    pliku tego nie mówi), CRC32 tych bajtów oraz ETag/Last-Modified, którym
+    serwer przez If-Range potwierdza, że to nadal ten sam plik. Dzięki temu
+    wznowienie działa także po restarcie procesu.
+    """
+
+    def __init__(self, output_path, url):
+        self.output_path = output_path
+        self.path = output_path + CHECKPOINT_SUFFIX
+        self.url = url
+        self.position = 0
+        self.validator = None
+        self.total_size = None
+        self.checksum = None
+        self.saved_at = 0.0
+
+    @classmethod
+    def load(cls, output_path, url):
+        checkpoint = cls(output_path, url)
+        try:
+            file_size = os.path.getsize(output_path)
+        except OSError:
+            return checkpoint
+        try:
+            with open(checkpoint.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("url") == url:
+            checkpoint.position = min(int(data.get("position", 0)), file_size)
+            checkpoint.validator = data.get("validator")
+            checkpoint.total_size = data.get("total_size")
+            checkpoint.checksum = data.get("crc32")
+        else:
+            # Częściowy plik bez punktu kontrolnego - wznów od jego rozmiaru (bez If-Range)
+            checkpoint.position = file_size
+        return checkpoint
+
+    def request_headers(self):
+        if not self.position:
+            return {}
+        headers = {'Range': f"bytes={self.position}-"}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        return headers
+
+    def accept(self, response):
+        """Ustal offset startowy z odpowiedzi: 206 od naszej pozycji = wznowienie, inaczej od zera"""
+        if self.position and response.status_code == 206 and \
+                parse_range_start(response.headers.get('content-range')) == self.position:
+            self.total_size = parse_content_range(response.headers.get('content-range'))
+        else:
+            self.position = 0
+            self.checksum = None
+            length = response.headers.get('content-length', '')
+            self.total_size = int(length) if length.isdigit() else None
+        self.validator = resume_validator(response.headers)
+        self.save(force=True)
+        return self.position
+
+    def reset(self):
+        self.position = 0
+        self.validator = None
+        self.total_size = None
+        self.checksum = None
+
+    def save(self, position=None, checksum=None, force=False):
+        if position is not None:
+            self.position = position
+            self.checksum = checksum
+        now = time.monotonic()
+        if not force and now - self.saved_at < CHECKPOINT_INTERVAL:
+            return
+        self.saved_at = now
+        data = {"url": self.url, "position": self.position, "validator": self.validator,
+                "total_size": self.total_size, "crc32": self.checksum}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
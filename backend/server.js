@@ -6,6 +6,7 @@ const fs = require('fs');
 const axios = require('axios');
 const cron = require('node-cron');
 const { spawn } = require('child_process');
+const net = require('net');
 
 const app = express();
 const PORT = 3001;
@@ -420,6 +421,59 @@ const activeDownloads = new Map();
 
 // --- Download Manager Process ---
 let downloadManagerProcess = null;
+// Gniazdo RPC daemona (download_rpc.py) - JSON, jedno żądanie/odpowiedź na linię
+const downloadRpcSocket = process.env.DOWNLOAD_RPC_SOCKET || path.resolve(configDir, 'download_manager.sock');
+
+// Pobranie pliku przez działający daemon, bez uruchamiania Pythona dla każdego pliku.
+// Gdy daemon nie nasłuchuje, błąd ma daemonUnavailable = true (wtedy zostaje spawn download_manager.py).
+function downloadViaDaemon(downloadUrl, outputPath, jobId) {
+    return new Promise((resolve, reject) => {
+        const socket = net.createConnection(downloadRpcSocket);
+        socket.setEncoding('utf8');
+        let connected = false;
+        let buffer = '';
+
+        socket.on('connect', () => {
+            connected = true;
+            // Usunięcie zadania zamyka połączenie - daemon przerywa wtedy transfer
+            activeDownloads.set(jobId, { kill: () => socket.destroy() });
+            socket.write(JSON.stringify({ id: jobId, method: 'download', params: { url: downloadUrl, path: outputPath } }) + '\n');
+        });
+
+        socket.on('data', (data) => {
+            buffer += data;
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline);
+                buffer = buffer.slice(newline + 1);
+                if (!line.trim()) continue;
+
+                const message = JSON.parse(line);
+                if (message.event === 'progress') {
+                    if (message.progress.percent !== null) {
+                        dbRun('UPDATE downloads SET progress = ? WHERE id = ?', [message.progress.percent, jobId])
+                            .catch((err) => console.error(`Błąd zapisu postępu ${jobId}:`, err.message));
+                    }
+                    continue;
+                }
+
+                socket.end();
+                if (message.error) {
+                    reject(new Error(message.error.message));
+                } else {
+                    resolve(message.result);
+                }
+            }
+        });
+
+        socket.on('error', (error) => {
+            error.daemonUnavailable = !connected;
+            reject(error);
+        });
+
+        socket.on('close', () => reject(new Error('Połączenie z download managerem zostało zerwane')));
+    });
+}
 
 // NOWA FUNKCJA - Wklej ją tutaj
 async function sendDiscordNotification(message) {
@@ -1852,7 +1906,7 @@ app.get('/api/downloads/status', async (req, res) => {
                     SELECT timestamp, level, message 
                     FROM download_logs 
                     WHERE download_id = ? 
-                    ORDER BY timestamp DESC 
+                    ORDER BY id DESC 
                     LIMIT 10
                 `, [download.id]);
                 
@@ -1931,7 +1985,7 @@ app.get('/api/downloads/statistics', async (req, res) => {
             FROM download_logs dl
             LEFT JOIN downloads d ON dl.download_id = d.id
             WHERE d.archived = 0 OR d.archived IS NULL
-            ORDER BY dl.timestamp DESC 
+            ORDER BY dl.id DESC 
             LIMIT 20
         `);
         
@@ -1978,7 +2032,19 @@ app.post('/api/downloads/start', async (req, res) => {
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         `);
         
+        // Odcinki już czekające w kolejce nie są dodawane drugi raz; ukończone wcześniej
+        // trafiają do kolejki, ale daemon podpina gotowy plik zamiast pobierać go od nowa
+        const queuedEpisodes = new Set(downloadQueue
+            .filter(job => job.stream_type === stream_type)
+            .map(job => String(job.episode_id)));
+        const insertedIds = [];
+        
         for (const episode of episodes) {
+            if (queuedEpisodes.has(String(episode.id))) {
+                continue;
+            }
+            queuedEpisodes.add(String(episode.id));
+            
             // Wygeneruj prawidłowy URL już tutaj
             let downloadUrl;
             if (stream_type === 'movie') {
@@ -1987,7 +2053,7 @@ app.post('/api/downloads/start', async (req, res) => {
                 downloadUrl = `${playlistData.server_url}/series/${playlistData.username}/${playlistData.password}/${episode.id}.mkv`;
             }
             
-            await stmtRun(stmt, [
+            const result = await stmtRun(stmt, [
                 stream_id, 
                 stream_type, 
                 playlistData.id || playlist_id,
@@ -1997,21 +2063,25 @@ app.post('/api/downloads/start', async (req, res) => {
                 'queued',
                 downloadUrl
             ]);
+            if (result.changes > 0) {
+                insertedIds.push(result.lastID);
+            }
         }
         
         stmt.finalize();
         await dbRun('COMMIT');
         
-        const jobIds = episodes.map(ep => ep.id);
-        const newJobs = await dbAll(`
+        // Tylko nowe wiersze - wcześniejsze (także ukończone) zadania tego serialu nie wracają do kolejki
+        const newJobs = insertedIds.length === 0 ? [] : await dbAll(`
             SELECT * FROM downloads 
-            WHERE episode_id IN (${jobIds.map(() => '?').join(',')}) 
-            AND stream_id = ?
-        `, [...jobIds, stream_id]);
+            WHERE id IN (${insertedIds.map(() => '?').join(',')})
+        `, insertedIds);
         
         downloadQueue.push(...newJobs);
 
-        res.status(202).json({ message: `Dodano ${episodes.length} zadań do kolejki pobierania.` });
+        const skipped = episodes.length - newJobs.length;
+        res.status(202).json({ message: `Dodano ${newJobs.length} zadań do kolejki pobierania.` +
+            (skipped > 0 ? ` Pominięto ${skipped} już oczekujących w kolejce.` : '') });
         
         if (!isProcessing) {
             processDownloadQueue();
@@ -3305,57 +3375,67 @@ async function processDownloadQueue() {
             }
         }
 
-        // Użyj download_manager.py do pobrania
-        await new Promise((resolve, reject) => {
-            const pythonProcess = spawn('python3', ['download_manager.py', downloadUrl, plexCompatiblePath]);
-            activeDownloads.set(downloadJob.id, pythonProcess);
+        // Pobierz przez działający daemon (RPC); bez niego - osobnym procesem download_manager.py
+        let downloadedByDaemon = false;
+        try {
+            await downloadViaDaemon(downloadUrl, plexCompatiblePath, downloadJob.id);
+            downloadedByDaemon = true;
+        } catch (rpcError) {
+            if (!rpcError.daemonUnavailable) throw rpcError;
+        }
 
-            let stdoutData = '';
-            let stderrData = '';
+        if (!downloadedByDaemon) {
+            await new Promise((resolve, reject) => {
+                const pythonProcess = spawn('python3', ['download_manager.py', downloadUrl, plexCompatiblePath]);
+                activeDownloads.set(downloadJob.id, pythonProcess);
 
-            pythonProcess.stdout.on('data', (data) => {
-                stdoutData += data.toString();
-                console.log(`[Download ${downloadJob.id}] ${data.toString().trim()}`);
-            });
+                let stdoutData = '';
+                let stderrData = '';
 
-            pythonProcess.stderr.on('data', (data) => {
-                stderrData += data.toString();
-                console.error(`[Download ${downloadJob.id} Error] ${data.toString().trim()}`);
-            });
+                pythonProcess.stdout.on('data', (data) => {
+                    stdoutData += data.toString();
+                    console.log(`[Download ${downloadJob.id}] ${data.toString().trim()}`);
+                });
+
+                pythonProcess.stderr.on('data', (data) => {
+                    stderrData += data.toString();
+                    console.error(`[Download ${downloadJob.id} Error] ${data.toString().trim()}`);
+                });
 
-            pythonProcess.on('close', (code) => {
-                console.log(`Download ${downloadJob.id} finished with code: ${code}`);
+                pythonProcess.on('close', (code) => {
+                    console.log(`Download ${downloadJob.id} finished with code: ${code}`);
                 
-                if (code === 0 || stdoutData.includes('SUCCESS')) {
-                    resolve();
-                } else {
-                    let errorMessage = `Download failed with code ${code}`;
+                    if (code === 0 || stdoutData.includes('SUCCESS')) {
+                        resolve();
+                    } else {
+                        let errorMessage = `Download failed with code ${code}`;
                     
-                    if (code === 1) {
-                        if (stderrData.includes('curl code 22')) {
-                            errorMessage += ` (HTTP Error - probably 404 or 403)`;
-                        } else if (stderrData.includes('curl code 6')) {
-                            errorMessage += ` (DNS resolution failed)`;
-                        } else if (stderrData.includes('curl code 7')) {
-                            errorMessage += ` (Connection failed)`;
-                        } else if (stderrData.includes('curl code 28')) {
-                            errorMessage += ` (Timeout)`;
+                        if (code === 1) {
+                            if (stderrData.includes('curl code 22')) {
+                                errorMessage += ` (HTTP Error - probably 404 or 403)`;
+                            } else if (stderrData.includes('curl code 6')) {
+                                errorMessage += ` (DNS resolution failed)`;
+                            } else if (stderrData.includes('curl code 7')) {
+                                errorMessage += ` (Connection failed)`;
+                            } else if (stderrData.includes('curl code 28')) {
+                                errorMessage += ` (Timeout)`;
+                            }
                         }
-                    }
                     
-                    console.error(`❌ ${errorMessage}`);
-                    console.error(`📋 STDERR: ${stderrData}`);
-                    console.error(`📋 STDOUT: ${stdoutData}`);
+                        console.error(`❌ ${errorMessage}`);
+                        console.error(`📋 STDERR: ${stderrData}`);
+                        console.error(`📋 STDOUT: ${stdoutData}`);
                     
-                    reject(new Error(`${errorMessage}. Details: ${stderrData}`));
-                }
-            });
+                        reject(new Error(`${errorMessage}. Details: ${stderrData}`));
+                    }
+                });
 
-            pythonProcess.on('error', (error) => {
-                console.error(`Download ${downloadJob.id} process error:`, error);
-                reject(error);
+                pythonProcess.on('error', (error) => {
+                    console.error(`Download ${downloadJob.id} process error:`, error);
+                    reject(error);
+                });
             });
-        });
+        }
 
         // Oznacz jako ukończone I automatycznie archiwizuj
         await dbRun('UPDATE downloads SET status = ?, worker_status = ?, progress = 100, archived = 1 WHERE id = ?', 